@@ -0,0 +1,192 @@
+#!/usr/bin/python
+#
+# Copyright 2017 IBM Corp.
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+DOCUMENTATION = '''
+---
+module: ceph_osd_activate
+short_description: Activate the prepared OSDs of a host concurrently.
+description:
+  - Runs ceph-disk activate for the OSD data partition of every device,
+    with at most I(jobs) activations running at the same time.
+  - A device that is a partition is activated as is.  For a whole disk
+    its first partition, the data partition created by ceph-disk prepare,
+    is activated.  This covers the raw multi journal, journal collocation
+    and dmcrypt scenarios.
+  - The module does not fail when an activation fails, the result of
+    every device is returned with its return code, output and duration.
+options:
+  devices:
+    description:
+      - The OSD devices, disks or partitions, e.g. /dev/sdb.
+    required: true
+  activate_disks:
+    description:
+      - Whether whole disks are activated.  When false only the devices
+        which are partitions are activated.
+    default: true
+  dmcrypt:
+    description:
+      - Whether the data partitions are encrypted.
+    default: false
+  jobs:
+    description:
+      - The maximum number of concurrent activations.
+    default: 8
+'''
+
+EXAMPLES = '''
+- ceph_osd_activate:
+    devices:
+      - /dev/sdb
+      - /dev/nvme0n1
+    dmcrypt: false
+    jobs: 8
+  register: activate_osds
+'''
+
+import os
+import subprocess
+import threading
+import time
+
+SYS_BLOCK = '/sys/class/block'
+DEV_DIR = '/dev'
+
+
+def _sys_name(device):
+    # sysfs names use '!' for the '/' of device names like cciss/c0d0
+    device = os.path.realpath(device)
+    return os.path.relpath(device, DEV_DIR).replace('/', '!')
+
+
+def _is_partition(sys_name):
+    return os.path.isfile(os.path.join(SYS_BLOCK, sys_name, 'partition'))
+
+
+def _first_partition(sys_name):
+    # Return the device of partition number 1 of a disk, or None
+    sys_dir = os.path.join(SYS_BLOCK, sys_name)
+    for entry in sorted(os.listdir(sys_dir)):
+        number_file = os.path.join(sys_dir, entry, 'partition')
+        if os.path.isfile(number_file):
+            with open(number_file) as stream:
+                if stream.read().strip() == '1':
+                    return os.path.join(DEV_DIR, entry.replace('!', '/'))
+    return None
+
+
+def _data_partition(device):
+    # Return the data partition of a device and whether it is a disk
+    sys_name = _sys_name(device)
+    if not os.path.isdir(os.path.join(SYS_BLOCK, sys_name)):
+        return None, False
+    if _is_partition(sys_name):
+        return device, False
+    return _first_partition(sys_name), True
+
+
+def _activate(command):
+    start = time.time()
+    try:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+        out, err = process.communicate()
+        rc = process.returncode
+    except OSError as ex:
+        out, err, rc = '', str(ex), 1
+    return dict(rc=rc, stdout=out, stderr=err,
+                duration=round(time.time() - start, 3))
+
+
+def activate_all(commands, jobs):
+    # Run the commands of the {device: command} dict with at most jobs
+    # running at the same time and return the {device: result} dict.
+    results = {}
+    pending = list(commands.items())
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if not pending:
+                    return
+                device, command = pending.pop(0)
+            result = _activate(command)
+            with lock:
+                results[device] = result
+
+    threads = [threading.Thread(target=worker)
+               for _ in range(min(jobs, len(pending)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def main():
+    module = AnsibleModule(  # noqa
+        argument_spec=dict(
+            devices=dict(required=True, type='list'),
+            activate_disks=dict(default=True, type='bool'),
+            dmcrypt=dict(default=False, type='bool'),
+            jobs=dict(default=8, type='int')),
+        supports_check_mode=True)
+
+    devices = module.params['devices']
+    jobs = max(1, module.params['jobs'])
+    command = ['ceph-disk', 'activate']
+    if module.params['dmcrypt']:
+        command.append('--dmcrypt')
+
+    results = []
+    commands = {}
+    for device in devices:
+        partition, is_disk = _data_partition(device)
+        result = dict(device=device, partition=partition, cmd=None)
+        results.append(result)
+        if is_disk and not module.params['activate_disks']:
+            result['skipped'] = True
+        elif partition is None:
+            result.update(rc=1, stdout='', duration=0.0,
+                          stderr='No OSD data partition found on %s' %
+                          device)
+        else:
+            result['cmd'] = command + [partition]
+            if not module.check_mode:
+                commands[device] = result['cmd']
+
+    start = time.time()
+    activated = activate_all(commands, jobs)
+    for result in results:
+        result.update(activated.get(result['device'], {}))
+    failed = [result['device'] for result in results
+              if result.get('rc', 0) != 0]
+    # Like the ceph-disk activate commands it replaces, the activation does
+    # not report changes.
+    module.exit_json(changed=False,
+                     results=results,
+                     failed_devices=failed,
+                     jobs=jobs,
+                     duration=round(time.time() - start, 3))
+
+# import module snippets
+from ansible.module_utils.basic import *  # noqa
+
+if __name__ == '__main__':
+    main()
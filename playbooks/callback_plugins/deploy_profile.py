@@ -0,0 +1,149 @@
+# Copyright 2017 IBM Corp.
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Record the duration of every task and of every host of a playbook run.
+# The report is written as JSON to <playbook name>.json in the directory
+# named by DEPLOY_PROFILE_DIR when the playbook ends, with the tasks and
+# the hosts sorted from the slowest.  The duration of a host in a task is
+# the time from the start of the task to the result of the host.
+
+import json
+import os
+import os.path
+import time
+
+try:
+    from ansible.plugins.callback import CallbackBase
+except ImportError:
+    CallbackBase = object
+
+PROFILE_DIR_ENV = 'DEPLOY_PROFILE_DIR'
+# The number of slowest tasks and hosts listed first in the report
+SLOWEST_COUNT = 10
+
+
+class CallbackModule(CallbackBase):
+
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'aggregate'
+    CALLBACK_NAME = 'deploy_profile'
+    CALLBACK_NEEDS_WHITELIST = True
+
+    def __init__(self, *args, **kwargs):
+        super(CallbackModule, self).__init__(*args, **kwargs)
+        self.profile_dir = os.environ.get(PROFILE_DIR_ENV)
+        self.playbook = None
+        self.start = time.time()
+        self.tasks = []
+        self.current = None
+
+    def _end_task(self, now):
+        if self.current:
+            self.current['seconds'] = round(now - self.current['start'], 3)
+            self.current = None
+
+    def _start_task(self, task):
+        now = time.time()
+        self._end_task(now)
+        self.current = {'name': task.get_name().strip(),
+                        'start': now,
+                        'hosts': {}}
+        self.tasks.append(self.current)
+
+    def _host_result(self, result, status):
+        if not self.current:
+            return
+        host = result._host.get_name()
+        seconds = round(time.time() - self.current['start'], 3)
+        # Loops report one result per host
+        previous = self.current['hosts'].get(host)
+        if previous and previous['status'] == 'failed':
+            status = 'failed'
+        self.current['hosts'][host] = {'seconds': seconds, 'status': status}
+
+    def v2_playbook_on_start(self, playbook):
+        self.playbook = os.path.basename(playbook._file_name)
+        self.start = time.time()
+
+    def v2_playbook_on_task_start(self, task, is_conditional):
+        self._start_task(task)
+
+    def v2_playbook_on_handler_task_start(self, task):
+        self._start_task(task)
+
+    def v2_runner_on_ok(self, result):
+        self._host_result(result, 'ok')
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        self._host_result(result, 'ok' if ignore_errors else 'failed')
+
+    def v2_runner_on_skipped(self, result):
+        self._host_result(result, 'skipped')
+
+    def v2_runner_on_unreachable(self, result):
+        self._host_result(result, 'unreachable')
+
+    def v2_playbook_on_stats(self, stats):
+        now = time.time()
+        self._end_task(now)
+        if not self.profile_dir:
+            return
+        report = make_report(self.playbook, now - self.start, self.tasks)
+        if not os.path.isdir(self.profile_dir):
+            os.makedirs(self.profile_dir)
+        name = os.path.splitext(self.playbook or 'playbook')[0]
+        file_name = os.path.join(self.profile_dir, name + '.json')
+        with open(file_name, 'w') as stream:
+            json.dump(report, stream, indent=4, separators=(',', ': '),
+                      sort_keys=True)
+            stream.write('\n')
+
+
+def make_report(playbook, seconds, tasks):
+    # tasks is the list of {'name', 'seconds', 'hosts'} of the run in
+    # order, hosts maps every host name to its {'seconds', 'status'}.
+    hosts = {}
+    task_list = []
+    for number, task in enumerate(tasks):
+        task_hosts = task['hosts']
+        task_list.append({'number': number + 1,
+                          'name': task['name'],
+                          'seconds': task.get('seconds', 0),
+                          'hosts': task_hosts})
+        for host, result in task_hosts.items():
+            totals = hosts.setdefault(host, {'host': host, 'seconds': 0,
+                                             'tasks': 0, 'failed': 0})
+            totals['seconds'] = round(totals['seconds'] +
+                                      result['seconds'], 3)
+            totals['tasks'] += 1
+            if result['status'] in ('failed', 'unreachable'):
+                totals['failed'] += 1
+
+    slowest_tasks = sorted(task_list, key=lambda t: -t['seconds'])
+    slowest_hosts = sorted(hosts.values(), key=lambda h: -h['seconds'])
+    for task in slowest_tasks:
+        if task['hosts']:
+            slowest = max(task['hosts'].items(),
+                          key=lambda item: item[1]['seconds'])
+            task['slowest_host'] = slowest[0]
+    return {'playbook': playbook,
+            'seconds': round(seconds, 3),
+            'slowest_tasks': [{'number': t['number'], 'name': t['name'],
+                               'seconds': t['seconds']}
+                              for t in slowest_tasks[:SLOWEST_COUNT]],
+            'slowest_hosts': slowest_hosts[:SLOWEST_COUNT],
+            'tasks': slowest_tasks,
+            'hosts': slowest_hosts}
@@ -0,0 +1,93 @@
+# Copyright 2017 IBM Corp.
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+
+def device_names(devices):
+    # Journal devices in the inventory are either a device name or a dict
+    # with the device name and an optional weight or device class.
+    return [device['device'] if isinstance(device, dict) else device
+            for device in devices]
+
+
+def _disk_name(device):
+    # The setup script zaps devices by their name without /dev/
+    return device.split('/dev/', 1)[-1]
+
+
+def _package_versions(package_lines):
+    # Parse the "name version" lines of dpkg-query -W.  A package which
+    # is known but not installed has no version.
+    versions = {}
+    for line in package_lines or []:
+        fields = line.split()
+        if len(fields) == 2:
+            versions[fields[0]] = fields[1]
+    return versions
+
+
+def _zapped_disks(zap_lines):
+    # Parse the "disk rc seconds" lines reported by the setup script and
+    # return the disks that were zapped successfully
+    zapped = set()
+    for line in zap_lines or []:
+        fields = line.split()
+        if len(fields) == 3 and fields[1] == '0' and fields[2].isdigit():
+            zapped.add(fields[0])
+    return sorted(zapped)
+
+
+def storage_fingerprint(osd_devices, journal_devices, package_lines,
+                        zap_lines):
+    # The storage state observed on a host after its setup, as canonical
+    # JSON: the devices, the installed versions of the storage packages
+    # read with dpkg-query and the disks the setup script zapped.
+    return json.dumps({'osd_devices': device_names(osd_devices or []),
+                       'journal_devices': device_names(journal_devices or []),
+                       'packages': _package_versions(package_lines),
+                       'zapped': _zapped_disks(zap_lines)}, sort_keys=True)
+
+
+def storage_ready(fingerprint, osd_devices, journal_devices, packages,
+                  package_lines):
+    # Whether a stored fingerprint shows that the storage setup of the
+    # requested devices completed and that the requested packages are
+    # still installed at the versions the setup installed.
+    try:
+        stored = json.loads(fingerprint)
+    except ValueError:
+        return False
+    if not isinstance(stored, dict):
+        return False
+    osd_devices = device_names(osd_devices or [])
+    journal_devices = device_names(journal_devices or [])
+    versions = _package_versions(package_lines)
+    zapped = set(stored.get('zapped') or [])
+    return (stored.get('osd_devices') == osd_devices and
+            stored.get('journal_devices') == journal_devices and
+            stored.get('packages') == versions and
+            all(package in versions for package in packages or []) and
+            all(_disk_name(device) in zapped
+                for device in osd_devices + journal_devices))
+
+
+class FilterModule(object):
+
+    def filters(self):
+        return {'device_names': device_names,
+                'storage_fingerprint': storage_fingerprint,
+                'storage_ready': storage_ready}
@@ -0,0 +1,95 @@
+#!/usr/bin/python
+#
+# Copyright 2017 IBM Corp.
+#
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+DOCUMENTATION = '''
+---
+module: ceph_device_check
+short_description: Verify that block devices are present on a host.
+description:
+  - Runs lsblk once and checks every requested device against its output.
+    A device is found only when its name matches a block device name
+    exactly, so a disk such as vdd is neither matched by its partitions
+    (vdd1) nor by devices with a longer name (vdda).
+  - Fails with the complete list of missing devices.
+options:
+  devices:
+    description:
+      - The device paths to check, e.g. /dev/sdb.
+    required: true
+'''
+
+EXAMPLES = '''
+- ceph_device_check:
+    devices:
+      - /dev/sdb
+      - /dev/nvme0n1
+'''
+
+import json
+
+DEV_PREFIX = '/dev/'
+
+
+def _device_names(block_devices):
+    # Walk the lsblk device tree and yield every device name
+    for device in block_devices:
+        yield device['name']
+        for name in _device_names(device.get('children', [])):
+            yield name
+
+
+def _strip_dev(device):
+    if device.startswith(DEV_PREFIX):
+        return device[len(DEV_PREFIX):]
+    return device
+
+
+def _find_missing(devices, block_devices):
+    # Return the devices whose name is not in the lsblk device tree
+    names = set(_device_names(block_devices))
+    return [device for device in devices if _strip_dev(device) not in names]
+
+
+def main():
+    module = AnsibleModule(  # noqa
+        argument_spec=dict(
+            devices=dict(required=True, type='list')),
+        supports_check_mode=True)
+
+    devices = module.params['devices']
+    rc, out, err = module.run_command(['lsblk', '--json', '--output',
+                                       'NAME'])
+    if rc != 0:
+        module.fail_json(msg='lsblk failed: %s' % err, rc=rc)
+
+    missing = _find_missing(devices,
+                            json.loads(out).get('blockdevices', []))
+    result = dict(changed=False,
+                  devices=devices,
+                  missing=missing)
+    if missing:
+        module.fail_json(msg=('The following specified disks are not '
+                              'present: %s' % ', '.join(missing)),
+                         **result)
+    module.exit_json(**result)
+
+# import module snippets
+from ansible.module_utils.basic import *  # noqa
+
+if __name__ == '__main__':
+    main()
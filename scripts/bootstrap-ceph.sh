@@ -33,38 +33,132 @@ PCLD_DIR=`pwd`
 SCRIPTS_DIR=$(dirname $0)
 source $SCRIPTS_DIR/process-args.sh
 
-INSTALL=False
-if [ ! -d $CEPH_DIR ]; then
-    echo "Installing ceph-ansible..."
-    git-clone https://github.com/ceph/ceph-ansible $CEPH_ANSIBLE_TAG $CEPH_DIR
-    INSTALL=True
-fi
+# Patched ceph-ansible trees are cached as tarballs keyed by the tag and
+# the hash of the patch set
+CEPH_ANSIBLE_CACHE_DIR=${CEPH_ANSIBLE_CACHE_DIR:-/var/cache/ceph-services/ceph-ansible}
 
-# If ceph is invoked as a standalone project, install ansible
-type ansible >/dev/null 2>&1
-if [ $? != 0 ]; then
-    echo "Installing ansible..."
-    $CEPH_DIR/install-ansible.sh
-fi
+function patch-set-hash {
+    local patches=($PCLD_DIR/diffs/*.patch)
+    if [ ${#patches[@]} == 0 ]; then
+        echo "unpatched"
+        return
+    fi
+    pushd $PCLD_DIR/diffs >/dev/null 2>&1
+    sha256sum *.patch | sha256sum | cut -c1-16
+    popd >/dev/null 2>&1
+}
+
+# Clone ceph-ansible into a staging directory and apply the patches there,
+# so that $CEPH_DIR is only created once all the patches are applied.  The
+# patches are against /, the staging directory takes its place.  The patch
+# set is checked on a scratch copy of the staging directory first.
+function build-ceph-ansible {
+    local artifact=$1
+    local stage_root
+    stage_root=`mktemp -d $(dirname $CEPH_DIR)/.ceph-ansible.XXXXXX`
+    git-clone https://github.com/ceph/ceph-ansible $CEPH_ANSIBLE_TAG $stage_root$CEPH_DIR
+
+    # Only $CEPH_DIR is cached and installed, a file patched elsewhere
+    # would be lost
+    local outside=""
+    for f in $PCLD_DIR/diffs/*.patch; do
+        awk '/^\+\+\+ / {print $2}' $f | cut -d/ -f2- | \
+            grep -qv "^${CEPH_DIR#/}/"
+        if [ $? == 0 ]; then
+            outside="$outside $f"
+        fi
+    done
+    if [ "$outside" != "" ]; then
+        rm -rf $stage_root
+        echo "scripts/bootstrap-ceph failed"
+        for f in $outside; do
+            echo "Patch $f changes files outside of $CEPH_DIR"
+        done
+        echo "Manual retry procedure:"
+        echo "1) move the changes of the patches listed above out of diffs/"
+        echo "2) re-run command"
+        exit 1
+    fi
+
+    # Apply the whole patch set in order to a scratch copy first, so that
+    # patches changing the same file are checked on top of each other
+    echo "Checking patches"
+    local scratch_root
+    scratch_root=`mktemp -d $(dirname $CEPH_DIR)/.ceph-ansible-check.XXXXXX`
+    cp -a $stage_root/. $scratch_root
+    local failed=""
+    pushd $scratch_root >/dev/null 2>&1
+    for f in $PCLD_DIR/diffs/*.patch; do
+        patch -N -p1 --silent < $f
+        if [ $? != 0 ]; then
+            failed=$f
+            break
+        fi
+    done
+    popd >/dev/null 2>&1
+    rm -rf $scratch_root
+    if [ "$failed" != "" ]; then
+        rm -rf $stage_root
+        echo "scripts/bootstrap-ceph failed"
+        echo "Patch $failed could not be applied after the patches before it"
+        echo "Manual retry procedure:"
+        echo "1) fix the patch listed above"
+        echo "2) re-run command"
+        exit 1
+    fi
 
-# Apply patches iff ceph-ansible is installed above.  Code is designed to be reentrant
-if [ "$INSTALL" == "True" ] && [ -d $PCLD_DIR/diffs ]; then
+    pushd $stage_root >/dev/null 2>&1
     echo "Applying patches"
-    pushd / >/dev/null 2>&1
     for f in $PCLD_DIR/diffs/*.patch; do
         patch -N -p1 < $f
         rc=$?
         if [ $rc != 0 ]; then
+            popd >/dev/null 2>&1
+            rm -rf $stage_root
             echo "scripts/bootstrap-ceph failed, rc=$rc"
             echo "Patch $f could not be applied"
-            echo "Manual retry procedure:"
-            echo "1) fix patch $f"
-            echo "2) rm -rf /etc/ansible; rm -rf $CEPH_DIR"
-            echo "3) re-run command"
             exit 1
         fi
     done
     popd >/dev/null 2>&1
+
+    mkdir -p $CEPH_ANSIBLE_CACHE_DIR
+    tar -czf $artifact.tmp -C $stage_root$CEPH_DIR . && mv $artifact.tmp $artifact
+    if [ $? != 0 ]; then
+        rm -f $artifact.tmp
+        echo "Could not cache the patched ceph-ansible in $artifact"
+    fi
+    mv $stage_root$CEPH_DIR $CEPH_DIR
+    rm -rf $stage_root
+}
+
+if [ ! -d $CEPH_DIR ]; then
+    CEPH_ANSIBLE_ARTIFACT=$CEPH_ANSIBLE_CACHE_DIR/ceph-ansible-$CEPH_ANSIBLE_TAG-`patch-set-hash`.tar.gz
+    if [ -f $CEPH_ANSIBLE_ARTIFACT ]; then
+        echo "Installing ceph-ansible from $CEPH_ANSIBLE_ARTIFACT..."
+        mkdir -p $CEPH_DIR
+        tar -xzf $CEPH_ANSIBLE_ARTIFACT -C $CEPH_DIR
+        rc=$?
+        if [ $rc != 0 ]; then
+            rm -rf $CEPH_DIR
+            echo "scripts/bootstrap-ceph failed, rc=$rc"
+            echo "Could not extract $CEPH_ANSIBLE_ARTIFACT"
+            echo "Manual retry procedure:"
+            echo "1) rm -f $CEPH_ANSIBLE_ARTIFACT"
+            echo "2) re-run command"
+            exit 1
+        fi
+    else
+        echo "Installing ceph-ansible..."
+        build-ceph-ansible $CEPH_ANSIBLE_ARTIFACT
+    fi
+fi
+
+# If ceph is invoked as a standalone project, install ansible
+type ansible >/dev/null 2>&1
+if [ $? != 0 ]; then
+    echo "Installing ansible..."
+    $CEPH_DIR/install-ansible.sh
 fi
 
 # Setup site.yml playbook for use
@@ -81,8 +175,10 @@ fi
 
 # This is the normalized genesis style input source of inventory covering all configurations
 echo "Using genesis inventory"
+mkdir -p $DEPLOY_PROFILE_DIR
 ${PCLD_DIR}/scripts/ulysses_ceph/generate_ceph_ansible_input.py \
-    --inventory $GENESIS_INVENTORY --output_directory $CEPH_DIR
+    --inventory $GENESIS_INVENTORY --output_directory $CEPH_DIR \
+    --profile $DEPLOY_PROFILE_DIR/generate_ceph_ansible_input.json
 if [ $? != 0 ]; then
     echo "Error generating ceph inventory"
     exit 2
@@ -33,6 +33,14 @@ export GENESIS_DIR=${GENESIS_DIR:-"/opt/cluster-genesis"}
 SCRIPTS_DIR=$(dirname $0)
 source $SCRIPTS_DIR/process-args.sh
 
+# Record the task and host durations of pre-deploy.yml and site.yml in
+# DEPLOY_PROFILE_DIR
+export ANSIBLE_CALLBACK_PLUGINS=${PCLD_DIR}/playbooks/callback_plugins${ANSIBLE_CALLBACK_PLUGINS:+:$ANSIBLE_CALLBACK_PLUGINS}
+export ANSIBLE_CALLBACK_WHITELIST=deploy_profile${ANSIBLE_CALLBACK_WHITELIST:+,$ANSIBLE_CALLBACK_WHITELIST}
+
+generate-ansible-cfg $PCLD_DIR/playbooks
+generate-ansible-cfg $CEPH_DIR
+
 pushd playbooks >/dev/null 2>&1
 DY_INVENTORY_DIR="${GENESIS_DIR}/scripts/python"
 ansible-playbook -i ${DY_INVENTORY_DIR}/inventory.py pre-deploy.yml
@@ -50,3 +58,6 @@ echo "Running ceph playbooks"
 cd $CEPH_DIR
 
 run_ansible site.yml
+rc=$?
+echo "The deployment timing reports are located at $DEPLOY_PROFILE_DIR"
+exit $rc
@@ -21,28 +21,57 @@ set -o pipefail
 
 ulimit -n 100000
 
+# Bare mirrors of the cloned projects, shared with tools/mkdiffs.py
+export GIT_MIRROR_DIR=${GIT_MIRROR_DIR:-$HOME/.cache/ceph-services/git-mirrors}
+
+# Create or update the bare mirror of a git url and set GIT_MIRROR to its
+# path.  The mirror is used as is when it cannot be updated, for example
+# without network access.
+function git-mirror {
+    local url=$1
+    local name=${url#*://}
+    name=${name%/}
+    name=${name%.git}
+    GIT_MIRROR=$GIT_MIRROR_DIR/${name//[\/:@]/-}.git
+    if [ -d $GIT_MIRROR ]; then
+        git --git-dir=$GIT_MIRROR fetch --prune origin
+        if [ $? != 0 ]; then
+            echo "Could not update the mirror $GIT_MIRROR, using it as is"
+        fi
+    else
+        mkdir -p $GIT_MIRROR_DIR
+        git clone --mirror $url $GIT_MIRROR
+    fi
+}
+
 function git-clone {
     GIT_URL=$1
     DESIRED_TAG=$2
     TARGET_DIR=$3
     echo "GIT_URL=$GIT_URL"
     echo "DESIRED_TAG=$DESIRED_TAG"
+    git-mirror $GIT_URL
     pushd . >/dev/null 2>&1
     if [ -d $TARGET_DIR ]; then
         cd $TARGET_DIR
+        # Make the tags and branches of the mirror available
+        git fetch --tags $GIT_MIRROR "+refs/heads/*:refs/remotes/origin/*"
         TAG=`git symbolic-ref -q --short HEAD || git describe --tags --exact-match`
         if [ "$TAG" == "$DESIRED_TAG" ]; then
-            git pull
+            git pull $GIT_MIRROR $TAG
             rc=$?
         else
             git checkout $DESIRED_TAG
             rc=$?
         fi
     else
-        git clone $GIT_URL $TARGET_DIR
+        # A clone of the local mirror hard links the objects instead of
+        # downloading them, origin still points to the project url.
+        git clone --no-checkout $GIT_MIRROR $TARGET_DIR
         rc=$?
         if [ $rc == 0 ]; then
             cd $TARGET_DIR
+            git remote set-url origin $GIT_URL
             git checkout $DESIRED_TAG
             rc=$?
         fi
@@ -72,11 +101,28 @@ function set_passwd {
 
 export ANSIBLE_PARAMETERS=${ANSIBLE_PARAMETERS:-""}
 export ANSIBLE_FORCE_COLOR=${ANSIBLE_FORCE_COLOR:-"true"}
-export FORKS=${FORKS:-8}
+# The forks default to the ansible.cfg generated by create-cluster-ceph.sh
+export FORKS=${FORKS:-""}
 export BOOTSTRAP_OPTS=${BOOTSTRAP_OPTS:-""}
+# Timing reports of the inventory generation and of the playbook runs
+export DEPLOY_PROFILE_DIR=${DEPLOY_PROFILE_DIR:-/var/log/ceph-services/profile}
 
 function run_ansible {
-    ansible-playbook ${ANSIBLE_PARAMETERS} -i ceph-hosts --forks ${FORKS} $@
+    ansible-playbook ${ANSIBLE_PARAMETERS} -i ceph-hosts ${FORKS:+--forks $FORKS} $@
+}
+
+# Write the ansible.cfg of the playbooks in a directory, with the forks
+# sized from the hosts of the generated ceph-hosts inventory
+function generate-ansible-cfg {
+    local playbook_dir=$1
+    ${PCLD_DIR}/scripts/ulysses_ceph/generate_ansible_cfg.py \
+        --hosts_file $CEPH_DIR/ceph-hosts --output $playbook_dir/ansible.cfg \
+        ${FORKS:+--forks $FORKS}
+    rc=$?
+    if [ $rc != 0 ]; then
+        echo "Error generating $playbook_dir/ansible.cfg, rc=$rc"
+        exit 1
+    fi
 }
 
 GENESIS_INVENTORY="/var/oprc/inventory.yml"
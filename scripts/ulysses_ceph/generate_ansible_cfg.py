@@ -0,0 +1,202 @@
+#!/usr/bin/python
+
+# Copyright 2017 IBM US, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Generate the ansible.cfg of a deployment run.  The number of forks is
+# sized from the hosts of the ceph-hosts inventory written by
+# generate_ceph_ansible_input.py and from the controller resources, and
+# the SSH connections are reused with pipelining and ControlPersist.  The
+# other settings and the comments of an existing ansible.cfg are kept.
+
+import argparse
+import ConfigParser
+import json
+import multiprocessing
+import os
+import os.path
+import re
+import shlex
+import StringIO
+import sys
+
+import generate_ceph_ansible_input as generator
+
+# Forks mostly wait on their SSH connection, so several run per CPU
+FORKS_PER_CPU = 8
+# Resident memory of one Ansible worker process
+MEMORY_PER_FORK_MB = 100
+# Share of the controller memory the workers may use
+FORKS_MEMORY_SHARE = .5
+CONTROL_PERSIST = '600s'
+# A short socket path, long host names overflow the unix socket path limit
+CONTROL_PATH = '%(directory)s/%%h-%%r'
+SECTION_RE = re.compile(r'\[(?P<name>[^]]+)\]')
+OPTION_RE = re.compile(r'(?P<name>[^#;\s][^:=]*?)\s*[:=]')
+
+
+def count_hosts(hosts_file):
+    # Count the distinct hosts of a ceph-hosts inventory, either the INI
+    # file or, when ceph-hosts is the inventory script, the JSON document
+    # it reads.  A ceph-hosts.json left by a run in the other format is
+    # ignored.
+    hosts = set()
+    with open(hosts_file, 'r') as stream:
+        is_script = stream.read(2) == '#!'
+    if is_script:
+        with open(os.path.realpath(hosts_file) + '.json', 'r') as stream:
+            inventory = json.load(stream)
+        for name, group in inventory.iteritems():
+            if name != '_meta':
+                hosts.update(group.get('hosts', []))
+        return len(hosts)
+    with open(hosts_file, 'r') as stream:
+        for line in stream:
+            line = line.strip()
+            if line and not line.startswith(('[', '#', ';')):
+                hosts.add(line.split()[0])
+    return len(hosts)
+
+
+def _get_memory_mb():
+    try:
+        return (os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') /
+                (1024 * 1024))
+    except (ValueError, OSError):
+        return None
+
+
+def calculate_forks(host_count, cpu_count, memory_mb=None):
+    # One fork per host, bounded by the CPUs and the memory of the
+    # controller
+    forks = min(host_count, cpu_count * FORKS_PER_CPU)
+    if memory_mb:
+        forks = min(forks, int(memory_mb * FORKS_MEMORY_SHARE /
+                               MEMORY_PER_FORK_MB))
+    return max(forks, 1)
+
+
+def _set_options(lines, section, options):
+    # Set the (name, value) options of a section of the ansible.cfg lines.
+    # An option is replaced in place, or added after the last option of
+    # the section, and every other line is kept as is.
+    pending = list(options)
+    result = []
+    found = False
+    in_section = False
+    last_option = None
+    continuation = False
+    for line in lines:
+        # Skip the continuation lines of a replaced value
+        if continuation and line[:1].isspace() and line.strip():
+            continue
+        continuation = False
+        match = SECTION_RE.match(line)
+        if match:
+            in_section = match.group('name').strip() == section
+            if in_section:
+                found = True
+                last_option = len(result)
+        elif in_section:
+            match = OPTION_RE.match(line)
+            if match:
+                name = match.group('name').strip().lower()
+                for option in pending:
+                    if option[0] == name:
+                        line = '%s = %s' % option
+                        pending.remove(option)
+                        continuation = True
+                        break
+                last_option = len(result)
+        result.append(line)
+    added = ['%s = %s' % option for option in pending]
+    if found:
+        result[last_option + 1:last_option + 1] = added
+    elif added:
+        if result and result[-1].strip():
+            result.append('')
+        result.append('[%s]' % section)
+        result.extend(added)
+    return result
+
+
+def generate_cfg(base_file, forks):
+    # Return the contents of ansible.cfg, base_file with the forks and the
+    # SSH connection reuse set
+    lines = []
+    config = ConfigParser.RawConfigParser()
+    if base_file and os.path.isfile(base_file):
+        with open(base_file, 'r') as stream:
+            contents = stream.read()
+        lines = contents.splitlines()
+        config.readfp(StringIO.StringIO(contents), base_file)
+    ssh_args = ['-o ControlMaster=auto',
+                '-o ControlPersist=%s' % CONTROL_PERSIST]
+    if config.has_option('ssh_connection', 'ssh_args'):
+        # Keep the other ssh options of the base file
+        args = shlex.split(config.get('ssh_connection', 'ssh_args'))
+        while args:
+            arg = args.pop(0)
+            if arg == '-o' and args:
+                option = args.pop(0)
+                if not option.startswith(('ControlMaster',
+                                          'ControlPersist')):
+                    ssh_args.append('-o %s' % option)
+            else:
+                ssh_args.append(arg)
+    ssh_options = [('pipelining', 'True'), ('ssh_args', ' '.join(ssh_args))]
+    if not config.has_option('ssh_connection', 'control_path'):
+        ssh_options.append(('control_path', CONTROL_PATH))
+    lines = _set_options(lines, 'defaults', [('forks', str(forks))])
+    lines = _set_options(lines, 'ssh_connection', ssh_options)
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=('Generate an ansible.cfg sized for the hosts of a '
+                     'ceph-hosts inventory.'),
+        formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--hosts_file',
+                        dest='hosts_file',
+                        required=True,
+                        help=('The ceph-hosts inventory generated by '
+                              'generate_ceph_ansible_input.py.'))
+    parser.add_argument('--output',
+                        dest='output_file',
+                        required=True,
+                        help=('The ansible.cfg to write.  Its existing '
+                              'settings are kept.'))
+    parser.add_argument('--forks',
+                        dest='forks',
+                        type=int,
+                        help='Use this number of forks instead of sizing it.')
+
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(1)
+    args = parser.parse_args()
+
+    forks = args.forks
+    if not forks:
+        host_count = count_hosts(args.hosts_file)
+        forks = calculate_forks(host_count, multiprocessing.cpu_count(),
+                                _get_memory_mb())
+        print('Using %d forks for %d hosts.' % (forks, host_count))
+    contents = generate_cfg(args.output_file, forks)
+    if generator._write_string(args.output_file, contents):
+        print('  updated: %s' % args.output_file)
+
+if __name__ == "__main__":
+    main()
@@ -15,19 +15,146 @@
 # limitations under the License.
 
 import argparse
+import contextlib
 import copy
+import csv
+import hashlib
+import json
 import math
+import os
 import os.path
+import resource
 import sys
+import tempfile
+import time
 import yaml
 
+# numpy is only used to batch the PG sweep report, the report falls back
+# to computing one point at a time when it is not installed.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Use the libyaml backed loader and dumper when PyYAML was built with
+# libyaml support, they are significantly faster on large inventories.
+try:
+    from yaml import CSafeLoader as YamlLoader
+    from yaml import CSafeDumper as YamlDumper
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+    from yaml import SafeDumper as YamlDumper
 
 JOURNAL_DEVICE_KEY = 'journal-devices'
 OSD_DEVICE_KEY = 'osd-devices'
 CEPH_STANDALONE = 'ceph-standalone'
+# The 'size' value and nearest power of 2 threshold used in the PG calcs.
+PG_REPLICATION_COUNT = 3
+PG_POW2_THRESHOLD = .25
+PG_SWEEP_COLUMNS = ['osd_count', 'growth_factor', 'vms_percent',
+                    'images_percent', 'volumes_percent', 'vms_pg_num',
+                    'images_pg_num', 'volumes_pg_num', 'pgs_per_osd']
+# Optional per pool settings of the inventory.  A pool is either replicated
+# with 'size' copies or erasure coded with 'erasure-code' k data and m
+# coding chunks.  Pools other than the OpenStack pools give their share of
+# the cluster data with 'percent-data'.
+POOLS_KEY = 'ceph-pools'
+POOL_SIZE_KEY = 'size'
+POOL_PERCENT_KEY = 'percent-data'
+POOL_ERASURE_CODE_KEY = 'erasure-code'
+OPENSTACK_POOL_NAMES = {'openstack_glance_pool': 'images',
+                        'openstack_nova_pool': 'vms',
+                        'openstack_cinder_pool': 'volumes'}
 TEMPLATE_ROLES_KEY = 'roles'
 MON_ROLE = 'ceph-monitor'
 OSD_ROLE = 'ceph-osd'
+# Journal devices may be given as a dict with the device name and either a
+# relative write bandwidth 'weight' or a device 'class' from this table.
+JOURNAL_DEVICE_NAME_KEY = 'device'
+JOURNAL_WEIGHT_KEY = 'weight'
+JOURNAL_CLASS_KEY = 'class'
+JOURNAL_CLASS_WEIGHTS = {'nvme': 5.0,
+                         'ssd': 1.0}
+# The capacity of a journal device in GB
+JOURNAL_SIZE_KEY = 'size'
+
+# The journal size is 2 * expected throughput * filestore max sync interval.
+# The expected throughput of an OSD is given in the node template
+# domain-settings either in MB/s or as the class of the OSD devices.
+OSD_BANDWIDTH_KEY = 'osd-device-bandwidth'
+OSD_CLASS_KEY = 'osd-device-class'
+OSD_CLASS_THROUGHPUT = {'hdd': 150,
+                        'ssd': 500,
+                        'nvme': 2000}
+FILESTORE_MAX_SYNC_INTERVAL = 5
+
+# CRUSH topology.  Nodes may give their row, rack and chassis, from the
+# widest to the narrowest bucket.  The failure domain of the pool rules is
+# the widest bucket type with enough buckets for the replicas.
+CRUSH_ROOT = 'default'
+CRUSH_LOCATION_KEYS = [('row', 'row-id'),
+                       ('rack', 'rack-id'),
+                       ('chassis', 'chassis-id')]
+FAILURE_DOMAIN_AUTO = 'auto'
+FAILURE_DOMAIN_HOST = 'host'
+
+# Network planning.  The optional speed of a network is in Gb/s per link,
+# a bond carries one link per bond-slaves entry.
+REPLICATION_NETWORK = 'ceph-replication'
+NETWORK_SPEED_KEY = 'speed'
+NETWORK_BOND_SLAVES_KEY = 'bond-slaves'
+NETWORK_MTU_KEY = 'mtu'
+JUMBO_FRAME_MTU = 9000
+
+# OSD tuning profiles.  The thread counts follow the CPU cores per OSD and
+# the queue and throttle limits follow the class of the OSD and journal
+# devices, scaled by the profile.  The hardware is described by the
+# optional cpu-cores and memory-gb domain-settings of the OSD templates.
+CPU_CORES_KEY = 'cpu-cores'
+MEMORY_KEY = 'memory-gb'
+TUNING_PROFILES = {
+    'throughput': {'threads_per_core': 2.0, 'queue_scale': 1.0},
+    'latency': {'threads_per_core': 1.0, 'queue_scale': .25}}
+TUNING_THREADS_MIN = 2
+TUNING_THREADS_MAX = 8
+# Queue limits per OSD device class: filestore queue max ops and max MB
+FILESTORE_QUEUE_LIMITS = {'hdd': (500, 100),
+                          'ssd': (5000, 512),
+                          'nvme': (10000, 1024)}
+# Limits per journal device class: journal max write entries, max write
+# MB, queue max ops and queue max MB
+JOURNAL_QUEUE_LIMITS = {'hdd': (100, 10, 300, 32),
+                        'ssd': (1000, 100, 3000, 256),
+                        'nvme': (5000, 256, 10000, 1024)}
+# The filestore and journal queues of an OSD may use up to this share of
+# the memory per OSD
+TUNING_QUEUE_MEMORY_SHARE = .25
+
+HOSTS_FILE = 'ceph-hosts'
+# Generated outputs are cached under the output root, keyed by the inventory
+# contents, the generation parameters and the generator itself.  The least
+# recently used entries are evicted once the cache grows beyond the limit.
+CACHE_DIR = '.generator_cache'
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+INVENTORY_FORMAT_INI = 'ini'
+INVENTORY_FORMAT_JSON = 'json'
+# With the json inventory format ceph-hosts is a dynamic inventory script
+# printing the ceph-hosts.json document next to it.  The document has a
+# _meta block, so ansible loads it with a single --list call.
+INVENTORY_SCRIPT = '''#!/usr/bin/env python
+import json
+import os
+import sys
+
+name = os.path.realpath(__file__) + '.json'
+if len(sys.argv) > 2 and sys.argv[1] == '--host':
+    with open(name) as stream:
+        host_vars = json.load(stream)['_meta']['hostvars']
+    print(json.dumps(host_vars.get(sys.argv[2], {})))
+else:
+    with open(name) as stream:
+        sys.stdout.write(stream.read())
+'''
 
 openstack_keys = [
     {'name': 'client.glance',
@@ -67,21 +194,101 @@ hard_coded_vars = {
 def _load_yml(name):
     with open(name, 'r') as stream:
         try:
-            return yaml.safe_load(stream)
+            return yaml.load(stream, Loader=YamlLoader)
         except yaml.YAMLError as ex:
             print(ex)
             sys.exit(1)
 
 
+def _file_digest(filename):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as stream:
+        for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class AtomicFile(object):
+    """Write a file atomically, leaving it untouched when unchanged.
+
+    The contents are streamed to a temporary file in the target directory
+    and hashed on the way.  On close the temporary file replaces the
+    target only when the content hash differs from the target's, so an
+    unchanged output keeps its mtime.  The temporary file is synced to
+    disk before the rename, so neither a crash nor a power loss leaves a
+    partially written target.  The changed attribute tells whether the
+    target was replaced.
+    """
+
+    def __init__(self, filename, mode=None):
+        super(AtomicFile, self).__init__()
+        self.filename = filename
+        self.mode = mode
+        self.changed = False
+        self._digest = hashlib.sha256()
+        self._size = 0
+        fd, self._tmp_name = tempfile.mkstemp(
+            dir=os.path.dirname(filename) or '.',
+            prefix='.%s.' % os.path.basename(filename))
+        self._stream = os.fdopen(fd, 'wb')
+
+    def write(self, data):
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        self._digest.update(data)
+        self._size += len(data)
+        self._stream.write(data)
+
+    def _unchanged(self):
+        return (os.path.isfile(self.filename) and
+                os.path.getsize(self.filename) == self._size and
+                _file_digest(self.filename) == self._digest.hexdigest())
+
+    def close(self):
+        if self._unchanged():
+            self._stream.close()
+            os.remove(self._tmp_name)
+            return
+        # The contents must be on disk before the rename, otherwise the
+        # target can be empty after a power loss.
+        self._stream.flush()
+        os.fsync(self._stream.fileno())
+        self._stream.close()
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 if self.mode is None else self.mode
+        os.chmod(self._tmp_name, mode & ~umask)
+        os.rename(self._tmp_name, self.filename)
+        self.changed = True
+
+    def abort(self):
+        self._stream.close()
+        os.remove(self._tmp_name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
 def _write_yml(filename, contents):
-    stream = file(filename, 'w')
-    yaml.dump(contents, stream, default_flow_style=False, width=1000)
+    # Dump straight to the file so that no intermediate string is built.
+    # Returns True when the file was changed.
+    with AtomicFile(filename) as stream:
+        yaml.dump(contents, stream, Dumper=YamlDumper,
+                  default_flow_style=False, width=1000)
+    return stream.changed
 
 
-def _write_string(filename, contents):
-    hosts_file = open(filename, "w")
-    hosts_file.write(contents)
-    hosts_file.close()
+def _write_string(filename, contents, mode=None):
+    # Returns True when the file was changed.
+    with AtomicFile(filename, mode) as stream:
+        stream.write(contents)
+    return stream.changed
 
 
 def _get_storage_network(inventory):
@@ -91,18 +298,14 @@ def _get_storage_network(inventory):
     return 'openstack-stg'
 
 
-def _init_default_values(inventory, openstack_config):
+def _init_default_values(index, openstack_config, monitor_interface=None):
     config_vars = copy.deepcopy(hard_coded_vars)
-    storage_net_name = _get_storage_network(inventory)
-    storage_net = inventory['networks'][storage_net_name]
-    mon_interface = storage_net.get('bridge')
-    if not mon_interface:
-        mon_interface = storage_net.get('bond')
-    if not mon_interface:
-        mon_interface = storage_net.get('eth-port')
-    config_vars['monitor_interface'] = mon_interface
-
-    dep_env = inventory.get('deployment-environment')
+    if monitor_interface is None:
+        storage_net = index.inventory['networks'][index.storage_network]
+        monitor_interface = _get_monitor_interface(storage_net)
+    config_vars['monitor_interface'] = monitor_interface
+
+    dep_env = index.inventory.get('deployment-environment')
     if dep_env:
         config_vars['deployment_environment_variables'] = dep_env
 
@@ -116,99 +319,772 @@ def _init_default_values(inventory, openstack_config):
     return config_vars
 
 
-def _get_nodes_for_role(inventory, role, templates=None):
-    if not templates:
-        templates = _get_node_template_names_for_role(inventory, role)
-    nodes = []
-    for name in templates:
-        nodes.extend(inventory['nodes'][name])
-    return nodes
+def _choose_monitor_interface(network):
+    # Return the interface of the storage network the monitors use and
+    # its bandwidth in Gb/s, or None when unknown.  With link speeds the
+    # fastest interface is used, a bond counting all of its slaves.
+    # Otherwise, and between interfaces of the same speed, the bridge is
+    # preferred, then the bond, which is faster than a single port.
+    interfaces = []
+    for key in ['bridge', 'bond', 'eth-port']:
+        if network.get(key):
+            interfaces.append((network[key],
+                               _get_interface_bandwidth(network, key)))
+    if not interfaces:
+        return None, None
+    known = [interface for interface in interfaces
+             if interface[1] is not None]
+    if known:
+        # max keeps the first of the fastest interfaces
+        return max(known, key=lambda interface: interface[1])
+    return interfaces[0]
+
+
+def _get_monitor_interface(network):
+    return _choose_monitor_interface(network)[0]
+
+
+def _get_interface_bandwidth(network, key):
+    # Return the bandwidth in Gb/s of the bridge, bond or eth-port of a
+    # network, or None when unknown.  A bridge runs at the speed of the
+    # eth-port it is on, or of the bond when there is no eth-port.
+    if NETWORK_SPEED_KEY not in network:
+        return None
+    if key == 'bond' or (key == 'bridge' and not network.get('eth-port')):
+        return _get_network_bandwidth(network)
+    return float(network[NETWORK_SPEED_KEY])
+
+
+def _get_network_bandwidth(network):
+    # Return the bandwidth of a network in Gb/s, or None when unknown
+    if NETWORK_SPEED_KEY not in network:
+        return None
+    links = 1
+    if network.get('bond') and network.get(NETWORK_BOND_SLAVES_KEY):
+        links = len(network[NETWORK_BOND_SLAVES_KEY])
+    return float(network[NETWORK_SPEED_KEY]) * links
+
+
+def _get_host_osd_bandwidth(index):
+    # Return the highest OSD write bandwidth of an OSD host in Gb/s.  The
+    # OSD devices are taken to be hard disks unless the template says
+    # otherwise.
+    bandwidth = 0.0
+    for name in index.get_templates_for_role(OSD_ROLE):
+        settings = index.get_template(name)['domain-settings']
+        throughput = _get_osd_throughput(settings)
+        if throughput is None:
+            throughput = OSD_CLASS_THROUGHPUT['hdd']
+        bandwidth = max(bandwidth, len(settings[OSD_DEVICE_KEY]) *
+                        throughput * 8 / 1000.0)
+    return bandwidth
+
+
+def _plan_network(index, pool_width=PG_REPLICATION_COUNT):
+    # Choose the cluster network and check that the network carrying the
+    # replication traffic can keep up with the OSDs of a host.  A host
+    # receives (width - 1) / width of the writes to its OSDs as replica
+    # or chunk writes and recovery traffic, and 1 / width from the
+    # clients, where width is the size of a pool or its k + m.  The client
+    # traffic is on the monitor interface of the storage network.  Returns
+    # the cluster network, the monitor interface and a list of warnings.
+    networks = index.inventory['networks']
+    public = networks[index.storage_network]
+    replication = networks.get(REPLICATION_NETWORK)
+    monitor_interface, public_gbps = _choose_monitor_interface(public)
+    cluster_net = '{{ public_network }}'
+    carrier = public
+    carrier_gbps = public_gbps
+    if replication:
+        cluster_net = replication['addr']
+        carrier = replication
+        carrier_gbps = _get_network_bandwidth(replication)
+
+    warnings = []
+    if carrier_gbps is None:
+        return cluster_net, monitor_interface, warnings
+
+    host_gbps = _get_host_osd_bandwidth(index)
+    replication_gbps = host_gbps * (pool_width - 1) / float(pool_width)
+    client_gbps = host_gbps - replication_gbps
+    shared_gbps = host_gbps
+    if (carrier is replication and carrier_gbps < replication_gbps and
+            public_gbps is not None and public_gbps >= shared_gbps):
+        warnings.append('The %s network (%.1f Gb/s) is slower than the '
+                        '%.1f Gb/s of replication traffic per host, the '
+                        '%s network (%.1f Gb/s) is used instead.' %
+                        (REPLICATION_NETWORK, carrier_gbps, replication_gbps,
+                         index.storage_network, public_gbps))
+        cluster_net = '{{ public_network }}'
+        carrier = public
+        carrier_gbps = public_gbps
+
+    need_gbps = replication_gbps
+    if carrier is public:
+        need_gbps = shared_gbps
+    if carrier_gbps < need_gbps:
+        warnings.append('The OSD hosts need %.1f Gb/s of %s bandwidth, '
+                        'the network has %.1f Gb/s.  Replication and '
+                        'recovery will be limited by the network.' %
+                        (need_gbps, 'shared client and replication'
+                         if carrier is public else 'replication',
+                         carrier_gbps))
+    if (carrier is not public and public_gbps is not None and
+            public_gbps < client_gbps):
+        warnings.append('The monitor interface %s (%.1f Gb/s) is slower '
+                        'than the %.1f Gb/s of client traffic per host.' %
+                        (monitor_interface, public_gbps, client_gbps))
+    mtu = carrier.get(NETWORK_MTU_KEY)
+    if mtu and int(mtu) < JUMBO_FRAME_MTU:
+        warnings.append('The replication network MTU is %s, jumbo frames '
+                        '(MTU %d) reduce the replication overhead.' %
+                        (mtu, JUMBO_FRAME_MTU))
+    return cluster_net, monitor_interface, warnings
+
+
+def _get_template_roles(name, template):
+    # Return the set of roles satisfied by the given node template
+    roles = set(template.get(TEMPLATE_ROLES_KEY, []))
+    # for backward compatibility node template names are also roles
+    roles.add(name)
+    if name == 'controllers':
+        # for backward compatibility controller node templates
+        # are ceph-monitors
+        roles.add(MON_ROLE)
+    return roles
+
+
+class InventoryIndex(object):
+    """Lookup tables over a cluster-genesis inventory.
+
+    The inventory is scanned once, on first use, to map roles to node
+    template names.  The node lists and storage addresses for a role are
+    then built once and reused by every generator function.
+    """
+
+    def __init__(self, inventory):
+        super(InventoryIndex, self).__init__()
+        self.inventory = inventory
+        self.storage_network = _get_storage_network(inventory)
+        self.storage_addr_key = '%s-addr' % self.storage_network
+        self._role_templates = None
+        self._role_nodes = {}
+        self._role_addrs = {}
+
+    def _build_role_templates(self):
+        role_templates = {}
+        for name, templ in self.inventory['node-templates'].iteritems():
+            for role in _get_template_roles(name, templ):
+                role_templates.setdefault(role, []).append(name)
+        return role_templates
+
+    def get_template(self, name):
+        return self.inventory['node-templates'][name]
+
+    def get_templates_for_role(self, role):
+        if self._role_templates is None:
+            self._role_templates = self._build_role_templates()
+        return self._role_templates.get(role, [])
+
+    def get_template_nodes(self, name):
+        return self.inventory['nodes'][name]
+
+    def get_nodes_for_role(self, role):
+        nodes = self._role_nodes.get(role)
+        if nodes is None:
+            nodes = []
+            for name in self.get_templates_for_role(role):
+                nodes.extend(self.get_template_nodes(name))
+            self._role_nodes[role] = nodes
+        return nodes
+
+    def get_storage_addrs_for_role(self, role):
+        addrs = self._role_addrs.get(role)
+        if addrs is None:
+            addrs = [node[self.storage_addr_key]
+                     for node in self.get_nodes_for_role(role)]
+            self._role_addrs[role] = addrs
+        return addrs
 
 
 def _get_node_template_names_for_role(inventory, role):
     # Return the list of node templates names that satisfy the given role
-    templates = []
-    for name, templ in inventory['node-templates'].iteritems():
-        if name == role:
-            # for backward compatibility node template names are
-            # also roles
-            templates.append(name)
-        elif role == MON_ROLE and name == 'controllers':
-            # for backward compatibility controller node templates
-            # are ceph-monitors
-            templates.append(name)
-        elif TEMPLATE_ROLES_KEY in templ:
-            if role in templ[TEMPLATE_ROLES_KEY]:
-                templates.append(name)
-    return templates
-
-
-def _get_osd_ips(inventory):
-    osd_network = '%s-addr' % _get_storage_network(inventory)
-    return [host[osd_network]
-            for host in _get_nodes_for_role(inventory, OSD_ROLE)]
-
-
-def _get_mon_ips(inventory):
-    osd_network = '%s-addr' % _get_storage_network(inventory)
-    return [host[osd_network]
-            for host in _get_nodes_for_role(inventory, MON_ROLE)]
+    return InventoryIndex(inventory).get_templates_for_role(role)
 
 
-def generate_files(root_dir, inventory_file, growth_factor, vms_data_percent,
-                   images_data_percent, volumes_data_percent,
-                   openstack_config):
-    inventory = _load_yml(inventory_file)
-
-    all_vars = _generate_all_vars(inventory, growth_factor, vms_data_percent,
-                                  images_data_percent, volumes_data_percent,
-                                  openstack_config)
-    _write_yml(os.path.join(root_dir, 'group_vars', 'all'), all_vars)
-    osd_vars = _generate_osds_vars(inventory)
-    _write_yml(os.path.join(root_dir, 'group_vars', 'osds'), osd_vars)
-    hosts_contents = _generate_hosts_file(inventory)
-    _write_string(os.path.join(root_dir, 'ceph-hosts'), hosts_contents)
+def _get_osd_ips(index):
+    return index.get_storage_addrs_for_role(OSD_ROLE)
 
 
-def _generate_all_vars(inventory, growth_factor, vms_data_percent,
-                       images_data_percent, volumes_data_percent,
-                       openstack_config):
-    all_vars = _init_default_values(inventory, openstack_config)
-    pub_storage = _get_storage_network(inventory)
-    storage_net = inventory['networks'][pub_storage]['addr']
-    cluster_net = '{{ public_network }}'
+def _get_mon_ips(index):
+    return index.get_storage_addrs_for_role(MON_ROLE)
 
-    if 'ceph-replication' in inventory['networks']:
-        cluster_net = inventory['networks']['ceph-replication']['addr']
 
+def generate_files(root_dir, inventory_file, growth_factor, vms_data_percent,
+                   images_data_percent, volumes_data_percent,
+                   openstack_config, inventory_format=INVENTORY_FORMAT_INI,
+                   use_cache=False, tuning_profile=None,
+                   failure_domain=FAILURE_DOMAIN_AUTO, profiler=None,
+                   verbose=False):
+    if profiler is None:
+        profiler = Profiler()
+    cache_key = None
+    if use_cache:
+        with profiler.phase('cache_lookup'):
+            cache_key = _get_cache_key(inventory_file, growth_factor,
+                                       vms_data_percent, images_data_percent,
+                                       volumes_data_percent, openstack_config,
+                                       inventory_format, tuning_profile,
+                                       failure_domain)
+            cached = _restore_cached_outputs(root_dir, cache_key)
+        if cached is not None:
+            outputs, warnings = cached
+            print('Using the cached outputs for %s.' % inventory_file)
+            # The warnings of the run which cached the outputs still apply
+            _print_warnings(warnings)
+            _report_outputs(outputs, verbose)
+            return outputs
+
+    with profiler.phase('load'):
+        inventory = _load_yml(inventory_file)
+        index = InventoryIndex(inventory)
+
+    outputs = {}
+    warnings = []
+    with profiler.phase('all_vars'):
+        all_vars = _generate_all_vars(index, growth_factor, vms_data_percent,
+                                      images_data_percent,
+                                      volumes_data_percent, openstack_config,
+                                      failure_domain, warnings)
+        if tuning_profile:
+            all_vars.update(_generate_tuning_vars(index, tuning_profile))
+        file_name = os.path.join(root_dir, 'group_vars', 'all')
+        outputs[file_name] = _write_yml(file_name, all_vars)
+    with profiler.phase('osds_vars'):
+        osd_vars = _generate_osds_vars(index)
+        file_name = os.path.join(root_dir, 'group_vars', 'osds')
+        outputs[file_name] = _write_yml(file_name, osd_vars)
+    with profiler.phase('osd_host_vars'):
+        osd_host_vars = _generate_osd_host_vars(index)
+    with profiler.phase('inventory'):
+        hosts_file = os.path.join(root_dir, HOSTS_FILE)
+        if inventory_format == INVENTORY_FORMAT_JSON:
+            # The host vars are part of the inventory document
+            inventory_json = _generate_inventory_json(index, osd_host_vars)
+            file_name = hosts_file + '.json'
+            outputs[file_name] = _write_string(file_name, inventory_json)
+            outputs[hosts_file] = _write_string(hosts_file,
+                                                INVENTORY_SCRIPT, 0o777)
+            # host_vars of a previous INI run would override the document
+            _prune_host_vars(os.path.join(root_dir, 'host_vars'), ())
+        else:
+            outputs.update(_write_host_vars(
+                os.path.join(root_dir, 'host_vars'), osd_host_vars))
+            hosts_contents = _generate_hosts_file(index)
+            outputs[hosts_file] = _write_string(hosts_file, hosts_contents)
+    if cache_key:
+        with profiler.phase('cache_store'):
+            _store_cached_outputs(root_dir, cache_key, outputs, warnings)
+    _report_outputs(outputs, verbose)
+    return outputs
+
+
+def _max_rss_kb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Profiler(object):
+    """Wall clock time and memory of the generate_files phases.
+
+    The peak resident set size is a high-water mark of the whole process,
+    so it is reported once for the run.  A phase reports how much it
+    raised the peak, which is 0 for a phase that stayed below the peak of
+    an earlier one.
+    """
+
+    def __init__(self):
+        super(Profiler, self).__init__()
+        self.start = time.time()
+        self.phases = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.time()
+        rss = _max_rss_kb()
+        try:
+            yield
+        finally:
+            self.phases.append({'name': name,
+                                'seconds': round(time.time() - start, 4),
+                                'peak_rss_growth_kb': _max_rss_kb() - rss})
+
+    def report(self):
+        return {'phases': self.phases,
+                'total_seconds': round(time.time() - self.start, 4),
+                'peak_rss_kb': _max_rss_kb()}
+
+    def write(self, file_name):
+        _write_string(file_name, json.dumps(self.report(), indent=4,
+                                            separators=(',', ': '),
+                                            sort_keys=True) + '\n')
+
+
+def _report_outputs(outputs, verbose=False):
+    # outputs maps every written file name to whether it changed.  With
+    # per host host_vars there is a file per OSD host, so the updated files
+    # are only listed in verbose mode.
+    changed = sorted(name for name, was_changed in outputs.iteritems()
+                     if was_changed)
+    print('%d generated files changed, %d unchanged.' %
+          (len(changed), len(outputs) - len(changed)))
+    if verbose:
+        for name in changed:
+            print('  updated: %s' % name)
+
+
+def _get_cache_key(inventory_file, *params):
+    # The generator source is part of the key so that a changed generator
+    # never returns outputs cached by an older version.
+    digest = hashlib.sha256()
+    digest.update(_file_digest(inventory_file).encode('ascii'))
+    source_file = os.path.splitext(os.path.abspath(__file__))[0] + '.py'
+    digest.update(_file_digest(source_file).encode('ascii'))
+    digest.update(json.dumps(params).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _restore_cached_outputs(root_dir, cache_key):
+    # Write the cached outputs for cache_key to root_dir.  Returns the
+    # outputs dict and the warnings of the run which cached them, or None
+    # when there is no usable cache entry.
+    entry_file = os.path.join(root_dir, CACHE_DIR, cache_key + '.json')
+    try:
+        with open(entry_file, 'r') as stream:
+            entry = json.load(stream)
+        files = entry['files']
+        warnings = entry['warnings']
+    except (IOError, OSError):
+        return None
+    except (ValueError, KeyError):
+        print('Ignoring the corrupt cache entry %s' % entry_file)
+        os.remove(entry_file)
+        return None
+    # Mark the entry as recently used
+    os.utime(entry_file, None)
+
+    outputs = {}
+    for name, cached in sorted(files.iteritems()):
+        file_name = os.path.join(root_dir, name)
+        if not os.path.isdir(os.path.dirname(file_name)):
+            os.makedirs(os.path.dirname(file_name))
+        outputs[file_name] = _write_string(file_name, cached['contents'],
+                                           cached['mode'])
+    host_vars_dir = os.path.join(root_dir, 'host_vars')
+    _prune_host_vars(host_vars_dir,
+                     set(os.path.basename(name) for name in outputs
+                         if os.path.dirname(name) == host_vars_dir))
+    return outputs, warnings
+
+
+def _store_cached_outputs(root_dir, cache_key, outputs, warnings=()):
+    # The outputs are read back from the written files, which also covers
+    # the files that were left unchanged.
+    files = {}
+    for file_name in outputs:
+        with open(file_name, 'rb') as stream:
+            contents = stream.read().decode('utf-8')
+        files[os.path.relpath(file_name, root_dir)] = {
+            'contents': contents,
+            'mode': os.stat(file_name).st_mode & 0o777}
+    cache_dir = os.path.join(root_dir, CACHE_DIR)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    _write_string(os.path.join(cache_dir, cache_key + '.json'),
+                  json.dumps({'files': files, 'warnings': list(warnings)},
+                             sort_keys=True))
+    _evict_cache(cache_dir, CACHE_MAX_BYTES)
+
+
+def _evict_cache(cache_dir, max_bytes):
+    # Remove the least recently used entries until the cache fits in
+    # max_bytes.  The most recent entry is always kept.
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.endswith('.json') and os.path.isfile(path):
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+    entries.sort(reverse=True)
+    total = 0
+    for index, (mtime, size, path) in enumerate(entries):
+        total += size
+        if index and total > max_bytes:
+            os.remove(path)
+
+
+def _print_warnings(warnings):
+    for warning in warnings:
+        print('WARNING: %s' % warning)
+
+
+def _generate_all_vars(index, growth_factor, vms_data_percent,
+                       images_data_percent, volumes_data_percent,
+                       openstack_config, failure_domain=FAILURE_DOMAIN_AUTO,
+                       warnings=None):
+    # The warnings are printed and, when a warnings list is given, added
+    # to it.
+    if warnings is None:
+        warnings = []
+    networks = index.inventory['networks']
+    storage_net = networks[index.storage_network]['addr']
+
+    pools = []
+    openstack_pools = {}
     if openstack_config:
-            openstack_pools = _get_openstack_pools(inventory, growth_factor,
+            openstack_pools = _get_openstack_pools(index, growth_factor,
                                                    vms_data_percent,
                                                    images_data_percent,
                                                    volumes_data_percent)
-            all_vars.update(openstack_pools)
+            pools.extend(openstack_pools.values())
+    ceph_pools = _get_ceph_pools(index, growth_factor)
+    pools.extend(ceph_pools)
+    # The widest pool sends the most replication traffic
+    width = PG_REPLICATION_COUNT
+    if pools:
+        width = max(_get_pool_width(pool) for pool in pools)
+    cluster_net, monitor_interface, messages = _plan_network(index, width)
+    _print_warnings(messages)
+    warnings.extend(messages)
+
+    all_vars = _init_default_values(index, openstack_config,
+                                    monitor_interface)
+    all_vars.update(openstack_pools)
+    if ceph_pools:
+        all_vars['ceph_pools'] = ceph_pools
+    if pools:
+        domain, messages = _choose_failure_domain(index, failure_domain,
+                                                  width)
+        _print_warnings(messages)
+        warnings.extend(messages)
+        # The default rule already places replicas on different hosts
+        replicated = [pool['name'] for pool in pools
+                      if 'erasure_code_profile' not in pool]
+        if domain != FAILURE_DOMAIN_HOST and replicated:
+            all_vars['crush_rules'] = _generate_crush_rules(replicated,
+                                                            domain)
+        profiles = _generate_erasure_code_profiles(pools, domain)
+        if profiles:
+            all_vars['erasure_code_profiles'] = profiles
     all_vars['public_network'] = storage_net
     all_vars['cluster_network'] = cluster_net
     return all_vars
 
 
-def _generate_osds_vars(inventory):
+def _generate_tuning_vars(index, profile_name):
+    # Return the ceph_conf_overrides osd section of the tuning profile.
+    # ceph_conf_overrides applies to the whole cluster, so every setting
+    # is the lowest value of the OSD templates.
+    settings = {}
+    for name in index.get_templates_for_role(OSD_ROLE):
+        template_settings = _generate_template_tuning(
+            index.get_template(name)['domain-settings'],
+            TUNING_PROFILES[profile_name])
+        for key, value in template_settings.iteritems():
+            settings[key] = min(value, settings.get(key, value))
+    return {'ceph_conf_overrides': {'osd': settings}}
+
+
+def _generate_template_tuning(settings, profile):
+    osd_count = len(settings[OSD_DEVICE_KEY])
+    osd_class = settings.get(OSD_CLASS_KEY, 'hdd')
+    if osd_class not in FILESTORE_QUEUE_LIMITS:
+        print('Unknown OSD device class %s, expected one of: %s' %
+              (osd_class, ', '.join(sorted(FILESTORE_QUEUE_LIMITS))))
+        sys.exit(1)
+    # Collocated journals share the OSD device, dedicated journal devices
+    # without a class are taken to be SSDs.  The slowest journal class
+    # sets the journal limits.
+    journal_classes = [osd_class]
+    if JOURNAL_DEVICE_KEY in settings:
+        journal_classes = [journal.get(JOURNAL_CLASS_KEY, 'ssd')
+                           if isinstance(journal, dict) else 'ssd'
+                           for journal in settings[JOURNAL_DEVICE_KEY]]
+    for journal_class in journal_classes:
+        if journal_class not in JOURNAL_QUEUE_LIMITS:
+            print('Unknown journal device class %s, expected one of: %s' %
+                  (journal_class, ', '.join(sorted(JOURNAL_QUEUE_LIMITS))))
+            sys.exit(1)
+    journal_limits = min(JOURNAL_QUEUE_LIMITS[journal_class]
+                         for journal_class in journal_classes)
+
+    cores_per_osd = float(settings.get(CPU_CORES_KEY, osd_count)) / osd_count
+    threads = int(round(cores_per_osd * profile['threads_per_core']))
+    threads = max(TUNING_THREADS_MIN, min(TUNING_THREADS_MAX, threads))
+
+    scale = profile['queue_scale']
+    filestore_ops, filestore_mb = FILESTORE_QUEUE_LIMITS[osd_class]
+    entries, write_mb, journal_ops, journal_mb = journal_limits
+    filestore_mb *= scale
+    journal_mb *= scale
+    if MEMORY_KEY in settings:
+        memory_mb = (float(settings[MEMORY_KEY]) * 1024 / osd_count *
+                     TUNING_QUEUE_MEMORY_SHARE)
+        if filestore_mb + journal_mb > memory_mb:
+            ratio = memory_mb / (filestore_mb + journal_mb)
+            filestore_mb *= ratio
+            journal_mb *= ratio
+
+    mb = 1024 * 1024
+    return {'osd op threads': threads,
+            'filestore op threads': threads,
+            'filestore queue max ops': int(filestore_ops * scale),
+            'filestore queue max bytes': int(filestore_mb * mb),
+            'journal max write entries': int(entries * scale),
+            'journal max write bytes': int(write_mb * scale * mb),
+            'journal queue max ops': int(journal_ops * scale),
+            'journal queue max bytes': int(journal_mb * mb)}
+
+
+def _write_host_vars(host_vars_dir, host_vars):
+    # Returns a dict of the written file names and whether they changed
+    if host_vars and not os.path.isdir(host_vars_dir):
+        os.makedirs(host_vars_dir)
+    outputs = {}
+    for host, contents in host_vars.iteritems():
+        file_name = os.path.join(host_vars_dir, host)
+        outputs[file_name] = _write_yml(file_name, contents)
+    _prune_host_vars(host_vars_dir, host_vars)
+    return outputs
+
+
+def _prune_host_vars(host_vars_dir, hosts):
+    # Remove the host_vars files of hosts that are no longer generated, a
+    # stale file would keep overriding the inventory of a removed host or
+    # of a changed storage address.  Returns the removed file names.
+    if not os.path.isdir(host_vars_dir):
+        return []
+    removed = []
+    for name in sorted(os.listdir(host_vars_dir)):
+        file_name = os.path.join(host_vars_dir, name)
+        if (name not in hosts and not name.startswith('.') and
+                os.path.isfile(file_name)):
+            os.remove(file_name)
+            removed.append(file_name)
+    if removed:
+        print('Removed %d stale host_vars files.' % len(removed))
+    return removed
+
+
+def _generate_template_osd_vars(template):
+    # Generate the OSD device and journal settings for one node template
+    settings = template['domain-settings']
     osd_vars = {}
-    osd_templates = _get_node_template_names_for_role(inventory, OSD_ROLE)
-    template = inventory['node-templates'][osd_templates[0]]
-    osd_vars['devices'] = template['domain-settings'][OSD_DEVICE_KEY]
+    osd_vars['devices'] = settings[OSD_DEVICE_KEY]
+
+    journal_size = hard_coded_vars['journal_size']
+    throughput = _get_osd_throughput(settings)
+    if throughput is not None:
+        journal_size = _calculate_journal_size(throughput)
+        osd_vars['journal_size'] = journal_size
 
-    if JOURNAL_DEVICE_KEY in template['domain-settings']:
+    if JOURNAL_DEVICE_KEY in settings:
         osd_vars['raw_multi_journal'] = True
         osd_vars['raw_journal_devices'] = _generate_journal_device_list(
-            template['domain-settings'][JOURNAL_DEVICE_KEY],
+            settings[JOURNAL_DEVICE_KEY],
             len(osd_vars['devices']))
+        overcommitted = _check_journal_capacity(
+            settings[JOURNAL_DEVICE_KEY], osd_vars['raw_journal_devices'],
+            journal_size)
+        if overcommitted:
+            print('The journal devices are too small for the %d MB '
+                  'journals of their OSDs:' % journal_size)
+            for message in overcommitted:
+                print('  %s' % message)
+            sys.exit(1)
     else:
         osd_vars['journal_collocation'] = True
     return osd_vars
 
 
+def _get_osd_throughput(settings):
+    # Return the expected throughput of one OSD in MB/s, or None when the
+    # domain-settings give neither the bandwidth nor the device class.
+    if OSD_BANDWIDTH_KEY in settings:
+        return float(settings[OSD_BANDWIDTH_KEY])
+    if OSD_CLASS_KEY in settings:
+        osd_class = settings[OSD_CLASS_KEY]
+        if osd_class not in OSD_CLASS_THROUGHPUT:
+            print('Unknown OSD device class %s, expected one of: %s' %
+                  (osd_class, ', '.join(sorted(OSD_CLASS_THROUGHPUT))))
+            sys.exit(1)
+        return OSD_CLASS_THROUGHPUT[osd_class]
+    return None
+
+
+def _calculate_journal_size(throughput):
+    # The journal size in MB
+    return int(math.ceil(2 * throughput * FILESTORE_MAX_SYNC_INTERVAL))
+
+
+def _check_journal_capacity(journal_devices, osd_journal_list, journal_size):
+    # Return a message for every journal device whose capacity, when
+    # given, cannot hold the journals of the OSDs assigned to it.
+    overcommitted = []
+    for journal in journal_devices:
+        if not isinstance(journal, dict) or JOURNAL_SIZE_KEY not in journal:
+            continue
+        name = _get_journal_device_name(journal)
+        capacity = float(journal[JOURNAL_SIZE_KEY]) * 1024
+        osd_count = osd_journal_list.count(name)
+        required = osd_count * journal_size
+        if required > capacity:
+            overcommitted.append('%s: %d journals need %d MB, the device '
+                                 'has %d MB' % (name, osd_count, required,
+                                                capacity))
+    return overcommitted
+
+
+def _generate_osds_vars(index):
+    # The group defaults come from the first OSD template, each OSD host
+    # also gets its own settings from _generate_osd_host_vars.
+    osd_templates = index.get_templates_for_role(OSD_ROLE)
+    return _generate_template_osd_vars(index.get_template(osd_templates[0]))
+
+
+def _generate_osd_host_vars(index):
+    # Generate the per host OSD settings keyed by the host's storage
+    # address, which is the host name used in the ceph-hosts file.  Both
+    # journal modes are set explicitly so that a host never inherits the
+    # group default journal mode of a different template.
+    host_vars = {}
+    for name in index.get_templates_for_role(OSD_ROLE):
+        osd_vars = _generate_template_osd_vars(index.get_template(name))
+        osd_vars.setdefault('raw_multi_journal', False)
+        osd_vars.setdefault('journal_collocation', False)
+        for node in index.get_template_nodes(name):
+            location = _get_crush_location(node)
+            if location:
+                host_vars[node[index.storage_addr_key]] = dict(
+                    osd_vars, crush_location=True,
+                    osd_crush_location=_format_crush_location(location))
+            else:
+                host_vars[node[index.storage_addr_key]] = osd_vars
+    return host_vars
+
+
+def _get_crush_location(node):
+    # Return the (bucket type, bucket name) list of a node above the host
+    return [(bucket_type, str(node[key]))
+            for bucket_type, key in CRUSH_LOCATION_KEYS if key in node]
+
+
+def _format_crush_location(location):
+    # The osd crush location of ceph.conf, in the quoted form used by the
+    # ceph-osd role
+    buckets = ['root=%s' % CRUSH_ROOT]
+    buckets += ['%s=%s' % bucket for bucket in location]
+    buckets.append('host={{ ansible_hostname }}')
+    return "'%s'" % ' '.join(buckets)
+
+
+def _get_failure_domains(index):
+    # Return {bucket type: number of buckets} for the OSD hosts.  A bucket
+    # type counts only when every OSD host has it.
+    hosts = 0
+    buckets = dict((bucket_type, set())
+                   for bucket_type, key in CRUSH_LOCATION_KEYS)
+    for name in index.get_templates_for_role(OSD_ROLE):
+        for node in index.get_template_nodes(name):
+            hosts += 1
+            location = _get_crush_location(node)
+            found = set()
+            for i, (bucket_type, bucket_name) in enumerate(location):
+                # Bucket names are qualified by their parent buckets
+                if bucket_type in buckets:
+                    buckets[bucket_type].add(tuple(location[:i + 1]))
+                    found.add(bucket_type)
+            for bucket_type in set(buckets) - found:
+                del buckets[bucket_type]
+    domains = dict((bucket_type, len(names))
+                   for bucket_type, names in buckets.iteritems())
+    domains[FAILURE_DOMAIN_HOST] = hosts
+    return domains
+
+
+def _choose_failure_domain(index, requested, size):
+    # Return the failure domain and a list of warnings.  Exits when the
+    # requested failure domain cannot hold size replicas.
+    domains = _get_failure_domains(index)
+    warnings = []
+    if requested != FAILURE_DOMAIN_AUTO:
+        if domains.get(requested, 0) < size:
+            print('The %s failure domain needs at least %d %ss with OSD '
+                  'hosts, the inventory has %d.  Every OSD node must give '
+                  'its %s.' % (requested, size, requested,
+                               domains.get(requested, 0), requested))
+            sys.exit(1)
+        return requested, warnings
+
+    for bucket_type, key in CRUSH_LOCATION_KEYS:
+        if domains.get(bucket_type, 0) >= size:
+            return bucket_type, warnings
+        if bucket_type in domains:
+            warnings.append('Only %d %ss have OSD hosts, %d are needed for '
+                            'the %s failure domain.' %
+                            (domains[bucket_type], bucket_type, size,
+                             bucket_type))
+    if domains[FAILURE_DOMAIN_HOST] < size:
+        warnings.append('Only %d OSD hosts for %d replicas, the replicas '
+                        'can not all be on different hosts.' %
+                        (domains[FAILURE_DOMAIN_HOST], size))
+    return FAILURE_DOMAIN_HOST, warnings
+
+
+def _generate_crush_rules(pool_names, failure_domain):
+    # One simple replicated rule per pool
+    return [{'name': '%s_%s' % (pool_name, failure_domain),
+             'pool': pool_name,
+             'root': CRUSH_ROOT,
+             'type': failure_domain}
+            for pool_name in sorted(pool_names)]
+
+
+def _get_journal_device_name(journal):
+    if isinstance(journal, dict):
+        return journal[JOURNAL_DEVICE_NAME_KEY]
+    return journal
+
+
+def _get_journal_weight(journal):
+    # Return the journal weight, or None when the journal has no weight
+    # or device class.
+    if not isinstance(journal, dict):
+        return None
+    if JOURNAL_WEIGHT_KEY in journal:
+        return float(journal[JOURNAL_WEIGHT_KEY])
+    if JOURNAL_CLASS_KEY in journal:
+        journal_class = journal[JOURNAL_CLASS_KEY]
+        if journal_class not in JOURNAL_CLASS_WEIGHTS:
+            print('Unknown journal device class %s for %s, expected one '
+                  'of: %s' % (journal_class,
+                              _get_journal_device_name(journal),
+                              ', '.join(sorted(JOURNAL_CLASS_WEIGHTS))))
+            sys.exit(1)
+        return JOURNAL_CLASS_WEIGHTS[journal_class]
+    return None
+
+
 def _generate_journal_device_list(journal_devices, osd_device_count):
+    weights = [_get_journal_weight(journal) for journal in journal_devices]
+    journal_devices = [_get_journal_device_name(journal)
+                       for journal in journal_devices]
+    if any(weight is not None for weight in weights):
+        return _generate_weighted_journal_device_list(
+            journal_devices, [1.0 if weight is None else weight
+                              for weight in weights],
+            osd_device_count)
+
     # Generate the journal device list, ensuring every OSD has a journal
     # and we account for the remainder OSDs when the number of OSDs is not
     # evenly divisible by the number of journals.
@@ -227,16 +1103,52 @@ def _generate_journal_device_list(journal_devices, osd_device_count):
     return osd_journal_list
 
 
-def _generate_hosts_file(inventory):
+def _generate_weighted_journal_device_list(journal_devices, weights,
+                                           osd_device_count):
+    # Assign OSDs to journals in proportion to the journal weights using
+    # a smooth weighted round robin.  Adjacent OSDs are interleaved across
+    # the journals so that a write burst to neighbouring OSDs does not
+    # land on a single journal device.
+    total = sum(weights)
+    current = [0.0] * len(journal_devices)
+    osd_journal_list = []
+    for x in range(osd_device_count):
+        for y in range(len(journal_devices)):
+            current[y] += weights[y]
+        best = current.index(max(current))
+        current[best] -= total
+        osd_journal_list.append(journal_devices[best])
+    return osd_journal_list
+
+
+def _generate_hosts_file(index):
     # Get monitor IPs
-    mon_ips = _get_mon_ips(inventory)
+    mon_ips = _get_mon_ips(index)
     # Get OSD IPs
-    osd_ips = _get_osd_ips(inventory)
+    osd_ips = _get_osd_ips(index)
     file_contents_list = ['[mons]'] + mon_ips + ['\n[osds]'] + osd_ips
     return '\n'.join(file_contents_list)
 
 
-def _get_openstack_pools(inventory, growth_factor, vms_percent,
+def _generate_inventory_json(index, osd_host_vars):
+    # Generate a dynamic inventory document whose _meta block holds the
+    # variables of every host, so that ansible never has to ask for the
+    # variables of a single host.
+    mon_ips = _get_mon_ips(index)
+    osd_ips = _get_osd_ips(index)
+    host_vars = {}
+    for host in mon_ips + osd_ips:
+        host_vars[host] = {'storage_address': host}
+    for host, osd_vars in osd_host_vars.iteritems():
+        host_vars[host].update(osd_vars)
+    inventory = {'mons': {'hosts': mon_ips},
+                 'osds': {'hosts': osd_ips},
+                 '_meta': {'hostvars': host_vars}}
+    return json.dumps(inventory, indent=1, separators=(',', ': '),
+                      sort_keys=True)
+
+
+def _get_openstack_pools(index, growth_factor, vms_percent,
                          images_percent, volumes_percent):
     pools = {'openstack_glance_pool': {'name': 'images',
                                        'percent_data':
@@ -249,24 +1161,120 @@ def _get_openstack_pools(inventory, growth_factor, vms_percent,
                                        },
              }
 
-    osd_count = _get_osd_count(inventory)
+    specs = _get_pool_specs(index)
+    osd_count = _get_osd_count(index)
     for pool in pools.values():
+        spec = specs.get(pool['name'], {})
+        # RBD images need a replicated pool
+        if 'k' in spec or 'percent_data' in spec:
+            print('The %s pool of OpenStack can only give its %s, the data '
+                  'percentage is set with --%s_pool_percent.' %
+                  (pool['name'], POOL_SIZE_KEY, pool['name']))
+            sys.exit(1)
+        pool['size'] = spec.get('size', PG_REPLICATION_COUNT)
         percent_data = pool.pop('percent_data')
-        pgs = _calculate_pg_count(osd_count, percent_data, growth_factor)
+        pgs = _calculate_pg_count(osd_count, percent_data, growth_factor,
+                                  pool['size'])
         pool['pg_num'] = pgs
+        pool['pgp_num'] = pgs
+    return pools
+
+
+def _get_pool_specs(index):
+    # Return {pool name: spec} from the ceph-pools section of the
+    # inventory.  The spec of a replicated pool holds its 'size', the spec
+    # of an erasure coded pool its 'k' and 'm', and both hold
+    # 'percent_data' when the pool gives percent-data.
+    specs = {}
+    for name, settings in (index.inventory.get(POOLS_KEY) or {}).iteritems():
+        settings = settings or {}
+        spec = {}
+        if POOL_PERCENT_KEY in settings:
+            percent = settings[POOL_PERCENT_KEY]
+            if (not isinstance(percent, (int, float)) or
+                    isinstance(percent, bool) or not 0 < percent <= 100):
+                print('The %s of the %s pool must be a number greater than '
+                      '0 and at most 100.' % (POOL_PERCENT_KEY, name))
+                sys.exit(1)
+            spec['percent_data'] = percent / 100.0
+        erasure_code = settings.get(POOL_ERASURE_CODE_KEY)
+        if erasure_code is not None:
+            k = erasure_code.get('k') if isinstance(erasure_code,
+                                                    dict) else None
+            m = erasure_code.get('m') if isinstance(erasure_code,
+                                                    dict) else None
+            if (POOL_SIZE_KEY in settings or not isinstance(k, int) or
+                    not isinstance(m, int) or k < 2 or m < 1):
+                print('The %s of the %s pool must give k >= 2 and m >= 1, '
+                      'and the pool can not also give a %s.' %
+                      (POOL_ERASURE_CODE_KEY, name, POOL_SIZE_KEY))
+                sys.exit(1)
+            spec['k'] = k
+            spec['m'] = m
+        else:
+            size = settings.get(POOL_SIZE_KEY, PG_REPLICATION_COUNT)
+            if not isinstance(size, int) or size < 1:
+                print('The %s of the %s pool must be a positive integer.' %
+                      (POOL_SIZE_KEY, name))
+                sys.exit(1)
+            spec['size'] = size
+        specs[name] = spec
+    return specs
+
+
+def _get_pool_width(pool):
+    # The number of OSDs a PG of the pool is stored on
+    if 'k' in pool:
+        return pool['k'] + pool['m']
+    return pool['size']
+
+
+def _get_ceph_pools(index, growth_factor):
+    # Return the pools of the ceph-pools section other than the OpenStack
+    # pools, sorted by name
+    pools = []
+    specs = _get_pool_specs(index)
+    osd_count = None
+    for name in sorted(set(specs) - set(OPENSTACK_POOL_NAMES.values())):
+        spec = specs[name]
+        if 'percent_data' not in spec:
+            print('The %s pool must give its %s.' % (name, POOL_PERCENT_KEY))
+            sys.exit(1)
+        if osd_count is None:
+            osd_count = _get_osd_count(index)
+        pgs = _calculate_pg_count(osd_count, spec['percent_data'],
+                                  growth_factor, _get_pool_width(spec))
+        pool = {'name': name, 'pg_num': pgs, 'pgp_num': pgs}
+        if 'k' in spec:
+            pool['k'] = spec['k']
+            pool['m'] = spec['m']
+            pool['erasure_code_profile'] = '%s_profile' % name
+        else:
+            pool['size'] = spec['size']
+        pools.append(pool)
     return pools
 
 
-def _calculate_pg_count(osd_count, percent_data, growth_factor):
+def _generate_erasure_code_profiles(pools, failure_domain):
+    # One erasure code profile per erasure coded pool
+    return [{'name': pool['erasure_code_profile'],
+             'k': pool['k'],
+             'm': pool['m'],
+             'failure_domain': failure_domain}
+            for pool in pools if 'erasure_code_profile' in pool]
+
+
+def _calculate_pg_count(osd_count, percent_data, growth_factor,
+                        size=PG_REPLICATION_COUNT):
     # PG calc formula from http://ceph.com/pgcalc/
 
-    # This is the 'size' value in the calcs.
-    replication_count = 3
+    # This is the 'size' value in the calcs, k + m for erasure coded pools.
+    replication_count = size
 
     def nearest_power_of_2(value):
         # If the nearest power of 2 is more than 25% below the
         # original value, the next higher power of 2 is used.
-        threshold = .25
+        threshold = PG_POW2_THRESHOLD
         nearest = math.pow(2, round(math.log(value) / math.log(2)))
         if nearest < (value * (1 - threshold)):
             nearest = nearest * 2
@@ -289,12 +1297,173 @@ def _calculate_pg_count(osd_count, percent_data, growth_factor):
     return int(pg_count)
 
 
-def _get_osd_count(inventory):
-    osd_templates = _get_node_template_names_for_role(inventory, OSD_ROLE)
-    ceph_osd_tmpl = inventory['node-templates'][osd_templates[0]]
-    domain_settings = ceph_osd_tmpl['domain-settings']
-    osd_nodes = _get_nodes_for_role(inventory, OSD_ROLE, osd_templates)
-    count = len(domain_settings[OSD_DEVICE_KEY]) * len(osd_nodes)
+def _nearest_power_of_2_array(values):
+    # Element wise form of nearest_power_of_2 in _calculate_pg_count
+    nearest = numpy.power(2.0, numpy.round(numpy.log(values) / numpy.log(2)))
+    return numpy.where(nearest < (values * (1 - PG_POW2_THRESHOLD)),
+                       nearest * 2, nearest)
+
+
+def _calculate_pg_count_grid(osd_counts, percents, growth_factors,
+                             sizes=None):
+    # Batched form of _calculate_pg_count.  sizes holds the size, or k + m,
+    # of the pool of every percentage.  The result is an integer array
+    # shaped (osd_counts, growth_factors, percents).
+    osds = numpy.asarray(osd_counts, dtype=float).reshape(-1, 1, 1)
+    growth = numpy.asarray(growth_factors, dtype=float).reshape(1, -1, 1)
+    percent_data = numpy.asarray(percents, dtype=float).reshape(1, 1, -1)
+    if sizes is None:
+        sizes = [PG_REPLICATION_COUNT] * percent_data.size
+    size = numpy.asarray(sizes, dtype=float).reshape(1, 1, -1)
+
+    numerator = growth * osds * percent_data
+    pg_before_pow2 = numpy.maximum(numpy.floor(numerator / size), 1)
+    pg_count = _nearest_power_of_2_array(pg_before_pow2)
+    min_calc = _nearest_power_of_2_array(numpy.floor(osds / size) + 1)
+    return numpy.maximum(pg_count, min_calc).astype(numpy.int64)
+
+
+def _generate_pg_sweep(osd_counts, growth_factors, pool_splits,
+                       pool_sizes=None):
+    # Compute pg_num for the vms, images and volumes pools over every
+    # combination of OSD count, growth factor and (vms, images, volumes)
+    # percentage split.  pool_sizes is the (vms, images, volumes) tuple of
+    # the pool sizes.  Returns the report as a list of columns, in the
+    # order of PG_SWEEP_COLUMNS, with one entry per point.
+    if pool_sizes is None:
+        pool_sizes = (PG_REPLICATION_COUNT,) * 3
+    if numpy is None:
+        return _generate_pg_sweep_serial(osd_counts, growth_factors,
+                                         pool_splits, pool_sizes)
+
+    splits = numpy.asarray(pool_splits, dtype=numpy.int64).reshape(-1, 3)
+    pgs = _calculate_pg_count_grid(osd_counts, splits.ravel() / 100.0,
+                                   growth_factors,
+                                   list(pool_sizes) * len(splits))
+    pgs = pgs.reshape(-1, 3)
+    osds, growth, split = numpy.meshgrid(
+        numpy.asarray(osd_counts, dtype=numpy.int64),
+        numpy.asarray(growth_factors, dtype=numpy.int64),
+        numpy.arange(len(splits)), indexing='ij')
+    osds = osds.ravel()
+    split = split.ravel()
+    pgs_per_osd = ((pgs * numpy.asarray(pool_sizes)).sum(axis=1) /
+                   osds.astype(float))
+    return ([osds, growth.ravel()] +
+            [splits[split, i] for i in range(3)] +
+            [pgs[:, i] for i in range(3)] +
+            [numpy.round(pgs_per_osd, 2)])
+
+
+def _generate_pg_sweep_serial(osd_counts, growth_factors, pool_splits,
+                              pool_sizes):
+    rows = []
+    for osd_count in osd_counts:
+        for growth_factor in growth_factors:
+            for split in pool_splits:
+                pgs = [_calculate_pg_count(osd_count, percent / 100.0,
+                                           growth_factor, size)
+                       for percent, size in zip(split, pool_sizes)]
+                pgs_per_osd = round(
+                    sum(pg * size for pg, size in zip(pgs, pool_sizes)) /
+                    float(osd_count), 2)
+                rows.append([osd_count, growth_factor] + list(split) + pgs +
+                            [pgs_per_osd])
+    return [list(column) for column in zip(*rows)]
+
+
+def _write_pg_sweep(stream, columns, output_format):
+    # Convert numpy columns to lists once, both the csv writer and the
+    # json encoder are much faster on plain lists.
+    values = [column.tolist() if hasattr(column, 'tolist') else column
+              for column in columns]
+    if output_format == 'json':
+        # Column oriented so that large reports stay compact.  json.dumps
+        # is used since json.dump encodes in pure python chunk by chunk.
+        stream.write(json.dumps({'columns': PG_SWEEP_COLUMNS,
+                                 'values': values}))
+        stream.write('\n')
+    else:
+        writer = csv.writer(stream, lineterminator='\n')
+        writer.writerow(PG_SWEEP_COLUMNS)
+        writer.writerows(zip(*values))
+
+
+def _parse_int_list(value):
+    # Parse a comma separated list of integers and inclusive
+    # start:stop[:step] ranges, e.g. "12:48:12,100"
+    values = []
+    try:
+        for item in value.split(','):
+            bounds = [int(x) for x in item.split(':')]
+            if len(bounds) == 1:
+                values.extend(bounds)
+            elif len(bounds) in (2, 3):
+                step = bounds[2] if len(bounds) == 3 else 1
+                values.extend(range(bounds[0], bounds[1] + 1, step))
+            else:
+                raise ValueError(item)
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid integer list: %s' % value)
+    if not values or min(values) <= 0:
+        raise argparse.ArgumentTypeError('values must be positive: %s' %
+                                         value)
+    return values
+
+
+def _parse_pool_splits(value):
+    # Parse a comma separated list of vms/images/volumes percentages,
+    # e.g. "25/15/60,40/10/50"
+    splits = []
+    try:
+        for item in value.split(','):
+            split = tuple(int(x) for x in item.split('/'))
+            if len(split) != 3:
+                raise ValueError(item)
+            splits.append(split)
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid pool percentages: %s' %
+                                         value)
+    return splits
+
+
+def _parse_pool_sizes(value):
+    # Parse the vms/images/volumes pool sizes, e.g. "3/3/2"
+    try:
+        sizes = tuple(int(x) for x in value.split('/'))
+    except ValueError:
+        sizes = ()
+    if len(sizes) != 3 or min(sizes) < 1:
+        raise argparse.ArgumentTypeError('invalid pool sizes: %s' % value)
+    return sizes
+
+
+def _get_openstack_pool_sizes(index):
+    # Return the (vms, images, volumes) sizes of the ceph-pools section
+    specs = _get_pool_specs(index)
+    return tuple(specs.get(name, {}).get('size', PG_REPLICATION_COUNT)
+                 for name in ('vms', 'images', 'volumes'))
+
+
+def run_pg_sweep(output_file, osd_counts, growth_factors, pool_splits,
+                 output_format, pool_sizes=None):
+    columns = _generate_pg_sweep(osd_counts, growth_factors, pool_splits,
+                                 pool_sizes)
+    if output_file == '-':
+        _write_pg_sweep(sys.stdout, columns, output_format)
+    else:
+        with open(output_file, 'w') as stream:
+            _write_pg_sweep(stream, columns, output_format)
+
+
+def _get_osd_count(index):
+    # Sum the devices of every OSD template since the templates may
+    # describe different hardware.
+    count = 0
+    for name in index.get_templates_for_role(OSD_ROLE):
+        domain_settings = index.get_template(name)['domain-settings']
+        count += (len(domain_settings[OSD_DEVICE_KEY]) *
+                  len(index.get_template_nodes(name)))
     return count
 
 
@@ -307,14 +1476,16 @@ def main():
 
     parser.add_argument('--inventory',
                         dest='inventory_file',
-                        required=True,
-                        help='The path to the inventory file.')
+                        required=False,
+                        help=('The path to the inventory file. Required '
+                              'unless --pg_sweep is specified.'))
 
     parser.add_argument('--output_directory',
                         dest='output_root',
-                        required=True,
+                        required=False,
                         help=('The root path of the output directory.'
-                              ' This is typically the root of ceph-ansible.'))
+                              ' This is typically the root of ceph-ansible.'
+                              '\nRequired unless --pg_sweep is specified.'))
 
     growth_factor_help = (
         'An integer factor of how much the Ceph cluster is expected to grow '
@@ -371,6 +1542,106 @@ def main():
                                        'Ceph Standalone'))
     parser.set_defaults(openstack_config=True)
 
+    inventory_format_help = (
+        'The format of the generated ceph-hosts inventory.\n'
+        'ini  - a static inventory of the host addresses, the OSD settings\n'
+        '       of every host are written to host_vars (the default)\n'
+        'json - a dynamic inventory script reading ceph-hosts.json, which\n'
+        '       holds the groups and the variables of every host')
+    parser.add_argument('--inventory_format',
+                        dest='inventory_format',
+                        choices=[INVENTORY_FORMAT_INI, INVENTORY_FORMAT_JSON],
+                        default=INVENTORY_FORMAT_INI,
+                        help=inventory_format_help)
+
+    pg_sweep_help = (
+        'Instead of generating the ceph-ansible input files, report the\n'
+        'pg_num of the vms, images and volumes pools and the resulting PGs\n'
+        'per OSD for every combination of the --sweep_osd_counts,\n'
+        '--sweep_growth_factors and --sweep_pool_percents values.')
+    parser.add_argument('--pg_sweep', '--pg-sweep',
+                        dest='pg_sweep',
+                        action='store_true',
+                        help=pg_sweep_help)
+    parser.add_argument('--sweep_osd_counts',
+                        dest='sweep_osd_counts',
+                        type=_parse_int_list,
+                        default='12:5000',
+                        help=('Comma separated OSD counts and inclusive '
+                              'start:stop[:step] ranges.\n'
+                              'Example: 12:5000 (the default)'))
+    parser.add_argument('--sweep_growth_factors',
+                        dest='sweep_growth_factors',
+                        type=_parse_int_list,
+                        default='100,200,300',
+                        help=('Comma separated growth factors and ranges.\n'
+                              'Example: 100,200,300 (the default)'))
+    parser.add_argument('--sweep_pool_percents',
+                        dest='sweep_pool_percents',
+                        type=_parse_pool_splits,
+                        help=('Comma separated vms/images/volumes pool '
+                              'percentages.\n'
+                              'Example: 25/15/60,40/10/50\n'
+                              'Defaults to the --*_pool_percent values.'))
+    parser.add_argument('--sweep_pool_sizes',
+                        dest='sweep_pool_sizes',
+                        type=_parse_pool_sizes,
+                        help=('The vms/images/volumes pool sizes.\n'
+                              'Example: 3/3/2\n'
+                              'Defaults to the sizes of the ceph-pools '
+                              'section of --inventory,\n'
+                              'or %d.' % PG_REPLICATION_COUNT))
+    parser.add_argument('--sweep_format',
+                        dest='sweep_format',
+                        choices=['csv', 'json'],
+                        default='csv',
+                        help='The format of the report. Default: csv')
+    parser.add_argument('--sweep_output',
+                        dest='sweep_output',
+                        default='-',
+                        help=('The file to write the report to. '
+                              'Default: standard output'))
+
+    tuning_profile_help = (
+        'Add a ceph_conf_overrides osd section tuned for the OSD hardware\n'
+        'to the all group variables.  The hardware is read from the\n'
+        'osd-devices, osd-device-class, journal-devices, cpu-cores and\n'
+        'memory-gb domain-settings of the OSD node templates.\n'
+        'throughput - more op threads and deep queues\n'
+        'latency    - shallow queues to bound the queueing delay')
+    parser.add_argument('--tuning_profile',
+                        dest='tuning_profile',
+                        choices=sorted(TUNING_PROFILES),
+                        help=tuning_profile_help)
+    failure_domain_help = (
+        'The CRUSH failure domain of the OpenStack pools.  With auto, the\n'
+        'default, the widest of row, rack and chassis with enough buckets\n'
+        'for the replicas is used, from the row-id, rack-id and chassis-id\n'
+        'of the OSD nodes, otherwise host.')
+    parser.add_argument('--failure_domain',
+                        dest='failure_domain',
+                        choices=([FAILURE_DOMAIN_AUTO] +
+                                 [t for t, k in CRUSH_LOCATION_KEYS] +
+                                 [FAILURE_DOMAIN_HOST]),
+                        default=FAILURE_DOMAIN_AUTO,
+                        help=failure_domain_help)
+    parser.add_argument('--profile',
+                        dest='profile_file',
+                        help=('Write the wall clock time of every phase of '
+                              'the generation\nand the peak memory of the '
+                              'run to this JSON file.'))
+    parser.add_argument('-v', '--verbose',
+                        dest='verbose',
+                        action='store_true',
+                        help='List every updated file.')
+    parser.add_argument('--no-cache', '--no_cache',
+                        dest='use_cache',
+                        action='store_false',
+                        help=('Always generate the files, instead of using '
+                              'the outputs\ncached in %s under the output '
+                              'directory by a\nprevious run with the same '
+                              'inventory and parameters.' % CACHE_DIR))
+
     # Handle error cases before attempting to parse
     # a command off the command line
     if len(sys.argv) == 1:
@@ -378,9 +1649,32 @@ def main():
         sys.exit(1)
     args = parser.parse_args()
 
+    if args.pg_sweep:
+        pool_splits = args.sweep_pool_percents
+        if not pool_splits:
+            pool_splits = [(args.vms_pool_percent, args.images_pool_percent,
+                            args.volumes_pool_percent)]
+        pool_sizes = args.sweep_pool_sizes
+        if not pool_sizes and args.inventory_file:
+            pool_sizes = _get_openstack_pool_sizes(
+                InventoryIndex(_load_yml(args.inventory_file)))
+        run_pg_sweep(args.sweep_output, args.sweep_osd_counts,
+                     args.sweep_growth_factors, pool_splits,
+                     args.sweep_format, pool_sizes)
+        return
+
+    if not args.inventory_file or not args.output_root:
+        parser.error('--inventory and --output_directory are required')
+
+    profiler = Profiler()
     generate_files(args.output_root, args.inventory_file, args.growth_factor,
                    args.vms_pool_percent, args.images_pool_percent,
-                   args.volumes_pool_percent, args.openstack_config)
+                   args.volumes_pool_percent, args.openstack_config,
+                   args.inventory_format, args.use_cache,
+                   args.tuning_profile, args.failure_domain, profiler,
+                   args.verbose)
+    if args.profile_file:
+        profiler.write(args.profile_file)
 
 if __name__ == "__main__":
     main()
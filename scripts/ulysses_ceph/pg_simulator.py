@@ -0,0 +1,255 @@
+#!/usr/bin/python
+
+# Copyright 2017 IBM US, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Offline simulation of how the pools generated by
+# generate_ceph_ansible_input.py spread their PGs across the OSDs.  The
+# OpenStack pools and the pools of the ceph-pools inventory section are
+# placed with their own replica count, or k + m chunks.
+#
+# PGs are placed with a CRUSH like straw2 model: every replica of a PG
+# first picks a host, hosts already used by the PG are excluded, then
+# picks an OSD within that host.  Each pick draws ln(hash) / weight for
+# every candidate and keeps the largest draw, which is the straw2
+# selection rule.  All draws for a batch of PGs are computed at once.
+
+import argparse
+import json
+import sys
+
+import numpy
+
+import generate_ceph_ansible_input as generator
+
+
+# Upper bound on the number of draws computed in one batch
+MAX_BATCH_DRAWS = 4 * 1024 * 1024
+
+_HASH_MULT = numpy.uint64(0xbf58476d1ce4e5b9)
+_HASH_MULT2 = numpy.uint64(0x94d049bb133111eb)
+_HASH_SEED = numpy.uint64(0x9e3779b97f4a7c15)
+
+
+def _mix(value):
+    # splitmix64 finalizer
+    with numpy.errstate(over='ignore'):
+        value = value ^ (value >> numpy.uint64(30))
+        value = value * _HASH_MULT
+        value = value ^ (value >> numpy.uint64(27))
+        value = value * _HASH_MULT2
+        return value ^ (value >> numpy.uint64(31))
+
+
+def _hash(*keys):
+    # Mix the (broadcast) integer keys into uniform 64 bit values
+    value = _HASH_SEED
+    for key in keys:
+        value = _mix(value ^ numpy.asarray(key).astype(numpy.uint64))
+    return value
+
+
+def _straw2_draws(pg_keys, item_keys, weights):
+    # ln(u) / weight for every (pg, item) pair, u uniform in (0, 1].
+    # Only one mix round is done on the (pg, item) matrix, the pg and
+    # item keys are hashed beforehand.
+    hashed = _mix(pg_keys[:, numpy.newaxis] ^ item_keys)
+    u = ((hashed >> numpy.uint64(11)).astype(float) + 1) / float(2 ** 53)
+    return numpy.log(u) / weights
+
+
+def get_osd_layout(index):
+    # Return the OSD hosts and their OSD counts from the inventory, each
+    # host uses the osd-devices of its own node template.
+    hosts = []
+    osd_counts = []
+    for name in index.get_templates_for_role(generator.OSD_ROLE):
+        settings = index.get_template(name)['domain-settings']
+        device_count = len(settings[generator.OSD_DEVICE_KEY])
+        for node in index.get_template_nodes(name):
+            hosts.append(node.get('hostname', node[index.storage_addr_key]))
+            osd_counts.append(device_count)
+    return hosts, osd_counts
+
+
+class Placement(object):
+    """PG replica placement over a host / OSD hierarchy."""
+
+    def __init__(self, osd_counts, size=generator.PG_REPLICATION_COUNT):
+        super(Placement, self).__init__()
+        self.osd_counts = numpy.asarray(osd_counts, dtype=numpy.int64)
+        self.host_count = len(self.osd_counts)
+        self.osd_count = int(self.osd_counts.sum())
+        # The default pool size, replicas are placed on distinct hosts
+        self.size = self.pool_size(size)
+        # Host weights are the number of OSDs, each OSD has weight 1
+        self.host_weights = self.osd_counts.astype(float)
+        self.first_osd = numpy.concatenate(
+            ([0], numpy.cumsum(self.osd_counts)[:-1]))
+        max_osds = int(self.osd_counts.max())
+        self.osd_slots = numpy.arange(max_osds)
+
+    def pool_size(self, size):
+        # The number of replicas, or chunks, that fit on distinct hosts
+        return min(size, self.host_count)
+
+    def place(self, pool_id, pg_count, size=None):
+        # Return a (pg_count, size) array of the OSD ids of every replica
+        size = self.size if size is None else self.pool_size(size)
+        result = numpy.empty((pg_count, size), dtype=numpy.int64)
+        width = max(self.host_count, len(self.osd_slots))
+        batch = max(1, MAX_BATCH_DRAWS // width)
+        # Like CRUSH, buckets use negative ids so that host and OSD draws
+        # are independent.
+        host_keys = _hash(-1 - numpy.arange(self.host_count))
+        osd_keys = _hash(numpy.arange(self.osd_count + len(self.osd_slots)))
+        for start in range(0, pg_count, batch):
+            pgs = numpy.arange(start, min(start + batch, pg_count))
+            rows = numpy.arange(len(pgs))
+            used = numpy.zeros((len(pgs), self.host_count), dtype=bool)
+            for replica in range(size):
+                pg_keys = _hash(pool_id, pgs, replica)
+                draws = _straw2_draws(pg_keys, host_keys, self.host_weights)
+                draws[used] = -numpy.inf
+                host = draws.argmax(axis=1)
+                used[rows, host] = True
+
+                # Now pick the OSD within the chosen host
+                osd_ids = (self.first_osd[host][:, numpy.newaxis] +
+                           self.osd_slots)
+                draws = _straw2_draws(pg_keys, osd_keys[osd_ids], 1.0)
+                valid = (self.osd_slots <
+                         self.osd_counts[host][:, numpy.newaxis])
+                draws[~valid] = -numpy.inf
+                result[start:start + len(pgs), replica] = osd_ids[
+                    rows, draws.argmax(axis=1)]
+        return result
+
+
+def simulate(osd_counts, pools):
+    # pools is a list of (name, pg_num, percent_data, size) tuples, size
+    # is the replica count or the k + m chunks of the pool and
+    # percent_data the share of the data stored by every replica or
+    # chunk.  Returns the PG replica count and the share of the data
+    # stored per OSD.
+    placement = Placement(osd_counts)
+    pg_counts = numpy.zeros(placement.osd_count, dtype=numpy.int64)
+    data = numpy.zeros(placement.osd_count)
+    for pool_id, (name, pg_num, percent_data, size) in enumerate(pools):
+        osds = placement.place(pool_id, pg_num, size).ravel()
+        pool_pgs = numpy.bincount(osds, minlength=placement.osd_count)
+        pg_counts += pool_pgs
+        data += pool_pgs * (float(percent_data) / pg_num)
+    return pg_counts, data
+
+
+def score(hosts, osd_counts, pools):
+    pg_counts, data = simulate(osd_counts, pools)
+    host_of_osd = numpy.repeat(numpy.arange(len(hosts)), osd_counts)
+    fullest = int(data.argmax())
+    mean_data = data.mean()
+    return {'pools': dict((pool[0], pool[1]) for pool in pools),
+            'host_count': len(hosts),
+            'osd_count': len(pg_counts),
+            'sizes': dict((pool[0], min(pool[3], len(hosts)))
+                          for pool in pools),
+            'pgs_per_osd': {'mean': round(float(pg_counts.mean()), 2),
+                            'stddev': round(float(pg_counts.std()), 2),
+                            'min': int(pg_counts.min()),
+                            'max': int(pg_counts.max())},
+            'fullest_osd': {'osd': fullest,
+                            'host': hosts[host_of_osd[fullest]],
+                            'pgs': int(pg_counts[fullest]),
+                            'data_vs_mean': round(float(data[fullest] /
+                                                        mean_data), 3)},
+            'osd_pgs': pg_counts.tolist()}
+
+
+def simulate_inventory(inventory, growth_factor, vms_percent,
+                       images_percent, volumes_percent):
+    index = generator.InventoryIndex(inventory)
+    hosts, osd_counts = get_osd_layout(index)
+    if not hosts:
+        print('The inventory has no %s nodes to place the PGs on.' %
+              generator.OSD_ROLE)
+        sys.exit(1)
+    pools = generator._get_openstack_pools(index, growth_factor,
+                                           vms_percent, images_percent,
+                                           volumes_percent)
+    percents = {'vms': vms_percent / 100.0, 'images': images_percent / 100.0,
+                'volumes': volumes_percent / 100.0}
+    pool_list = [(pool['name'], pool['pg_num'], percents[pool['name']],
+                  pool['size'])
+                 for key, pool in sorted(pools.items())]
+    specs = generator._get_pool_specs(index)
+    for pool in generator._get_ceph_pools(index, growth_factor):
+        percent_data = specs[pool['name']]['percent_data']
+        if 'k' in pool:
+            # Every chunk stores 1 / k of the data of its PG
+            percent_data /= pool['k']
+        pool_list.append((pool['name'], pool['pg_num'], percent_data,
+                          generator._get_pool_width(pool)))
+    return score(hosts, osd_counts, pool_list)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=('Simulate the PG to OSD distribution of the pools '
+                     'generated from an inventory file.'),
+        formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--inventory',
+                        dest='inventory_file',
+                        required=True,
+                        help='The path to the inventory file.')
+    parser.add_argument('--growth_factor',
+                        dest='growth_factor',
+                        type=int,
+                        default=100,
+                        help='See generate_ceph_ansible_input.py')
+    parser.add_argument('--vms_pool_percent',
+                        dest='vms_pool_percent',
+                        type=int,
+                        default=25,
+                        help='See generate_ceph_ansible_input.py')
+    parser.add_argument('--images_pool_percent',
+                        dest='images_pool_percent',
+                        type=int,
+                        default=15,
+                        help='See generate_ceph_ansible_input.py')
+    parser.add_argument('--volumes_pool_percent',
+                        dest='volumes_pool_percent',
+                        type=int,
+                        default=60,
+                        help='See generate_ceph_ansible_input.py')
+    parser.add_argument('--per_osd',
+                        dest='per_osd',
+                        action='store_true',
+                        help='Include the PG count of every OSD.')
+
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(1)
+    args = parser.parse_args()
+
+    inventory = generator._load_yml(args.inventory_file)
+    report = simulate_inventory(inventory, args.growth_factor,
+                                args.vms_pool_percent,
+                                args.images_pool_percent,
+                                args.volumes_pool_percent)
+    if not args.per_osd:
+        del report['osd_pgs']
+    print(json.dumps(report, indent=4, sort_keys=True))
+
+if __name__ == "__main__":
+    main()
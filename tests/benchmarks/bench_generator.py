@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+#
+# Copyright 2017 IBM US, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Scale benchmarks for generate_ceph_ansible_input.py.
+
+Every inventory size runs in its own process so that the peak memory
+(maximum resident set size) is measured per size.  The phases mirror
+generate_files: load, vars, osds, hosts and write, followed by a full
+generate_files run into a fresh directory and a re-run with no changes.
+
+Usage:
+    python -m tests.benchmarks.bench_generator [--sizes 10,100,...]
+        [--save] [--compare] [--tolerance 1.5]
+
+--save stores the results as the baseline, --compare reports the ratio to
+the baseline and fails when a measurement regressed beyond the tolerance.
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import yaml
+
+from tests.benchmarks import synthetic
+
+TOP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..')
+sys.path.append(os.path.join(TOP_DIR, 'scripts/ulysses_ceph'))
+
+import generate_ceph_ansible_input as generator
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'baseline.json')
+DEFAULT_SIZES = [10, 100, 1000, 5000, 20000]
+PHASES = ['load', 'vars', 'osds', 'hosts', 'write', 'generate_files',
+          'generate_files_unchanged']
+# Time differences below this many seconds are treated as noise
+MIN_SECONDS = 0.05
+
+
+def _max_rss_kb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+@contextlib.contextmanager
+def _quiet():
+    saved = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        yield
+    finally:
+        sys.stdout.close()
+        sys.stdout = saved
+
+
+class _Timer(object):
+
+    def __init__(self):
+        super(_Timer, self).__init__()
+        self.results = {}
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        rss = _max_rss_kb()
+        start = time.time()
+        yield
+        self.results[name] = {'seconds': round(time.time() - start, 4),
+                              'peak_rss_growth_kb': _max_rss_kb() - rss}
+
+
+def _make_output_dir(root):
+    os.makedirs(os.path.join(root, 'group_vars'))
+    return root
+
+
+def _run_size(node_count, tmp_dir):
+    inventory_file = os.path.join(tmp_dir, 'inventory.yml')
+    with open(inventory_file, 'w') as stream:
+        yaml.dump(synthetic.make_inventory(node_count), stream,
+                  Dumper=generator.YamlDumper, default_flow_style=False)
+    args = (100, 25, 15, 60, True)
+    timer = _Timer()
+
+    with timer.phase('load'):
+        index = generator.InventoryIndex(generator._load_yml(inventory_file))
+    with timer.phase('vars'):
+        all_vars = generator._generate_all_vars(index, *args)
+    with timer.phase('osds'):
+        osd_vars = generator._generate_osds_vars(index)
+        osd_host_vars = generator._generate_osd_host_vars(index)
+    with timer.phase('hosts'):
+        hosts_contents = generator._generate_hosts_file(index)
+    root = _make_output_dir(os.path.join(tmp_dir, 'phases'))
+    with timer.phase('write'):
+        generator._write_yml(os.path.join(root, 'group_vars', 'all'),
+                             all_vars)
+        generator._write_yml(os.path.join(root, 'group_vars', 'osds'),
+                             osd_vars)
+        generator._write_host_vars(os.path.join(root, 'host_vars'),
+                                   osd_host_vars)
+        generator._write_string(os.path.join(root, 'ceph-hosts'),
+                                hosts_contents)
+
+    root = _make_output_dir(os.path.join(tmp_dir, 'full'))
+    with _quiet():
+        with timer.phase('generate_files'):
+            generator.generate_files(root, inventory_file, *args)
+        with timer.phase('generate_files_unchanged'):
+            generator.generate_files(root, inventory_file, *args)
+
+    results = timer.results
+    results['peak_rss_kb'] = _max_rss_kb()
+    results['inventory_bytes'] = os.path.getsize(inventory_file)
+    return results
+
+
+def _run_size_process(node_count, queue):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        queue.put(_run_size(node_count, tmp_dir))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def run(sizes):
+    results = {}
+    for node_count in sizes:
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=_run_size_process,
+                                          args=(node_count, queue))
+        process.start()
+        results[str(node_count)] = queue.get()
+        process.join()
+    return {'libyaml': yaml.__with_libyaml__,
+            'python': sys.version.split()[0],
+            'sizes': results}
+
+
+def print_results(results, baseline=None):
+    print('%8s %-26s %10s %10s %14s' % (
+        'nodes', 'phase', 'seconds', 'baseline', 'rss growth kB'))
+    for size in sorted(results['sizes'], key=int):
+        result = results['sizes'][size]
+        base = (baseline or {}).get('sizes', {}).get(size, {})
+        for phase in PHASES:
+            base_seconds = base.get(phase, {}).get('seconds')
+            print('%8s %-26s %10.3f %10s %14d' % (
+                size, phase, result[phase]['seconds'],
+                '-' if base_seconds is None else '%.3f' % base_seconds,
+                result[phase]['peak_rss_growth_kb']))
+        print('%8s %-26s %10s %10s %14d' % (
+            size, 'peak rss kB', '', '', result['peak_rss_kb']))
+
+
+def find_regressions(results, baseline, tolerance):
+    regressions = []
+    for size, result in results['sizes'].items():
+        base = baseline.get('sizes', {}).get(size)
+        if not base:
+            continue
+        for phase in PHASES:
+            seconds = result[phase]['seconds']
+            base_seconds = base[phase]['seconds']
+            if (seconds - base_seconds > MIN_SECONDS and
+                    seconds > base_seconds * tolerance):
+                regressions.append('%s nodes %s: %.3fs, baseline %.3fs' %
+                                   (size, phase, seconds, base_seconds))
+        if result['peak_rss_kb'] > base['peak_rss_kb'] * tolerance:
+            regressions.append('%s nodes peak rss: %dkB, baseline %dkB' %
+                               (size, result['peak_rss_kb'],
+                                base['peak_rss_kb']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark generate_ceph_ansible_input.py at scale.')
+    parser.add_argument('--sizes',
+                        default=','.join(str(s) for s in DEFAULT_SIZES),
+                        help='Comma separated OSD node counts.')
+    parser.add_argument('--save', action='store_true',
+                        help='Save the results as the baseline.')
+    parser.add_argument('--compare', action='store_true',
+                        help='Fail when the results regressed against the '
+                             'baseline.')
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help='Allowed ratio to the baseline. Default: 1.5')
+    args = parser.parse_args()
+
+    results = run([int(size) for size in args.sizes.split(',')])
+    baseline = None
+    if os.path.isfile(BASELINE_FILE):
+        with open(BASELINE_FILE, 'r') as stream:
+            baseline = json.load(stream)
+    print_results(results, baseline)
+
+    if args.save:
+        with open(BASELINE_FILE, 'w') as stream:
+            json.dump(results, stream, indent=2, sort_keys=True)
+            stream.write('\n')
+        print('Baseline saved to %s' % BASELINE_FILE)
+    if args.compare and baseline:
+        regressions = find_regressions(results, baseline, args.tolerance)
+        for regression in regressions:
+            print('REGRESSION: %s' % regression)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
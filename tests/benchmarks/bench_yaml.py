@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+#
+# Copyright 2017 IBM US, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare the pure Python and libyaml loaders and dumpers.
+
+Usage: python -m tests.benchmarks.bench_yaml [node_count ...]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import yaml
+
+from tests.benchmarks import synthetic
+
+
+def _time(func, *args):
+    start = time.time()
+    func(*args)
+    return time.time() - start
+
+
+def _load(name, loader):
+    with open(name, 'r') as stream:
+        return yaml.load(stream, Loader=loader)
+
+
+def _dump(name, contents, dumper):
+    with open(name, 'w') as stream:
+        yaml.dump(contents, stream, Dumper=dumper,
+                  default_flow_style=False, width=1000)
+
+
+def run(node_counts):
+    if not yaml.__with_libyaml__:
+        print('PyYAML was built without libyaml, nothing to compare.')
+        return 1
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        print('%8s %12s %12s %12s %12s' % ('nodes', 'load', 'cload',
+                                           'dump', 'cdump'))
+        for count in node_counts:
+            inventory = synthetic.make_inventory(count)
+            name = os.path.join(tmp_dir, 'inventory-%d.yml' % count)
+            _dump(name, inventory, yaml.CSafeDumper)
+            out = os.path.join(tmp_dir, 'out.yml')
+            print('%8d %11.3fs %11.3fs %11.3fs %11.3fs' % (
+                count,
+                _time(_load, name, yaml.SafeLoader),
+                _time(_load, name, yaml.CSafeLoader),
+                _time(_dump, out, inventory, yaml.SafeDumper),
+                _time(_dump, out, inventory, yaml.CSafeDumper)))
+    finally:
+        shutil.rmtree(tmp_dir)
+    return 0
+
+
+def main():
+    counts = [int(c) for c in sys.argv[1:]] or [100, 1000, 5000]
+    sys.exit(run(counts))
+
+if __name__ == "__main__":
+    main()
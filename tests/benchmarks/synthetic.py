@@ -0,0 +1,93 @@
+# Copyright 2017 IBM US, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Synthetic cluster-genesis inventories used by the benchmarks."""
+
+STORAGE_NET = 'ceph-public-storage'
+
+# Journal layouts cycled through by the OSD node templates
+JOURNAL_LAYOUTS = [
+    None,
+    ['/dev/nvme0n1'],
+    ['/dev/sdb', '/dev/sdc'],
+    [{'device': '/dev/nvme0n1', 'class': 'nvme'},
+     {'device': '/dev/sdb', 'class': 'ssd'},
+     {'device': '/dev/sdc', 'class': 'ssd'}],
+]
+
+
+def _devices(first, count):
+    return ['/dev/sd%s' % chr(ord(first) + i) for i in range(count)]
+
+
+def _node(name, index):
+    return {'hostname': '%s-%d' % (name, index),
+            'ipv4-pxe': '10.0.%d.%d' % (index // 250, index % 250 + 2),
+            'ipv4-ipmi': '10.1.%d.%d' % (index // 250, index % 250 + 2),
+            'rack-id': 'rack%d' % (index // 20),
+            '%s-addr' % STORAGE_NET: '172.26.%d.%d' % (
+                index // 250, index % 250 + 2)}
+
+
+def _osd_template(t):
+    journals = JOURNAL_LAYOUTS[t % len(JOURNAL_LAYOUTS)]
+    settings = {'osd-devices': _devices('d', 6 + 2 * (t % 4))}
+    if journals:
+        settings['journal-devices'] = journals
+    roles = ['ceph-osd']
+    if t % 5 == 4:
+        # Converged monitor and OSD nodes
+        roles.append('ceph-monitor')
+    return {'roles': roles, 'domain-settings': settings}
+
+
+def make_inventory(node_count, osd_templates=None, mon_count=3):
+    """Return a ceph-standalone inventory with node_count OSD nodes.
+
+    The OSD nodes are spread across osd_templates node templates, by
+    default one per 250 nodes with a minimum of 4.  The templates cycle
+    through collocated, single, dual and weighted journal layouts and use
+    different OSD device counts, and every fifth template is converged
+    with the ceph-monitor role.  A compute template without any ceph role
+    is added so role lookups have templates to skip.
+    """
+    if osd_templates is None:
+        osd_templates = max(4, node_count // 250)
+    osd_templates = min(osd_templates, node_count)
+    templates = {'controllers': {'roles': ['ceph-monitor'],
+                                 'domain-settings': {}},
+                 'compute': {'roles': ['compute'],
+                             'domain-settings': {}}}
+    nodes = {'controllers': [_node('controller', i)
+                             for i in range(mon_count)]}
+    index = mon_count
+    nodes['compute'] = [_node('compute', index + i) for i in range(2)]
+    index += 2
+    per_template = max(1, node_count // osd_templates)
+    for t in range(osd_templates):
+        name = 'osdType%d' % t
+        templates[name] = _osd_template(t)
+        count = per_template
+        if t == osd_templates - 1:
+            count = node_count - per_template * (osd_templates - 1)
+        nodes[name] = [_node(name, index + i) for i in range(count)]
+        index += count
+
+    return {'reference-architecture': ['ceph-standalone'],
+            'networks': {STORAGE_NET: {'addr': '172.26.0.0/16',
+                                       'eth-port': 'eth11'},
+                         'ceph-replication': {'addr': '172.27.0.0/16',
+                                              'eth-port': 'eth12'}},
+            'node-templates': templates,
+            'nodes': nodes}
@@ -0,0 +1,80 @@
+# Copyright 2017 IBM Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import imp
+import mock
+import os
+import os.path
+import sys
+import types
+import unittest
+
+TOP_DIR = os.path.join(os.getcwd(), os.path.dirname(__file__), '../..')
+MODULE_FILE = 'playbooks/roles/ceph_hosts/library/ceph_device_check.py'
+
+
+def _load_module():
+    # Ansible modules import the module snippets when they are loaded,
+    # only the device matching is tested here.
+    basic = types.ModuleType('ansible.module_utils.basic')
+    modules = {'ansible': types.ModuleType('ansible'),
+               'ansible.module_utils':
+               types.ModuleType('ansible.module_utils'),
+               'ansible.module_utils.basic': basic}
+    with mock.patch.dict(sys.modules, modules):
+        return imp.load_source('ceph_device_check',
+                               os.path.join(TOP_DIR, MODULE_FILE))
+
+test_mod = _load_module()
+
+
+class TestCephDeviceCheck(unittest.TestCase):
+
+    # lsblk --json --output NAME of a host with partitions, an LVM volume
+    # on a partition and devices with common name prefixes
+    BLOCK_DEVICES = [
+        {'name': 'vda',
+         'children': [{'name': 'vda1'},
+                      {'name': 'vda2',
+                       'children': [{'name': 'vg-root'}]}]},
+        {'name': 'vdd1'},
+        {'name': 'vdda'},
+        {'name': 'nvme0n1',
+         'children': [{'name': 'nvme0n1p1'}]}]
+
+    def test_device_names(self):
+        self.assertEqual(list(test_mod._device_names(self.BLOCK_DEVICES)),
+                         ['vda', 'vda1', 'vda2', 'vg-root', 'vdd1', 'vdda',
+                          'nvme0n1', 'nvme0n1p1'])
+        self.assertEqual(list(test_mod._device_names([])), [])
+
+    def test_strip_dev(self):
+        self.assertEqual(test_mod._strip_dev('/dev/sdb'), 'sdb')
+        self.assertEqual(test_mod._strip_dev('sdb'), 'sdb')
+        self.assertEqual(test_mod._strip_dev('/dev/mapper/vg-root'),
+                         'mapper/vg-root')
+
+    def test_find_missing(self):
+        # Nested children and the /dev/ prefix are found
+        self.assertEqual(test_mod._find_missing(
+            ['/dev/vda', 'vda2', '/dev/vg-root', '/dev/nvme0n1p1'],
+            self.BLOCK_DEVICES), [])
+        # vdd is neither its partition vdd1 nor the longer name vdda
+        self.assertEqual(test_mod._find_missing(
+            ['/dev/vdd', '/dev/vdda', '/dev/vdb'], self.BLOCK_DEVICES),
+            ['/dev/vdd', '/dev/vdb'])
+        # A partition name is not its disk either
+        self.assertEqual(test_mod._find_missing(
+            ['/dev/nvme0n1p', '/dev/vda3'], self.BLOCK_DEVICES),
+            ['/dev/nvme0n1p', '/dev/vda3'])
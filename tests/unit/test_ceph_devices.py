@@ -0,0 +1,96 @@
+# Copyright 2017 IBM Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import os.path
+import sys
+import unittest
+
+TOP_DIR = os.path.join(os.getcwd(), os.path.dirname(__file__), '../..')
+PLUGIN_DIR = 'playbooks/filter_plugins'
+sys.path.append(os.path.join(TOP_DIR, PLUGIN_DIR))
+
+import ceph_devices as test_mod
+
+
+class TestCephDevices(unittest.TestCase):
+
+    def test_device_names(self):
+        self.assertEqual(test_mod.device_names(
+            ['/dev/sdb', {'device': '/dev/nvme0n1', 'class': 'nvme'}]),
+            ['/dev/sdb', '/dev/nvme0n1'])
+
+    PACKAGE_LINES = ['gdisk 1.0.1-1build1', 'lvm2 2.02.133-1ubuntu10']
+    ZAP_LINES = ['disk rc seconds', 'sdb 0 3', 'sdc 0 5', 'sdd 0 4']
+
+    def test_storage_fingerprint(self):
+        fingerprint = test_mod.storage_fingerprint(
+            ['/dev/sdc', '/dev/sdd'], [{'device': '/dev/sdb', 'weight': 2}],
+            self.PACKAGE_LINES + ['parted '], self.ZAP_LINES + ['sde 1 2'])
+        self.assertEqual(json.loads(fingerprint),
+                         {'osd_devices': ['/dev/sdc', '/dev/sdd'],
+                          'journal_devices': ['/dev/sdb'],
+                          'packages': {'gdisk': '1.0.1-1build1',
+                                       'lvm2': '2.02.133-1ubuntu10'},
+                          'zapped': ['sdb', 'sdc', 'sdd']})
+        # The order of the packages and of the zap results does not
+        # matter, the device order does
+        self.assertEqual(fingerprint, test_mod.storage_fingerprint(
+            ['/dev/sdc', '/dev/sdd'], ['/dev/sdb'],
+            list(reversed(self.PACKAGE_LINES)), ['sdd 0 4', 'sde 1 2',
+                                                 'sdc 0 5', 'sdb 0 3']))
+        self.assertNotEqual(fingerprint, test_mod.storage_fingerprint(
+            ['/dev/sdd', '/dev/sdc'], ['/dev/sdb'], self.PACKAGE_LINES,
+            self.ZAP_LINES))
+        self.assertEqual(json.loads(test_mod.storage_fingerprint(
+            ['/dev/sdc'], None, None, None)),
+            {'osd_devices': ['/dev/sdc'], 'journal_devices': [],
+             'packages': {}, 'zapped': []})
+
+    def test_storage_ready(self):
+        osd_devices = ['/dev/sdc', '/dev/sdd']
+        journal_devices = [{'device': '/dev/sdb'}]
+        packages = ['gdisk', 'lvm2']
+        fingerprint = test_mod.storage_fingerprint(
+            osd_devices, journal_devices, self.PACKAGE_LINES, self.ZAP_LINES)
+        self.assertTrue(test_mod.storage_ready(
+            fingerprint, osd_devices, journal_devices, packages,
+            self.PACKAGE_LINES))
+
+        # Changed devices
+        self.assertFalse(test_mod.storage_ready(
+            fingerprint, osd_devices, [], packages, self.PACKAGE_LINES))
+        # An upgraded, removed or newly requested package
+        self.assertFalse(test_mod.storage_ready(
+            fingerprint, osd_devices, journal_devices, packages,
+            ['gdisk 1.0.1-2', 'lvm2 2.02.133-1ubuntu10']))
+        self.assertFalse(test_mod.storage_ready(
+            fingerprint, osd_devices, journal_devices, packages,
+            ['gdisk 1.0.1-1build1', 'lvm2 ']))
+        self.assertFalse(test_mod.storage_ready(
+            fingerprint, osd_devices, journal_devices,
+            packages + ['parted'], self.PACKAGE_LINES))
+        # A disk which was not zapped
+        fingerprint = test_mod.storage_fingerprint(
+            osd_devices, journal_devices, self.PACKAGE_LINES,
+            ['sdb 0 3', 'sdc 0 5', 'sdd 1 4'])
+        self.assertFalse(test_mod.storage_ready(
+            fingerprint, osd_devices, journal_devices, packages,
+            self.PACKAGE_LINES))
+        # No or an invalid stored fingerprint
+        for stored in ['', '{', '[]']:
+            self.assertFalse(test_mod.storage_ready(
+                stored, osd_devices, journal_devices, packages,
+                self.PACKAGE_LINES))
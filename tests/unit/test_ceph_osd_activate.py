@@ -0,0 +1,125 @@
+# Copyright 2017 IBM Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import imp
+import mock
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import types
+import unittest
+
+TOP_DIR = os.path.join(os.getcwd(), os.path.dirname(__file__), '../..')
+MODULE_FILE = ('changes/ceph-ansible/roles/ceph-osd/library/'
+               'ceph_osd_activate.py')
+
+
+def _load_module():
+    # Ansible modules import the module snippets when they are loaded,
+    # only the partition lookup and the activation are tested here.
+    basic = types.ModuleType('ansible.module_utils.basic')
+    modules = {'ansible': types.ModuleType('ansible'),
+               'ansible.module_utils':
+               types.ModuleType('ansible.module_utils'),
+               'ansible.module_utils.basic': basic}
+    with mock.patch.dict(sys.modules, modules):
+        return imp.load_source('ceph_osd_activate',
+                               os.path.join(TOP_DIR, MODULE_FILE))
+
+test_mod = _load_module()
+
+
+class TestCephOsdActivate(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = os.path.realpath(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.sys_block = os.path.join(self.tmp_dir, 'sys', 'class', 'block')
+        self.dev_dir = os.path.join(self.tmp_dir, 'dev')
+        os.makedirs(self.dev_dir)
+        for patcher in (mock.patch.object(test_mod, 'SYS_BLOCK',
+                                          self.sys_block),
+                        mock.patch.object(test_mod, 'DEV_DIR',
+                                          self.dev_dir)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        # A prepared disk, a disk without partitions, a disk whose data
+        # partition sorts after its journal partition and a cciss disk
+        self._add_disk('sdb', {'sdb1': 1, 'sdb2': 2})
+        self._add_disk('sdc', {})
+        self._add_disk('nvme0n1', {'nvme0n1p1': 2, 'nvme0n1p2': 1})
+        self._add_disk('cciss!c0d0', {'cciss!c0d0p1': 1})
+
+    def _add_disk(self, sys_name, partitions):
+        disk_dir = os.path.join(self.sys_block, sys_name)
+        os.makedirs(disk_dir)
+        with open(os.path.join(disk_dir, 'size'), 'w') as stream:
+            stream.write('41943040\n')
+        for name, number in partitions.items():
+            for part_dir in (os.path.join(disk_dir, name),
+                             os.path.join(self.sys_block, name)):
+                os.makedirs(part_dir)
+                with open(os.path.join(part_dir, 'partition'), 'w') as stream:
+                    stream.write('%d\n' % number)
+
+    def _dev(self, name):
+        return os.path.join(self.dev_dir, name)
+
+    def test_first_partition(self):
+        self.assertEqual(test_mod._first_partition('sdb'), self._dev('sdb1'))
+        self.assertEqual(test_mod._first_partition('nvme0n1'),
+                         self._dev('nvme0n1p2'))
+        self.assertEqual(test_mod._first_partition('cciss!c0d0'),
+                         self._dev('cciss/c0d0p1'))
+        self.assertIsNone(test_mod._first_partition('sdc'))
+
+    def test_data_partition(self):
+        self.assertEqual(test_mod._data_partition(self._dev('sdb')),
+                         (self._dev('sdb1'), True))
+        self.assertEqual(test_mod._data_partition(self._dev('sdb2')),
+                         (self._dev('sdb2'), False))
+        self.assertEqual(test_mod._data_partition(self._dev('cciss/c0d0')),
+                         (self._dev('cciss/c0d0p1'), True))
+        self.assertEqual(test_mod._data_partition(self._dev('sdc')),
+                         (None, True))
+        self.assertEqual(test_mod._data_partition(self._dev('sdz')),
+                         (None, False))
+
+        # A symlink like /dev/disk/by-id/... is resolved to its device
+        os.makedirs(self._dev('disk'))
+        os.symlink(self._dev('sdb'), self._dev('disk/wwn-0x5000'))
+        self.assertEqual(
+            test_mod._data_partition(self._dev('disk/wwn-0x5000')),
+            (self._dev('sdb1'), True))
+
+    def test_activate_all(self):
+        commands = {
+            '/dev/sdb': [sys.executable, '-c', 'print("activated")'],
+            '/dev/sdc': [sys.executable, '-c', 'import sys; sys.exit(3)'],
+            '/dev/sdd': [os.path.join(self.tmp_dir, 'missing-command')],
+            '/dev/sde': [sys.executable, '-c', 'print("activated")']}
+        for jobs in (1, 2, 8):
+            results = test_mod.activate_all(commands, jobs)
+            self.assertEqual(sorted(results), sorted(commands))
+            self.assertEqual(results['/dev/sdb']['rc'], 0)
+            self.assertEqual(results['/dev/sdb']['stdout'].strip(),
+                             'activated')
+            self.assertEqual(results['/dev/sdc']['rc'], 3)
+            self.assertEqual(results['/dev/sdd']['rc'], 1)
+            self.assertTrue(results['/dev/sdd']['stderr'])
+            self.assertEqual(results['/dev/sde']['rc'], 0)
+        self.assertEqual(test_mod.activate_all({}, 8), {})
@@ -0,0 +1,105 @@
+# Copyright 2017 IBM Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import os.path
+import mock
+import shutil
+import sys
+import tempfile
+import unittest
+
+TOP_DIR = os.path.join(os.getcwd(), os.path.dirname(__file__), '../..')
+PLUGIN_DIR = 'playbooks/callback_plugins'
+sys.path.append(os.path.join(TOP_DIR, PLUGIN_DIR))
+
+import deploy_profile as test_mod
+
+
+def _result(host):
+    result = mock.Mock()
+    result._host.get_name.return_value = host
+    return result
+
+
+def _task(name):
+    task = mock.Mock()
+    task.get_name.return_value = name
+    return task
+
+
+class TestDeployProfile(unittest.TestCase):
+
+    def test_make_report(self):
+        tasks = [{'name': 'fast', 'seconds': 1.0,
+                  'hosts': {'a': {'seconds': .5, 'status': 'ok'},
+                            'b': {'seconds': 1.0, 'status': 'skipped'}}},
+                 {'name': 'slow', 'seconds': 9.0,
+                  'hosts': {'a': {'seconds': 2.0, 'status': 'ok'},
+                            'b': {'seconds': 9.0, 'status': 'failed'}}},
+                 {'name': 'no hosts', 'seconds': .1, 'hosts': {}}]
+        report = test_mod.make_report('site.yml', 12.0, tasks)
+        self.assertEqual(report['playbook'], 'site.yml')
+        self.assertEqual(report['seconds'], 12.0)
+        self.assertEqual([t['name'] for t in report['slowest_tasks']],
+                         ['slow', 'fast', 'no hosts'])
+        self.assertEqual(report['slowest_tasks'][0]['number'], 2)
+        self.assertEqual(report['tasks'][0]['slowest_host'], 'b')
+        self.assertEqual(report['hosts'],
+                         [{'host': 'b', 'seconds': 10.0, 'tasks': 2,
+                           'failed': 1},
+                          {'host': 'a', 'seconds': 2.5, 'tasks': 2,
+                           'failed': 0}])
+
+    def test_callback(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        profile_dir = os.path.join(tmp_dir, 'profile')
+        with mock.patch.dict(os.environ,
+                             {test_mod.PROFILE_DIR_ENV: profile_dir}):
+            callback = test_mod.CallbackModule()
+        playbook = mock.Mock()
+        playbook._file_name = '/opt/ceph-ansible/site.yml'
+        callback.v2_playbook_on_start(playbook)
+        callback.v2_playbook_on_task_start(_task('install'), False)
+        callback.v2_runner_on_ok(_result('a'))
+        callback.v2_runner_on_failed(_result('b'))
+        # A later loop item does not hide the failure
+        callback.v2_runner_on_ok(_result('b'))
+        callback.v2_playbook_on_handler_task_start(_task('restart'))
+        callback.v2_runner_on_skipped(_result('a'))
+        callback.v2_runner_on_unreachable(_result('b'))
+        callback.v2_playbook_on_stats(mock.Mock())
+
+        with open(os.path.join(profile_dir, 'site.json'), 'r') as stream:
+            report = json.load(stream)
+        self.assertEqual(report['playbook'], 'site.yml')
+        tasks = dict((task['name'], task) for task in report['tasks'])
+        self.assertEqual(sorted(tasks), ['install', 'restart'])
+        self.assertEqual(tasks['install']['hosts']['b']['status'], 'failed')
+        self.assertEqual(tasks['restart']['hosts']['b']['status'],
+                         'unreachable')
+        hosts = dict((host['host'], host) for host in report['hosts'])
+        self.assertEqual(hosts['b']['failed'], 2)
+        self.assertEqual(hosts['a']['tasks'], 2)
+
+    def test_callback_without_profile_dir(self):
+        with mock.patch.dict(os.environ, clear=True):
+            callback = test_mod.CallbackModule()
+        callback.v2_playbook_on_task_start(_task('install'), False)
+        callback.v2_runner_on_ok(_result('a'))
+        with mock.patch('os.makedirs') as makedirs:
+            callback.v2_playbook_on_stats(mock.Mock())
+        self.assertFalse(makedirs.called)
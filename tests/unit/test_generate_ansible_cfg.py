@@ -0,0 +1,128 @@
+# Copyright 2017 IBM US, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import ConfigParser
+import json
+import os
+import os.path
+import shutil
+import StringIO
+import sys
+import tempfile
+import unittest
+
+TOP_DIR = os.path.join(os.getcwd(), os.path.dirname(__file__), '../..')
+SCRIPT_DIR = 'scripts/ulysses_ceph'
+sys.path.append(os.path.join(TOP_DIR, SCRIPT_DIR))
+
+import generate_ansible_cfg as test_mod
+
+
+def _parse(contents):
+    config = ConfigParser.RawConfigParser()
+    config.readfp(StringIO.StringIO(contents))
+    return config
+
+
+class TestGenerateAnsibleCfg(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def test_count_hosts(self):
+        hosts_file = os.path.join(self.tmp_dir, 'ceph-hosts')
+        with open(hosts_file, 'w') as stream:
+            stream.write('[mons]\n1.1.1.1\n1.1.1.2\n\n[osds]\n1.1.1.2\n'
+                         '1.1.1.3\n')
+        self.assertEqual(test_mod.count_hosts(hosts_file), 3)
+
+        # A JSON inventory left by an earlier run is not used by the INI
+        # inventory
+        with open(hosts_file + '.json', 'w') as stream:
+            json.dump({'mons': {'hosts': ['a', 'b']},
+                       'osds': {'hosts': ['b', 'c', 'd']},
+                       '_meta': {'hostvars': {'e': {}}}}, stream)
+        self.assertEqual(test_mod.count_hosts(hosts_file), 3)
+
+        # The JSON inventory read by the inventory script
+        with open(hosts_file, 'w') as stream:
+            stream.write(test_mod.generator.INVENTORY_SCRIPT)
+        self.assertEqual(test_mod.count_hosts(hosts_file), 4)
+
+    def test_calculate_forks(self):
+        self.assertEqual(test_mod.calculate_forks(3, 16), 3)
+        self.assertEqual(test_mod.calculate_forks(500, 16), 128)
+        self.assertEqual(test_mod.calculate_forks(500, 16, 8192), 40)
+        self.assertEqual(test_mod.calculate_forks(0, 16), 1)
+
+    def test_generate_cfg(self):
+        config = _parse(test_mod.generate_cfg(None, 40))
+        self.assertEqual(config.get('defaults', 'forks'), '40')
+        self.assertEqual(config.get('ssh_connection', 'pipelining'), 'True')
+        self.assertEqual(config.get('ssh_connection', 'ssh_args'),
+                         '-o ControlMaster=auto -o ControlPersist=600s')
+        self.assertEqual(config.get('ssh_connection', 'control_path'),
+                         test_mod.CONTROL_PATH)
+
+        # The settings of an existing file are kept
+        base_file = os.path.join(self.tmp_dir, 'ansible.cfg')
+        with open(base_file, 'w') as stream:
+            stream.write('[defaults]\naction_plugins = plugins/actions\n'
+                         'forks = 5\n\n[ssh_connection]\n'
+                         'control_path = %(directory)s/%%h-%%r-%%p\n'
+                         'ssh_args = -o ControlMaster=auto '
+                         '-o ControlPersist=60s -o ForwardAgent=yes\n')
+        contents = test_mod.generate_cfg(base_file, 12)
+        config = _parse(contents)
+        self.assertEqual(config.get('defaults', 'action_plugins'),
+                         'plugins/actions')
+        self.assertEqual(config.get('defaults', 'forks'), '12')
+        self.assertEqual(config.get('ssh_connection', 'control_path'),
+                         '%(directory)s/%%h-%%r-%%p')
+        self.assertEqual(config.get('ssh_connection', 'ssh_args'),
+                         '-o ControlMaster=auto -o ControlPersist=600s '
+                         '-o ForwardAgent=yes')
+
+        # The comments and the order of the base file are kept
+        with open(base_file, 'w') as stream:
+            stream.write('# Comment on top\n[defaults]\n'
+                         '# The forks are sized\nforks = 5\n'
+                         'roles_path = a:\n  b\n\n'
+                         '[ssh_connection]\n; SSH settings\n'
+                         'scp_if_ssh = True\n'
+                         'pipelining = False\n\n'
+                         '[accelerate]\naccelerate_port = 5099\n')
+        self.assertEqual(test_mod.generate_cfg(base_file, 12),
+                         '# Comment on top\n[defaults]\n'
+                         '# The forks are sized\nforks = 12\n'
+                         'roles_path = a:\n  b\n\n'
+                         '[ssh_connection]\n; SSH settings\n'
+                         'scp_if_ssh = True\n'
+                         'pipelining = True\n'
+                         'ssh_args = -o ControlMaster=auto '
+                         '-o ControlPersist=600s\n'
+                         'control_path = %(directory)s/%%h-%%r\n\n'
+                         '[accelerate]\naccelerate_port = 5099\n')
+
+        # A replaced value continued on the next lines
+        with open(base_file, 'w') as stream:
+            stream.write('[defaults]\nforks = 5\n  6\nx = 1\n')
+        self.assertEqual(test_mod.generate_cfg(base_file, 12).split('\n')[:3],
+                         ['[defaults]', 'forks = 12', 'x = 1'])
+
+        # Generating over the generated file does not change it
+        with open(base_file, 'w') as stream:
+            stream.write(contents)
+        self.assertEqual(test_mod.generate_cfg(base_file, 12), contents)
@@ -12,11 +12,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import argparse
 import copy
+import json
 import os
 import os.path
 import mock
+import shutil
+import subprocess
 import sys
+import tempfile
 import unittest
 
 TOP_DIR = os.path.join(os.getcwd(), os.path.dirname(__file__), '../..')
@@ -26,6 +31,18 @@ sys.path.append(os.path.join(TOP_DIR, SCRIPT_DIR))
 import generate_ceph_ansible_input as test_mod
 
 
+def _string_stream():
+    try:
+        from StringIO import StringIO
+    except ImportError:
+        from io import StringIO
+    return StringIO()
+
+
+def _index(inventory):
+    return test_mod.InventoryIndex(inventory)
+
+
 class TestGenerateCephAnsibleInput(unittest.TestCase):
     TEST_MODULE_STRING = 'generate_ceph_ansible_input'
 
@@ -35,11 +52,14 @@ class TestGenerateCephAnsibleInput(unittest.TestCase):
     def tearDown(self):
         pass
 
+    @mock.patch(TEST_MODULE_STRING + '._choose_failure_domain')
     @mock.patch(TEST_MODULE_STRING + '._get_openstack_pools')
-    def test_generate_all_vars(self, get_pools):
+    def test_generate_all_vars(self, get_pools, choose_domain):
         # Test private cloud with bridge as monitor interface
         ref_arch = ['private-compute-cloud']
-        get_pools.return_value = {'poolname': 'a pool'}
+        get_pools.return_value = {'poolname': {'name': 'a pool',
+                                               'size': 3}}
+        choose_domain.return_value = ('host', [])
         inventory = {'networks': {'openstack-stg':
                                   {'addr': '172.29.244.0/22',
                                    'bridge': 'br-storage'}},
@@ -58,15 +78,15 @@ class TestGenerateCephAnsibleInput(unittest.TestCase):
         verify_vars['openstack_keys'] = os_keys
         verify_vars['openstack_pools'] = os_pools
         verify_vars['monitor_interface'] = 'br-storage'
-        all_vars = test_mod._generate_all_vars(inventory, growth_factor,
-                                               1, 1, 1, True)
+        all_vars = test_mod._generate_all_vars(_index(inventory),
+                                               growth_factor, 1, 1, 1, True)
         self._assert_invalid_config(ref_arch, verify_vars)
         self.assertDictEqual(verify_vars, all_vars)
 
         # Test again with cluster net set
         inventory['networks']['ceph-replication'] = {'addr': '172.29.100.0/22'}
-        all_vars = test_mod._generate_all_vars(inventory, growth_factor,
-                                               1, 1, 1, True)
+        all_vars = test_mod._generate_all_vars(_index(inventory),
+                                               growth_factor, 1, 1, 1, True)
 
         verify_vars['cluster_network'] = '172.29.100.0/22'
         self.assertDictEqual(verify_vars, all_vars)
@@ -82,25 +102,23 @@ class TestGenerateCephAnsibleInput(unittest.TestCase):
                                              'ceph-public-storage-addr':
                                              '172.26.244.0/22'}]}}
         growth_factor = 200
-        verify_vars = test_mod._init_default_values(inventory, False)
+        verify_vars = test_mod._init_default_values(_index(inventory), False)
         verify_vars['delete_default_pool'] = False
         verify_vars['public_network'] = '172.26.244.0/22'
         verify_vars['cluster_network'] = '{{ public_network }}'
-        all_vars = test_mod._generate_all_vars(inventory, growth_factor,
-                                               1, 1, 1, False)
+        all_vars = test_mod._generate_all_vars(_index(inventory),
+                                               growth_factor, 1, 1, 1, False)
         self._assert_invalid_config(ref_arch, verify_vars)
         self.assertDictEqual(verify_vars, all_vars)
 
         # Test again with cluster net set
         inventory['networks']['ceph-replication'] = {'addr': '172.29.100.0/22'}
-        all_vars = test_mod._generate_all_vars(inventory, growth_factor,
-                                               1, 1, 1, False)
+        all_vars = test_mod._generate_all_vars(_index(inventory),
+                                               growth_factor, 1, 1, 1, False)
         verify_vars['cluster_network'] = '172.29.100.0/22'
         self.assertDictEqual(verify_vars, all_vars)
 
-    @mock.patch(TEST_MODULE_STRING + '._get_node_template_names_for_role',
-                return_value=['ceph-osd'])
-    def test_generate_priv_cloud_all_vars(self, template_names):
+    def test_generate_priv_cloud_all_vars(self):
         os_config = False
         growth_factor = 200
         ref_arch = ['private-compute-cloud']
@@ -108,8 +126,9 @@ class TestGenerateCephAnsibleInput(unittest.TestCase):
                                   {'addr': '172.29.244.0/22',
                                    'bridge': 'br-storage'}},
                      'reference-architecture': ref_arch}
-        verify_vars = test_mod._generate_all_vars(inventory, growth_factor,
-                                                  1, 1, 1, os_config)
+        verify_vars = test_mod._generate_all_vars(_index(inventory),
+                                                  growth_factor, 1, 1, 1,
+                                                  os_config)
         self.assertFalse(verify_vars['delete_default_pool'])
         self.assertNotIn('openstack_config', verify_vars)
         os_config = True
@@ -120,8 +139,9 @@ class TestGenerateCephAnsibleInput(unittest.TestCase):
                               'ceph-osd': [{'hostname': 'osd1',
                                             'ceph-public-storage-addr':
                                             '172.26.244.0/22'}]}
-        verify_vars = test_mod._generate_all_vars(inventory, growth_factor,
-                                                  1, 1, 1, os_config)
+        verify_vars = test_mod._generate_all_vars(_index(inventory),
+                                                  growth_factor, 1, 1, 1,
+                                                  os_config)
         self.assertTrue(verify_vars['delete_default_pool'])
         self.assertTrue('openstack_config', verify_vars)
 
@@ -137,16 +157,18 @@ class TestGenerateCephAnsibleInput(unittest.TestCase):
                                'ceph-osd': [{'hostname': 'osd1',
                                              'ceph-public-storage-addr':
                                              '172.26.244.0/22'}]}}
-        verify_vars = test_mod._generate_all_vars(inventory, growth_factor,
-                                                  1, 1, 1, os_config)
+        verify_vars = test_mod._generate_all_vars(_index(inventory),
+                                                  growth_factor, 1, 1, 1,
+                                                  os_config)
         self.assertFalse(verify_vars['delete_default_pool'])
         self.assertNotIn('openstack_config', verify_vars)
         os_config = True
         inventory['node-templates'] = {'ceph-osd':
                                        {'domain-settings':
                                         {'osd-devices': {'/dev/sdb'}}}}
-        verify_vars = test_mod._generate_all_vars(inventory, growth_factor,
-                                                  1, 1, 1, os_config)
+        verify_vars = test_mod._generate_all_vars(_index(inventory),
+                                                  growth_factor, 1, 1, 1,
+                                                  os_config)
         self.assertTrue(verify_vars['delete_default_pool'])
         self.assertTrue('openstack_config', verify_vars)
 
@@ -165,12 +187,14 @@ class TestGenerateCephAnsibleInput(unittest.TestCase):
         inventory = {'reference-architecture': ['ceph-standalone'],
                      'networks': {'ceph-public-storage': {'eth-port':
                                                           'eth11'}}}
-        verify_vars = test_mod._init_default_values(inventory, os_config)
+        verify_vars = test_mod._init_default_values(
+            _index(inventory), os_config)
         self.assertTrue(verify_vars['delete_default_pool'])
         self.assertTrue('openstack_config', verify_vars)
 
         os_config = False
-        verify_vars = test_mod._init_default_values(inventory, os_config)
+        verify_vars = test_mod._init_default_values(
+            _index(inventory), os_config)
         self.assertFalse(verify_vars['delete_default_pool'])
         self.assertNotIn('openstack_config', verify_vars)
 
@@ -179,12 +203,14 @@ class TestGenerateCephAnsibleInput(unittest.TestCase):
         inventory = {'reference-architecture': ['private-compute-cloud'],
                      'networks': {'openstack-stg': {'bridge': 'br-storage',
                                                     'eth-port': 'eth11'}}}
-        verify_vars = test_mod._init_default_values(inventory, os_config)
+        verify_vars = test_mod._init_default_values(
+            _index(inventory), os_config)
         self.assertTrue(verify_vars['delete_default_pool'])
         self.assertTrue('openstack_config' in verify_vars)
 
         os_config = False
-        verify_vars = test_mod._init_default_values(inventory, os_config)
+        verify_vars = test_mod._init_default_values(
+            _index(inventory), os_config)
         self.assertFalse(verify_vars['delete_default_pool'])
         self.assertNotIn('openstack_config', verify_vars)
 
@@ -192,7 +218,7 @@ class TestGenerateCephAnsibleInput(unittest.TestCase):
         inventory = {'reference-architecture': ['private-compute-cloud'],
                      'networks': {'openstack-stg': {'bridge': 'br-storage',
                                                     'eth-port': 'eth11'}}}
-        verify_vars = test_mod._init_default_values(inventory, True)
+        verify_vars = test_mod._init_default_values(_index(inventory), True)
         self.assertEquals(verify_vars['monitor_interface'], 'br-storage')
         self.assertTrue(verify_vars['delete_default_pool'])
         self.assertTrue(verify_vars['openstack_config'])
@@ -201,14 +227,14 @@ class TestGenerateCephAnsibleInput(unittest.TestCase):
         inventory = {'reference-architecture': ['ceph-standalone'],
                      'networks': {'ceph-public-storage': {'eth-port':
                                                           'eth11'}}}
-        verify_vars = test_mod._init_default_values(inventory, False)
+        verify_vars = test_mod._init_default_values(_index(inventory), False)
         self.assertFalse(verify_vars['delete_default_pool'])
         self.assertEquals(verify_vars['monitor_interface'], 'eth11')
         # Test bonded network
         inventory = {'reference-architecture': ['ceph-standalone'],
                      'networks': {'ceph-public-storage': {'bond':
                                                           'jamesbond'}}}
-        verify_vars = test_mod._init_default_values(inventory, False)
+        verify_vars = test_mod._init_default_values(_index(inventory), False)
         self.assertFalse(verify_vars['delete_default_pool'])
         self.assertEquals(verify_vars['monitor_interface'], 'jamesbond')
 
@@ -219,7 +245,7 @@ class TestGenerateCephAnsibleInput(unittest.TestCase):
                      'networks': {'ceph-public-storage': {'bond':
                                                           'jamesbond'}},
                      'deployment-environment': test_env}
-        verify_vars = test_mod._init_default_values(inventory, False)
+        verify_vars = test_mod._init_default_values(_index(inventory), False)
         self.assertFalse(verify_vars['delete_default_pool'])
         self.assertEquals(verify_vars['monitor_interface'], 'jamesbond')
         self.assertEqual(verify_vars['deployment_environment_variables'],
@@ -233,30 +259,29 @@ class TestGenerateCephAnsibleInput(unittest.TestCase):
         self.assertEqual(test_mod._get_storage_network(inventory),
                          'openstack-stg')
 
-    @mock.patch(TEST_MODULE_STRING + '._get_node_template_names_for_role',
-                return_value=['ceph-osd'])
-    def test_get_osd_ips(self, template_names):
+    def test_get_osd_ips(self):
         ref_arch = ['ceph-standalone']
         inventory = {'reference-architecture': ref_arch,
+                     'node-templates': {'ceph-osd': {}},
                      'nodes': {'ceph-osd': [{'hostname': 'osd1',
                                              'ceph-public-storage-addr':
                                              '172.26.244.1'},
                                             {'hostname': 'osd2',
                                              'ceph-public-storage-addr':
                                              '172.26.244.2'}]}}
-        self.assertEquals(test_mod._get_osd_ips(inventory),
+        self.assertEquals(test_mod._get_osd_ips(_index(inventory)),
                           ['172.26.244.1', '172.26.244.2'])
         ref_arch = ['private-compute-cloud']
         inventory = {'reference-architecture': ref_arch,
+                     'node-templates': {'ceph-osd': {}},
                      'nodes': {'ceph-osd': [{'openstack-stg-addr':
                                              '172.26.244.1'}]}}
-        self.assertEqual(test_mod._get_osd_ips(inventory),
+        self.assertEqual(test_mod._get_osd_ips(_index(inventory)),
                          ['172.26.244.1'])
 
-    @mock.patch(TEST_MODULE_STRING + '._get_node_template_names_for_role',
-                return_value=['controllers'])
-    def test_get_mon_ips(self, template_names):
+    def test_get_mon_ips(self):
         inventory = {'reference-architecture': ['ceph-standalone'],
+                     'node-templates': {'controllers': {}},
                      'nodes': {'controllers': [{'hostname': 'controller1',
                                                 'ceph-public-storage-addr':
                                                 '172.29.244.2'},
@@ -266,9 +291,10 @@ class TestGenerateCephAnsibleInput(unittest.TestCase):
                                                {'hostname': 'controller3',
                                                 'ceph-public-storage-addr':
                                                 '172.29.244.4'}]}}
-        self.assertEqual(test_mod._get_mon_ips(inventory),
+        self.assertEqual(test_mod._get_mon_ips(_index(inventory)),
                          ['172.29.244.2', '172.29.244.3', '172.29.244.4'])
         inventory = {'reference-architecture': ['private-compute-cloud'],
+                     'node-templates': {'controllers': {}},
                      'nodes': {'controllers': [{'hostname': 'controller1',
                                                 'openstack-stg-addr':
                                                 '172.29.244.2'},
@@ -278,12 +304,10 @@ class TestGenerateCephAnsibleInput(unittest.TestCase):
                                                {'hostname': 'controller3',
                                                 'openstack-stg-addr':
                                                 '172.29.244.4'}]}}
-        self.assertEqual(test_mod._get_mon_ips(inventory),
+        self.assertEqual(test_mod._get_mon_ips(_index(inventory)),
                          ['172.29.244.2', '172.29.244.3', '172.29.244.4'])
 
-    @mock.patch(TEST_MODULE_STRING + '._get_node_template_names_for_role',
-                return_value=['ceph-osd'])
-    def test_get_osd_count(self, template_names):
+    def test_get_osd_count(self):
         osd_devices = ['/dev/sde',
                        '/dev/sdf',
                        '/dev/sdg',
@@ -295,20 +319,29 @@ class TestGenerateCephAnsibleInput(unittest.TestCase):
                      'nodes': {'ceph-osd': ['1', '2', '3', '4', '5', '6']}}
 
         # Test case when a each template has the same number of devices
-        count = test_mod._get_osd_count(inventory)
+        count = test_mod._get_osd_count(_index(inventory))
         self.assertEqual(count, 30)
 
         # Test 3 ceph-osd templates
-        template_names.return_value = ['ceph-osd', 'osd2', 'osd3']
+        osd_settings = {'domain-settings': osd_tmpl,
+                        test_mod.TEMPLATE_ROLES_KEY: ['ceph-osd']}
         inventory = {'node-templates': {'ceph-osd': domain_settings,
-                                        'osd2': domain_settings,
-                                        'osd3': domain_settings},
+                                        'osd2': osd_settings,
+                                        'osd3': osd_settings},
                      'nodes': {'ceph-osd': ['1', '2', '3', '4', '5', '6'],
                                'osd2': ['a', 'b', 'c', 'd', 'e', 'f'],
                                'osd3': ['g', 'h', 'i', 'j', 'k', 'l']}}
-        count = test_mod._get_osd_count(inventory)
+        count = test_mod._get_osd_count(_index(inventory))
         self.assertEqual(count, 90)
 
+        # Test templates with different device counts
+        small_tmpl = {'domain-settings': {test_mod.OSD_DEVICE_KEY:
+                                          osd_devices[:2]},
+                      test_mod.TEMPLATE_ROLES_KEY: ['ceph-osd']}
+        inventory['node-templates']['osd3'] = small_tmpl
+        count = test_mod._get_osd_count(_index(inventory))
+        self.assertEqual(count, 30 + 30 + 12)
+
     def test_generate_journal_device_list(self):
         # Test one journal
         journal_d_list = ['a']
@@ -342,6 +375,222 @@ class TestGenerateCephAnsibleInput(unittest.TestCase):
         self.assertEqual(['a'] * 4 + ['b'] * 4 + ['c'] * 4 + ['d'] * 4 +
                          ['e'] * 3, ret_val)
 
+        # Test dict journals without weights keep the block layout
+        journal_d_list = [{'device': 'a'}, {'device': 'b'}]
+        ret_val = test_mod._generate_journal_device_list(journal_d_list, 5)
+        self.assertEqual(['a'] * 3 + ['b'] * 2, ret_val)
+
+        # Test equal weights interleave the journals
+        journal_d_list = [{'device': 'a', 'weight': 1},
+                          {'device': 'b', 'weight': 1}]
+        ret_val = test_mod._generate_journal_device_list(journal_d_list, 5)
+        self.assertEqual(['a', 'b', 'a', 'b', 'a'], ret_val)
+
+        # Test proportional weights, unweighted journals default to 1
+        journal_d_list = [{'device': 'a', 'weight': 2}, 'b']
+        ret_val = test_mod._generate_journal_device_list(journal_d_list, 6)
+        self.assertEqual(['a', 'b', 'a', 'a', 'b', 'a'], ret_val)
+
+        # Test device classes, one nvme and two ssd journals
+        journal_d_list = [{'device': 'n', 'class': 'nvme'},
+                          {'device': 'a', 'class': 'ssd'},
+                          {'device': 'b', 'class': 'ssd'}]
+        ret_val = test_mod._generate_journal_device_list(journal_d_list, 14)
+        self.assertEqual(['n', 'n', 'a', 'n', 'b', 'n', 'n'] * 2, ret_val)
+
+        # Test unknown device class
+        journal_d_list = [{'device': 'a', 'class': 'floppy'}]
+        self.assertRaises(SystemExit, test_mod._generate_journal_device_list,
+                          journal_d_list, 4)
+
+    def test_plan_network(self):
+        # 10 hdd OSDs write 12 Gb/s per host, 8 Gb/s of it is replication
+        osd_tmpl = {'domain-settings':
+                    {test_mod.OSD_DEVICE_KEY: ['d%d' % i
+                                               for i in range(10)]},
+                    test_mod.TEMPLATE_ROLES_KEY: ['ceph-osd']}
+        public = {'addr': '172.29.244.0/22', 'bond': 'bond0',
+                  'bond-slaves': ['eth0', 'eth1']}
+        inventory = {'node-templates': {'osdType1': osd_tmpl},
+                     'networks': {'openstack-stg': public}}
+        index = _index(inventory)
+        self.assertAlmostEqual(test_mod._get_host_osd_bandwidth(index), 12)
+
+        # Test no warnings without link speeds
+        self.assertEqual(test_mod._plan_network(index),
+                         ('{{ public_network }}', 'bond0', []))
+
+        # Test a shared network which is too slow
+        public['speed'] = 5
+        self.assertAlmostEqual(test_mod._get_network_bandwidth(public), 10)
+        cluster_net, interface, warnings = test_mod._plan_network(index)
+        self.assertEqual(cluster_net, '{{ public_network }}')
+        self.assertEqual(warnings, [
+            'The OSD hosts need 12.0 Gb/s of shared client and replication '
+            'bandwidth, the network has 10.0 Gb/s.  Replication and '
+            'recovery will be limited by the network.'])
+
+        # Test a fast enough replication network with a small MTU
+        replication = {'addr': '172.29.100.0/22', 'eth-port': 'eth2',
+                       'speed': 10, 'mtu': 1500}
+        inventory['networks']['ceph-replication'] = replication
+        cluster_net, interface, warnings = test_mod._plan_network(
+            _index(inventory))
+        self.assertEqual(cluster_net, '172.29.100.0/22')
+        self.assertEqual(len(warnings), 1)
+        self.assertIn('MTU is 1500', warnings[0])
+
+        # Test a 4 + 2 erasure coded pool sends 10 Gb/s of replication
+        replication['speed'] = 9
+        del replication['mtu']
+        self.assertEqual(test_mod._plan_network(_index(inventory), 2),
+                         ('172.29.100.0/22', 'bond0', []))
+        cluster_net, interface, warnings = test_mod._plan_network(
+            _index(inventory), 6)
+        self.assertEqual(cluster_net, '172.29.100.0/22')
+        self.assertEqual(warnings, [
+            'The OSD hosts need 10.0 Gb/s of replication bandwidth, the '
+            'network has 9.0 Gb/s.  Replication and recovery will be '
+            'limited by the network.'])
+
+        # Test a slow replication network is replaced by a fast public one
+        replication['speed'] = 1
+        public['speed'] = 25
+        cluster_net, interface, warnings = test_mod._plan_network(
+            _index(inventory))
+        self.assertEqual(cluster_net, '{{ public_network }}')
+        self.assertEqual(len(warnings), 1)
+        self.assertIn('is used instead', warnings[0])
+
+        # Test a monitor interface too slow for the client traffic
+        public['speed'] = 1
+        replication['speed'] = 25
+        cluster_net, interface, warnings = test_mod._plan_network(
+            _index(inventory))
+        self.assertEqual((cluster_net, interface),
+                         ('172.29.100.0/22', 'bond0'))
+        self.assertEqual(warnings, [
+            'The monitor interface bond0 (2.0 Gb/s) is slower than the '
+            '4.0 Gb/s of client traffic per host.'])
+
+        # Test the monitor interface
+        del public['speed']
+        self.assertEqual(test_mod._get_monitor_interface(public), 'bond0')
+        public['bridge'] = 'br-storage'
+        self.assertEqual(test_mod._get_monitor_interface(public),
+                         'br-storage')
+        self.assertIsNone(test_mod._get_monitor_interface({}))
+
+        # Test a faster bond wins over a bridge on a single port, and the
+        # bridge wins at the same speed
+        public['eth-port'] = 'eth2'
+        public['speed'] = 10
+        self.assertEqual(test_mod._choose_monitor_interface(public),
+                         ('bond0', 20.0))
+        cluster_net, interface, warnings = test_mod._plan_network(
+            _index(inventory))
+        self.assertEqual(interface, 'bond0')
+        all_vars = test_mod._generate_all_vars(_index(inventory), 100, 25,
+                                               15, 60, False)
+        self.assertEqual(all_vars['monitor_interface'], 'bond0')
+        del public['eth-port']
+        self.assertEqual(test_mod._choose_monitor_interface(public),
+                         ('br-storage', 20.0))
+
+    def test_generate_tuning_vars(self):
+        hdd_tmpl = {'domain-settings':
+                    {test_mod.OSD_DEVICE_KEY: ['a', 'b', 'c', 'd'],
+                     test_mod.JOURNAL_DEVICE_KEY: [{'device': 'j',
+                                                    'class': 'nvme'}],
+                     test_mod.CPU_CORES_KEY: 16,
+                     test_mod.MEMORY_KEY: 64},
+                    test_mod.TEMPLATE_ROLES_KEY: ['ceph-osd']}
+        inventory = {'node-templates': {'osdType1': hdd_tmpl}}
+        overrides = test_mod._generate_tuning_vars(_index(inventory),
+                                                   'throughput')
+        mb = 1024 * 1024
+        expected = {'osd op threads': 8,
+                    'filestore op threads': 8,
+                    'filestore queue max ops': 500,
+                    'filestore queue max bytes': 100 * mb,
+                    'journal max write entries': 5000,
+                    'journal max write bytes': 256 * mb,
+                    'journal queue max ops': 10000,
+                    'journal queue max bytes': 1024 * mb}
+        self.assertDictEqual(overrides,
+                             {'ceph_conf_overrides': {'osd': expected}})
+
+        # Test the latency profile scales the queues down
+        osd = test_mod._generate_tuning_vars(
+            _index(inventory), 'latency')['ceph_conf_overrides']['osd']
+        self.assertEqual(osd['osd op threads'], 4)
+        self.assertEqual(osd['filestore queue max ops'], 125)
+        self.assertEqual(osd['journal queue max bytes'], 256 * mb)
+
+        # Test the queues are limited by the memory per OSD and the lowest
+        # value of all the templates is used
+        small_tmpl = {'domain-settings':
+                      {test_mod.OSD_DEVICE_KEY: ['a', 'b'],
+                       test_mod.CPU_CORES_KEY: 2,
+                       test_mod.MEMORY_KEY: .5},
+                      test_mod.TEMPLATE_ROLES_KEY: ['ceph-osd']}
+        inventory['node-templates']['osdType2'] = small_tmpl
+        osd = test_mod._generate_tuning_vars(
+            _index(inventory), 'throughput')['ceph_conf_overrides']['osd']
+        self.assertEqual(osd['osd op threads'], 2)
+        self.assertAlmostEqual(osd['filestore queue max bytes'] +
+                               osd['journal queue max bytes'], 64 * mb,
+                               delta=2)
+        self.assertEqual(osd['journal max write entries'], 100)
+
+        small_tmpl['domain-settings'][test_mod.OSD_CLASS_KEY] = 'floppy'
+        with mock.patch('sys.stdout', _string_stream()):
+            self.assertRaises(SystemExit, test_mod._generate_tuning_vars,
+                              _index(inventory), 'throughput')
+
+    def test_journal_size(self):
+        self.assertIsNone(test_mod._get_osd_throughput({}))
+        self.assertEqual(test_mod._get_osd_throughput(
+            {test_mod.OSD_CLASS_KEY: 'hdd'}), 150)
+        # The bandwidth takes precedence over the class
+        self.assertEqual(test_mod._get_osd_throughput(
+            {test_mod.OSD_CLASS_KEY: 'hdd',
+             test_mod.OSD_BANDWIDTH_KEY: 210}), 210)
+        self.assertRaises(SystemExit, test_mod._get_osd_throughput,
+                          {test_mod.OSD_CLASS_KEY: 'floppy'})
+        self.assertEqual(test_mod._calculate_journal_size(150), 1500)
+        self.assertEqual(test_mod._calculate_journal_size(100.05), 1001)
+
+        # Test the journal capacity check, a is 2 GB and b 3 GB
+        journals = [{'device': 'a', 'size': 2}, {'device': 'b', 'size': 3},
+                    'c']
+        osd_journal_list = ['a', 'a', 'b', 'b', 'c', 'c', 'c']
+        self.assertEqual(
+            test_mod._check_journal_capacity(journals, osd_journal_list,
+                                             1024), [])
+        self.assertEqual(
+            test_mod._check_journal_capacity(journals, osd_journal_list,
+                                             1500),
+            ['a: 2 journals need 3000 MB, the device has 2048 MB'])
+
+    def test_generate_template_osd_vars_journal_size(self):
+        settings = {test_mod.OSD_DEVICE_KEY: ['a', 'b', 'c'],
+                    test_mod.OSD_CLASS_KEY: 'ssd',
+                    test_mod.JOURNAL_DEVICE_KEY: [{'device': 'j',
+                                                   'size': 15}]}
+        osd_vars = test_mod._generate_template_osd_vars(
+            {'domain-settings': settings})
+        self.assertEqual(osd_vars['journal_size'], 5000)
+
+        # Test the default journal size is checked against the capacity
+        del settings[test_mod.OSD_CLASS_KEY]
+        with mock.patch('sys.stdout', _string_stream()) as stdout:
+            self.assertRaises(SystemExit,
+                              test_mod._generate_template_osd_vars,
+                              {'domain-settings': settings})
+        self.assertIn('j: 3 journals need 30720 MB, the device has '
+                      '15360 MB', stdout.getvalue())
+
     def test_calculate_pg_count(self):
         # Input / output values verfied with pg calc web site
         self.assertEqual(256, test_mod._calculate_pg_count(36, .25, 100))
@@ -351,6 +600,104 @@ class TestGenerateCephAnsibleInput(unittest.TestCase):
         self.assertEqual(256, test_mod._calculate_pg_count(15, .40, 100))
         # Test a very small cluster with .001
         self.assertEqual(4, test_mod._calculate_pg_count(8, .001, 100))
+        # Test replicated size 2 and erasure coded 4 + 2 pools
+        self.assertEqual(512, test_mod._calculate_pg_count(36, .25, 100, 2))
+        self.assertEqual(128, test_mod._calculate_pg_count(36, .25, 100, 6))
+
+    @unittest.skipIf(test_mod.numpy is None, 'numpy is not installed')
+    def test_calculate_pg_count_grid(self):
+        osd_counts = [8, 15, 36, 100, 1000, 4999]
+        percents = [.001, .15, .25, .40, .60]
+        growth_factors = [100, 200, 300]
+        grid = test_mod._calculate_pg_count_grid(osd_counts, percents,
+                                                 growth_factors)
+        self.assertEqual(grid.shape, (6, 3, 5))
+        for i, osd_count in enumerate(osd_counts):
+            for j, growth_factor in enumerate(growth_factors):
+                for k, percent in enumerate(percents):
+                    self.assertEqual(grid[i, j, k],
+                                     test_mod._calculate_pg_count(
+                                         osd_count, percent, growth_factor))
+
+        # Test the size of every pool is used
+        sizes = [2, 3, 6, 2, 10]
+        grid = test_mod._calculate_pg_count_grid(osd_counts, percents,
+                                                 growth_factors, sizes)
+        for i, osd_count in enumerate(osd_counts):
+            for j, growth_factor in enumerate(growth_factors):
+                for k, percent in enumerate(percents):
+                    self.assertEqual(grid[i, j, k],
+                                     test_mod._calculate_pg_count(
+                                         osd_count, percent, growth_factor,
+                                         sizes[k]))
+
+    def test_generate_pg_sweep(self):
+        osd_counts = [12, 36]
+        growth_factors = [100, 200]
+        pool_splits = [(25, 15, 60), (40, 10, 50)]
+        with mock.patch(self.TEST_MODULE_STRING + '.numpy', None):
+            serial = test_mod._generate_pg_sweep(osd_counts, growth_factors,
+                                                 pool_splits)
+        self.assertEqual(len(serial), len(test_mod.PG_SWEEP_COLUMNS))
+        rows = list(zip(*serial))
+        self.assertEqual(len(rows), 8)
+        self.assertEqual(rows[0], (12, 100, 25, 15, 60, 128, 64, 256, 112.0))
+        # 36 OSDs, growth 200, 40/10/50
+        self.assertEqual(rows[7], (36, 200, 40, 10, 50, 1024, 256, 1024,
+                                   192.0))
+        if test_mod.numpy is not None:
+            batched = test_mod._generate_pg_sweep(osd_counts, growth_factors,
+                                                  pool_splits)
+            self.assertEqual([list(column) for column in batched], serial)
+
+        # Test size 2 volumes
+        with mock.patch(self.TEST_MODULE_STRING + '.numpy', None):
+            serial = test_mod._generate_pg_sweep(osd_counts, growth_factors,
+                                                 pool_splits, (3, 3, 2))
+        rows = list(zip(*serial))
+        # (128 * 3 + 64 * 3 + 512 * 2) / 12
+        self.assertEqual(rows[0], (12, 100, 25, 15, 60, 128, 64, 512,
+                                   133.33))
+        if test_mod.numpy is not None:
+            batched = test_mod._generate_pg_sweep(osd_counts, growth_factors,
+                                                  pool_splits, (3, 3, 2))
+            self.assertEqual([list(column) for column in batched], serial)
+
+    def test_write_pg_sweep(self):
+        columns = [[12], [100], [25], [15], [60], [128], [64], [256],
+                   [112.0]]
+        stream = _string_stream()
+        test_mod._write_pg_sweep(stream, columns, 'csv')
+        self.assertEqual(stream.getvalue(),
+                         ','.join(test_mod.PG_SWEEP_COLUMNS) + '\n' +
+                         '12,100,25,15,60,128,64,256,112.0\n')
+        stream = _string_stream()
+        test_mod._write_pg_sweep(stream, columns, 'json')
+        report = json.loads(stream.getvalue())
+        self.assertEqual(report['columns'], test_mod.PG_SWEEP_COLUMNS)
+        self.assertEqual(report['values'], columns)
+
+    def test_parse_sweep_args(self):
+        self.assertEqual(test_mod._parse_int_list('12'), [12])
+        self.assertEqual(test_mod._parse_int_list('12:14,100'),
+                         [12, 13, 14, 100])
+        self.assertEqual(test_mod._parse_int_list('12:48:12'),
+                         [12, 24, 36, 48])
+        for bad in ['', 'a', '1:2:3:4', '0', '-5:5']:
+            self.assertRaises(argparse.ArgumentTypeError,
+                              test_mod._parse_int_list, bad)
+        self.assertEqual(test_mod._parse_pool_splits('25/15/60,40/10/50'),
+                         [(25, 15, 60), (40, 10, 50)])
+        for bad in ['25/75', 'a/b/c']:
+            self.assertRaises(argparse.ArgumentTypeError,
+                              test_mod._parse_pool_splits, bad)
+        self.assertEqual(test_mod._parse_pool_sizes('3/3/2'), (3, 3, 2))
+        for bad in ['3/3', 'a/b/c', '3/0/3']:
+            self.assertRaises(argparse.ArgumentTypeError,
+                              test_mod._parse_pool_sizes, bad)
+        self.assertEqual(test_mod._get_openstack_pool_sizes(_index(
+            {'ceph-pools': {'volumes': {'size': 2}, 'objects': {
+                'percent-data': 5, 'size': 4}}})), (3, 3, 2))
 
     @mock.patch(TEST_MODULE_STRING + '._calculate_pg_count')
     @mock.patch(TEST_MODULE_STRING + '._get_osd_count')
@@ -358,35 +705,117 @@ class TestGenerateCephAnsibleInput(unittest.TestCase):
         osd_count.return_value = 50
         pg_count.return_value = 512
         inventory = {}
-        pools = test_mod._get_openstack_pools(inventory, 100, 15, 25, 60)
+        pools = test_mod._get_openstack_pools(_index(inventory), 100, 15, 25,
+                                              60)
 
-        pg_count.assert_has_calls([mock.call(50, .15, 100),
-                                   mock.call(50, .25, 100),
-                                   mock.call(50, .60, 100)],
+        pg_count.assert_has_calls([mock.call(50, .15, 100, 3),
+                                   mock.call(50, .25, 100, 3),
+                                   mock.call(50, .60, 100, 3)],
                                   any_order=True)
         self.assertEqual(osd_count.call_count, 1)
 
         v_pools = {'openstack_glance_pool': {'name': 'images',
-                                             'pg_num': 512},
+                                             'pg_num': 512,
+                                             'pgp_num': 512,
+                                             'size': 3},
                    'openstack_nova_pool': {'name': 'vms',
-                                           'pg_num': 512},
+                                           'pg_num': 512,
+                                           'pgp_num': 512,
+                                           'size': 3},
                    'openstack_cinder_pool': {'name': 'volumes',
-                                             'pg_num': 512},
+                                             'pg_num': 512,
+                                             'pgp_num': 512,
+                                             'size': 3},
                    }
 
         self.assertDictEqual(pools, v_pools)
 
-    @mock.patch(TEST_MODULE_STRING + '._get_node_template_names_for_role',
-                return_value=['ceph-osd'])
+        # Test a pool with its own replicated size
+        inventory = {'ceph-pools': {'volumes': {'size': 2}}}
+        pools = test_mod._get_openstack_pools(_index(inventory), 100, 15, 25,
+                                              60)
+        self.assertIn(mock.call(50, .60, 100, 2), pg_count.call_args_list)
+        self.assertEqual(pools['openstack_cinder_pool']['size'], 2)
+
+        # The RBD pools of OpenStack can not be erasure coded
+        inventory = {'ceph-pools': {'vms': {'erasure-code': {'k': 4,
+                                                             'm': 2}}}}
+        with mock.patch('sys.stdout', new_callable=_string_stream):
+            self.assertRaises(SystemExit, test_mod._get_openstack_pools,
+                              _index(inventory), 100, 15, 25, 60)
+
+    @mock.patch(TEST_MODULE_STRING + '._get_osd_count')
+    def test_get_ceph_pools(self, osd_count):
+        osd_count.return_value = 60
+        inventory = {'ceph-pools': {'volumes': {'size': 2},
+                                    'objects': {'percent-data': 40,
+                                                'erasure-code': {'k': 4,
+                                                                 'm': 2}},
+                                    'backups': {'percent-data': 10,
+                                                'size': 2}}}
+        pools = test_mod._get_ceph_pools(_index(inventory), 100)
+        # 100 * 60 * .4 / (4 + 2) = 400, 100 * 60 * .1 / 2 = 300
+        self.assertEqual(pools, [{'name': 'backups', 'pg_num': 256,
+                                  'pgp_num': 256, 'size': 2},
+                                 {'name': 'objects', 'pg_num': 512,
+                                  'pgp_num': 512, 'k': 4, 'm': 2,
+                                  'erasure_code_profile':
+                                  'objects_profile'}])
+        self.assertEqual([test_mod._get_pool_width(p) for p in pools],
+                         [2, 6])
+        self.assertEqual(
+            test_mod._generate_erasure_code_profiles(pools, 'rack'),
+            [{'name': 'objects_profile', 'k': 4, 'm': 2,
+              'failure_domain': 'rack'}])
+
+        for bad in [{'objects': {'erasure-code': {'k': 4, 'm': 2}}},
+                    {'objects': {'percent-data': 5,
+                                 'erasure-code': {'k': 1, 'm': 2}}},
+                    {'objects': {'percent-data': 5, 'size': 2,
+                                 'erasure-code': {'k': 4, 'm': 2}}},
+                    {'objects': {'percent-data': 5, 'size': 0}},
+                    {'objects': {'percent-data': '40'}},
+                    {'objects': {'percent-data': True}},
+                    {'objects': {'percent-data': 0}},
+                    {'objects': {'percent-data': 150}}]:
+            with mock.patch('sys.stdout', new_callable=_string_stream):
+                self.assertRaises(SystemExit, test_mod._get_ceph_pools,
+                                  _index({'ceph-pools': bad}), 100)
+
+    def test_generate_all_vars_pools(self):
+        osd_tmpl = {'domain-settings': {test_mod.OSD_DEVICE_KEY: ['a', 'b']},
+                    test_mod.TEMPLATE_ROLES_KEY: ['ceph-osd']}
+        nodes = [{'ceph-public-storage-addr': '1.1.1.%d' % i,
+                  'rack-id': 'rack%d' % i} for i in range(6)]
+        inventory = {'networks': {'ceph-public-storage':
+                                  {'addr': '1.1.1.0/24', 'eth-port': 'eth1'}},
+                     'reference-architecture': ['ceph-standalone'],
+                     'node-templates': {'osdType1': osd_tmpl},
+                     'nodes': {'osdType1': nodes},
+                     'ceph-pools': {'objects': {'percent-data': 20,
+                                                'erasure-code': {'k': 4,
+                                                                 'm': 2}}}}
+        all_vars = test_mod._generate_all_vars(_index(inventory), 100, 25,
+                                               15, 40, True)
+        self.assertEqual([pool['name'] for pool in all_vars['ceph_pools']],
+                         ['objects'])
+        # Only the replicated pools get a CRUSH rule
+        self.assertEqual(sorted(rule['pool']
+                                for rule in all_vars['crush_rules']),
+                         ['images', 'vms', 'volumes'])
+        self.assertEqual(all_vars['erasure_code_profiles'],
+                         [{'name': 'objects_profile', 'k': 4, 'm': 2,
+                           'failure_domain': 'rack'}])
+
     @mock.patch(TEST_MODULE_STRING + '._generate_journal_device_list')
-    def test_generate_osds_vars(self, gen_journal_list, template_names):
+    def test_generate_osds_vars(self, gen_journal_list):
         # Test with journal list:
         inventory = {'node-templates':
                      {'ceph-osd': {'domain-settings':
                                    {test_mod.OSD_DEVICE_KEY: ['a'],
                                     test_mod.JOURNAL_DEVICE_KEY: ['b', 'c']}}}}
         gen_journal_list.return_value = ['d']
-        ret_vars = test_mod._generate_osds_vars(inventory)
+        ret_vars = test_mod._generate_osds_vars(_index(inventory))
         verify_vars = {'raw_multi_journal': True,
                        'raw_journal_devices': ['d'],
                        'devices': ['a']}
@@ -397,11 +826,174 @@ class TestGenerateCephAnsibleInput(unittest.TestCase):
                                      {test_mod.OSD_DEVICE_KEY: ['a', 'b']}}}
         inventory = {'node-templates': osd_template}
         gen_journal_list.return_value = ['d']
-        ret_vars = test_mod._generate_osds_vars(inventory)
+        ret_vars = test_mod._generate_osds_vars(_index(inventory))
         verify_vars = {'journal_collocation': True,
                        'devices': ['a', 'b']}
         self.assertDictEqual(ret_vars, verify_vars)
 
+    def test_generate_osd_host_vars(self):
+        journal_tmpl = {'domain-settings':
+                        {test_mod.OSD_DEVICE_KEY: ['a', 'b', 'c'],
+                         test_mod.JOURNAL_DEVICE_KEY: ['j1']},
+                        test_mod.TEMPLATE_ROLES_KEY: ['ceph-osd']}
+        colloc_tmpl = {'domain-settings':
+                       {test_mod.OSD_DEVICE_KEY: ['d', 'e']},
+                       test_mod.TEMPLATE_ROLES_KEY: ['ceph-osd']}
+        inventory = {'node-templates': {'osdType1': journal_tmpl,
+                                        'osdType2': colloc_tmpl,
+                                        'controllers': {}},
+                     'nodes': {'osdType1': [{'openstack-stg-addr': '1.1.1.1'},
+                                            {'openstack-stg-addr': '1.1.1.2'}],
+                               'osdType2': [{'openstack-stg-addr': '1.1.1.3'}],
+                               'controllers': [{'openstack-stg-addr':
+                                                '1.1.1.4'}]}}
+        host_vars = test_mod._generate_osd_host_vars(_index(inventory))
+        journal_vars = {'devices': ['a', 'b', 'c'],
+                        'raw_multi_journal': True,
+                        'raw_journal_devices': ['j1', 'j1', 'j1'],
+                        'journal_collocation': False}
+        colloc_vars = {'devices': ['d', 'e'],
+                       'raw_multi_journal': False,
+                       'journal_collocation': True}
+        self.assertDictEqual(host_vars, {'1.1.1.1': journal_vars,
+                                         '1.1.1.2': journal_vars,
+                                         '1.1.1.3': colloc_vars})
+
+    def test_crush_location(self):
+        osd_tmpl = {'domain-settings': {test_mod.OSD_DEVICE_KEY: ['a', 'b']},
+                    test_mod.TEMPLATE_ROLES_KEY: ['ceph-osd']}
+        nodes = [{'openstack-stg-addr': '1.1.1.%d' % i,
+                  'row-id': 'r%d' % (i % 2),
+                  'rack-id': 'rack%d' % (i % 4),
+                  'chassis-id': 'c%d' % i} for i in range(1, 5)]
+        inventory = {'node-templates': {'osdType1': osd_tmpl},
+                     'nodes': {'osdType1': nodes}}
+        index = _index(inventory)
+        host_vars = test_mod._generate_osd_host_vars(index)
+        self.assertTrue(host_vars['1.1.1.1']['crush_location'])
+        self.assertEqual(host_vars['1.1.1.1']['osd_crush_location'],
+                         "'root=default row=r1 rack=rack1 chassis=c1 "
+                         "host={{ ansible_hostname }}'")
+        self.assertEqual(test_mod._get_failure_domains(index),
+                         {'row': 2, 'rack': 4, 'chassis': 4, 'host': 4})
+
+        # Rack is the widest bucket type with 3 buckets
+        self.assertEqual(test_mod._choose_failure_domain(index, 'auto', 3),
+                         ('rack', ['Only 2 rows have OSD hosts, 3 are '
+                                   'needed for the row failure domain.']))
+        self.assertEqual(test_mod._choose_failure_domain(index, 'row', 2),
+                         ('row', []))
+        with mock.patch('sys.stdout', new_callable=_string_stream):
+            self.assertRaises(SystemExit, test_mod._choose_failure_domain,
+                              index, 'row', 3)
+
+        # A node without a rack disables the rack failure domain
+        del nodes[0]['rack-id']
+        host_vars = test_mod._generate_osd_host_vars(index)
+        self.assertEqual(host_vars['1.1.1.1']['osd_crush_location'],
+                         "'root=default row=r1 chassis=c1 "
+                         "host={{ ansible_hostname }}'")
+        self.assertEqual(test_mod._get_failure_domains(index),
+                         {'row': 2, 'chassis': 4, 'host': 4})
+        self.assertEqual(test_mod._choose_failure_domain(index, 'auto', 3)[0],
+                         'chassis')
+
+        # Too few hosts for the replicas
+        for node in nodes:
+            for key in ('row-id', 'rack-id', 'chassis-id'):
+                node.pop(key, None)
+        del nodes[2:]
+        host_vars = test_mod._generate_osd_host_vars(index)
+        self.assertNotIn('osd_crush_location', host_vars['1.1.1.1'])
+        domain, warnings = test_mod._choose_failure_domain(index, 'auto', 3)
+        self.assertEqual(domain, 'host')
+        self.assertEqual(len(warnings), 1)
+
+        rules = test_mod._generate_crush_rules(['vms', 'images'], 'rack')
+        self.assertEqual(rules, [{'name': 'images_rack', 'pool': 'images',
+                                  'root': 'default', 'type': 'rack'},
+                                 {'name': 'vms_rack', 'pool': 'vms',
+                                  'root': 'default', 'type': 'rack'}])
+
+    def test_generate_inventory_json(self):
+        osd_tmpl = {'domain-settings':
+                    {test_mod.OSD_DEVICE_KEY: ['a', 'b'],
+                     test_mod.JOURNAL_DEVICE_KEY: ['j1']},
+                    test_mod.TEMPLATE_ROLES_KEY: ['ceph-osd', 'ceph-monitor']}
+        inventory = {'node-templates': {'osdType1': osd_tmpl,
+                                        'controllers': {}},
+                     'nodes': {'osdType1': [{'openstack-stg-addr': '1.1.1.1'},
+                                            {'openstack-stg-addr': '1.1.1.2'}],
+                               'controllers': [{'openstack-stg-addr':
+                                                '1.1.1.4'}]}}
+        index = _index(inventory)
+        osd_host_vars = test_mod._generate_osd_host_vars(index)
+        document = json.loads(test_mod._generate_inventory_json(
+            index, osd_host_vars))
+        self.assertItemsEqual(document['mons']['hosts'],
+                              ['1.1.1.1', '1.1.1.2', '1.1.1.4'])
+        self.assertItemsEqual(document['osds']['hosts'],
+                              ['1.1.1.1', '1.1.1.2'])
+        osd_vars = {'storage_address': '1.1.1.1',
+                    'devices': ['a', 'b'],
+                    'raw_multi_journal': True,
+                    'raw_journal_devices': ['j1', 'j1'],
+                    'journal_collocation': False}
+        host_vars = document['_meta']['hostvars']
+        self.assertDictEqual(host_vars['1.1.1.1'], osd_vars)
+        self.assertEqual(host_vars['1.1.1.2']['storage_address'], '1.1.1.2')
+        self.assertDictEqual(host_vars['1.1.1.4'],
+                             {'storage_address': '1.1.1.4'})
+
+    def test_inventory_script(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        script = os.path.join(tmp_dir, 'ceph-hosts')
+        document = {'mons': {'hosts': ['1.1.1.1']},
+                    '_meta': {'hostvars': {'1.1.1.1': {'a': 1}}}}
+        test_mod._write_string(script + '.json', json.dumps(document))
+        self.assertTrue(test_mod._write_string(script,
+                                               test_mod.INVENTORY_SCRIPT,
+                                               0o777))
+        self.assertTrue(os.access(script, os.X_OK))
+        output = subprocess.check_output([sys.executable, script, '--list'])
+        self.assertEqual(json.loads(output), document)
+        output = subprocess.check_output([sys.executable, script, '--host',
+                                          '1.1.1.1'])
+        self.assertEqual(json.loads(output), {'a': 1})
+
+    @mock.patch(TEST_MODULE_STRING + '._write_yml')
+    def test_write_host_vars(self, write_yml):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        host_vars_dir = os.path.join(tmp_dir, 'host_vars')
+        write_yml.side_effect = [True, False]
+        outputs = test_mod._write_host_vars(host_vars_dir,
+                                            {'1.1.1.1': {'a': 1},
+                                             '1.1.1.2': {'b': 2}})
+        self.assertTrue(os.path.isdir(host_vars_dir))
+        self.assertItemsEqual(outputs.keys(),
+                              [os.path.join(host_vars_dir, '1.1.1.1'),
+                               os.path.join(host_vars_dir, '1.1.1.2')])
+        self.assertItemsEqual(outputs.values(), [True, False])
+        write_yml.assert_has_calls(
+            [mock.call(os.path.join(host_vars_dir, '1.1.1.1'), {'a': 1}),
+             mock.call(os.path.join(host_vars_dir, '1.1.1.2'), {'b': 2})],
+            any_order=True)
+
+        # Test the files of hosts that are no longer generated are removed
+        for name in ('1.1.1.1', '1.1.1.9', '.1.1.1.1.tmp'):
+            with open(os.path.join(host_vars_dir, name), 'w') as stream:
+                stream.write('devices: []\n')
+        write_yml.side_effect = None
+        with mock.patch('sys.stdout', new_callable=_string_stream):
+            test_mod._write_host_vars(host_vars_dir, {'1.1.1.1': {'a': 1}})
+        self.assertItemsEqual(os.listdir(host_vars_dir),
+                              ['1.1.1.1', '.1.1.1.1.tmp'])
+        with mock.patch('sys.stdout', new_callable=_string_stream):
+            removed = test_mod._prune_host_vars(host_vars_dir, ())
+        self.assertEqual(removed, [os.path.join(host_vars_dir, '1.1.1.1')])
+
     def test_generate_hosts_file(self):
         # Test private compute flavors with original template = role
         templates = {'controllers': {},
@@ -422,7 +1014,7 @@ class TestGenerateCephAnsibleInput(unittest.TestCase):
         inventory = {'reference-architecture': ['private-compute-cloud'],
                      'nodes': the_nodes,
                      'node-templates': templates}
-        hosts_file = test_mod._generate_hosts_file(inventory)
+        hosts_file = test_mod._generate_hosts_file(_index(inventory))
         expected_file = ('[mons]\n'
                          '172.29.244.2\n'
                          '172.29.244.3\n'
@@ -458,7 +1050,7 @@ class TestGenerateCephAnsibleInput(unittest.TestCase):
                      'reference-architecture': ref_arch,
                      'nodes': the_nodes,
                      'node-templates': templates}
-        hosts_file = test_mod._generate_hosts_file(inventory)
+        hosts_file = test_mod._generate_hosts_file(_index(inventory))
         expected_file = ('[mons]\n'
                          '172.29.244.2\n'
                          '172.29.244.3\n'
@@ -482,7 +1074,7 @@ class TestGenerateCephAnsibleInput(unittest.TestCase):
         inventory = {'reference-architecture': ['private-compute-cloud'],
                      'nodes': the_nodes,
                      'node-templates': templates}
-        hosts_file = test_mod._generate_hosts_file(inventory)
+        hosts_file = test_mod._generate_hosts_file(_index(inventory))
         expected_file = ('[mons]\n'
                          '172.29.244.2\n'
                          '172.29.244.3\n'
@@ -493,24 +1085,106 @@ class TestGenerateCephAnsibleInput(unittest.TestCase):
                          '172.29.244.4')
         self.assertEqual(hosts_file, expected_file)
 
+    def test_load_write_yml(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        file_name = os.path.join(tmp_dir, 'all')
+        contents = {'devices': ['/dev/sdb', '/dev/sdc'],
+                    'journal_size': 10240,
+                    'openstack_config': True,
+                    'openstack_glance_pool': {'name': 'images',
+                                              'pg_num': 128}}
+        test_mod._write_yml(file_name, contents)
+        with open(file_name, 'r') as stream:
+            written = stream.read()
+        self.assertIn('devices:\n- /dev/sdb\n- /dev/sdc\n', written)
+        self.assertNotIn('!!python', written)
+        self.assertDictEqual(test_mod._load_yml(file_name), contents)
+
+        # Test invalid yaml exits
+        with open(file_name, 'w') as stream:
+            stream.write('a: [b\n')
+        self.assertRaises(SystemExit, test_mod._load_yml, file_name)
+
+    def test_atomic_file(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        file_name = os.path.join(tmp_dir, 'ceph-hosts')
+
+        # Test new file
+        self.assertTrue(test_mod._write_string(file_name, '[mons]\n1.1.1.1'))
+        with open(file_name, 'r') as stream:
+            self.assertEqual(stream.read(), '[mons]\n1.1.1.1')
+        self.assertEqual(os.listdir(tmp_dir), ['ceph-hosts'])
+
+        # Test unchanged contents leave the file untouched
+        os.utime(file_name, (1, 1))
+        self.assertFalse(test_mod._write_string(file_name,
+                                                '[mons]\n1.1.1.1'))
+        self.assertEqual(os.path.getmtime(file_name), 1)
+        self.assertTrue(test_mod._write_yml(file_name + '.yml', {'a': 1}))
+        self.assertFalse(test_mod._write_yml(file_name + '.yml', {'a': 1}))
+
+        # Test changed contents of the same size replace the file
+        self.assertTrue(test_mod._write_string(file_name,
+                                               '[mons]\n1.1.1.2'))
+        with open(file_name, 'r') as stream:
+            self.assertEqual(stream.read(), '[mons]\n1.1.1.2')
+        self.assertNotEqual(os.path.getmtime(file_name), 1)
+
+        # Test only a replaced file is synced to disk
+        with mock.patch('os.fsync') as fsync:
+            self.assertFalse(test_mod._write_string(file_name,
+                                                    '[mons]\n1.1.1.2'))
+            self.assertFalse(fsync.called)
+            self.assertTrue(test_mod._write_string(file_name + '.new', 'a'))
+            self.assertEqual(fsync.call_count, 1)
+        os.remove(file_name + '.new')
+
+        # Test a failure while writing leaves the original in place
+        def fail():
+            with test_mod.AtomicFile(file_name) as stream:
+                stream.write('[mons]\n')
+                raise IOError('disk full')
+        self.assertRaises(IOError, fail)
+        with open(file_name, 'r') as stream:
+            self.assertEqual(stream.read(), '[mons]\n1.1.1.2')
+        self.assertItemsEqual(os.listdir(tmp_dir),
+                              ['ceph-hosts', 'ceph-hosts.yml'])
+
+    @mock.patch(TEST_MODULE_STRING + '._write_host_vars')
+    @mock.patch(TEST_MODULE_STRING + '._generate_osd_host_vars')
     @mock.patch(TEST_MODULE_STRING + '._write_string')
     @mock.patch(TEST_MODULE_STRING + '._write_yml')
     @mock.patch(TEST_MODULE_STRING + '._generate_hosts_file')
     @mock.patch(TEST_MODULE_STRING + '._generate_osds_vars')
     @mock.patch(TEST_MODULE_STRING + '._generate_all_vars')
+    @mock.patch(TEST_MODULE_STRING + '.InventoryIndex')
     @mock.patch(TEST_MODULE_STRING + '._load_yml')
-    def test_generate_files(self, load_yml, all_vars, osds, hosts,
-                            write_yml, write_string):
+    def test_generate_files(self, load_yml, inv_index, all_vars, osds, hosts,
+                            write_yml, write_string, osd_host_vars,
+                            write_host_vars):
         # Test successful path
         inventory_file = '/test/inventory_file'
         root_dir = '/root_dir'
         inventory_contents = {'node-templates': {'ceph-osd': 'osdhosts'}}
         load_yml.return_value = inventory_contents
-        test_mod.generate_files(root_dir, inventory_file, 200, 1, 1, 1, True)
+        write_yml.return_value = False
+        write_string.return_value = True
+        write_host_vars.return_value = {'/root_dir/host_vars/a': True}
+        outputs = test_mod.generate_files(root_dir, inventory_file, 200, 1,
+                                          1, 1, True)
+        self.assertDictEqual(outputs,
+                             {'/root_dir/group_vars/all': False,
+                              '/root_dir/group_vars/osds': False,
+                              '/root_dir/host_vars/a': True,
+                              '/root_dir/ceph-hosts': True})
         load_yml.assert_called_once_with(inventory_file)
-        all_vars.assert_called_once_with(inventory_contents, 200, 1, 1, 1,
-                                         True)
-        osds.assert_called_once_with(inventory_contents)
+        inv_index.assert_called_once_with(inventory_contents)
+        all_vars.assert_called_once_with(inv_index.return_value, 200, 1, 1,
+                                         1, True, 'auto', [])
+        osds.assert_called_once_with(inv_index.return_value)
+        hosts.assert_called_once_with(inv_index.return_value)
         write_yml.assert_has_calls(
             [mock.call(root_dir + os.path.sep + 'group_vars' +
                        os.path.sep + 'all', all_vars.return_value),
@@ -518,6 +1192,163 @@ class TestGenerateCephAnsibleInput(unittest.TestCase):
                        os.path.sep + 'osds', osds.return_value)])
         write_string.assert_called_once_with(root_dir + os.path.sep +
                                              'ceph-hosts', hosts.return_value)
+        osd_host_vars.assert_called_once_with(inv_index.return_value)
+        write_host_vars.assert_called_once_with(
+            root_dir + os.path.sep + 'host_vars', osd_host_vars.return_value)
+
+    @mock.patch(TEST_MODULE_STRING + '._write_host_vars')
+    @mock.patch(TEST_MODULE_STRING + '._generate_inventory_json')
+    @mock.patch(TEST_MODULE_STRING + '._generate_osd_host_vars')
+    @mock.patch(TEST_MODULE_STRING + '._write_string')
+    @mock.patch(TEST_MODULE_STRING + '._write_yml')
+    @mock.patch(TEST_MODULE_STRING + '._generate_osds_vars')
+    @mock.patch(TEST_MODULE_STRING + '._generate_all_vars')
+    @mock.patch(TEST_MODULE_STRING + '.InventoryIndex')
+    @mock.patch(TEST_MODULE_STRING + '._load_yml')
+    def test_generate_files_json(self, load_yml, inv_index, all_vars, osds,
+                                 write_yml, write_string, osd_host_vars,
+                                 inventory_json, write_host_vars):
+        root_dir = '/root_dir'
+        write_yml.return_value = False
+        write_string.return_value = True
+        outputs = test_mod.generate_files(root_dir, '/test/inventory_file',
+                                          200, 1, 1, 1, True,
+                                          test_mod.INVENTORY_FORMAT_JSON)
+        self.assertDictEqual(outputs,
+                             {'/root_dir/group_vars/all': False,
+                              '/root_dir/group_vars/osds': False,
+                              '/root_dir/ceph-hosts.json': True,
+                              '/root_dir/ceph-hosts': True})
+        inventory_json.assert_called_once_with(inv_index.return_value,
+                                               osd_host_vars.return_value)
+        write_string.assert_has_calls(
+            [mock.call('/root_dir/ceph-hosts.json',
+                       inventory_json.return_value),
+             mock.call('/root_dir/ceph-hosts', test_mod.INVENTORY_SCRIPT,
+                       0o777)])
+        self.assertFalse(write_host_vars.called)
+
+    def test_generate_files_cache(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        root_dir = os.path.join(tmp_dir, 'root')
+        os.makedirs(os.path.join(root_dir, 'group_vars'))
+        inventory_file = os.path.join(tmp_dir, 'inventory.yml')
+        osd_tmpl = {'domain-settings': {test_mod.OSD_DEVICE_KEY: ['a']}}
+        inventory = {'node-templates': {'ceph-osd': osd_tmpl,
+                                        'controllers': {}},
+                     'networks': {'openstack-stg': {'addr': '1.1.1.0/24'}},
+                     'nodes': {'ceph-osd': [{'openstack-stg-addr': '1.1.1.1'}],
+                               'controllers': [{'openstack-stg-addr':
+                                                '1.1.1.2'}]}}
+        test_mod._write_yml(inventory_file, inventory)
+        args = (root_dir, inventory_file, 100, 25, 15, 60, True,
+                test_mod.INVENTORY_FORMAT_INI, True)
+        with mock.patch('sys.stdout', _string_stream()) as out:
+            outputs = test_mod.generate_files(*args)
+        self.assertTrue(all(outputs.values()))
+        # A single OSD host can not hold 3 replicas
+        warnings = [line for line in out.getvalue().splitlines()
+                    if line.startswith('WARNING: ')]
+        self.assertTrue(warnings)
+        cache_dir = os.path.join(root_dir, test_mod.CACHE_DIR)
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+        hosts_file = os.path.join(root_dir, 'ceph-hosts')
+        host_vars_file = os.path.join(root_dir, 'host_vars', '1.1.1.1')
+        with open(host_vars_file, 'r') as stream:
+            host_vars = stream.read()
+
+        # Test a cache hit rewrites the outputs without loading the
+        # inventory
+        os.remove(hosts_file)
+        shutil.rmtree(os.path.join(root_dir, 'host_vars'))
+        with mock.patch(self.TEST_MODULE_STRING + '._load_yml') as load_yml:
+            with mock.patch('sys.stdout', _string_stream()) as out:
+                cached = test_mod.generate_files(*args)
+            self.assertFalse(load_yml.called)
+        # The warnings are printed again
+        self.assertEqual([line for line in out.getvalue().splitlines()
+                          if line.startswith('WARNING: ')], warnings)
+        self.assertItemsEqual(cached.keys(), outputs.keys())
+        self.assertTrue(cached[hosts_file])
+        self.assertFalse(cached[os.path.join(root_dir, 'group_vars', 'all')])
+        with open(hosts_file, 'r') as stream:
+            self.assertEqual(stream.read(), '[mons]\n1.1.1.2\n\n[osds]\n'
+                             '1.1.1.1')
+        with open(host_vars_file, 'r') as stream:
+            self.assertEqual(stream.read(), host_vars)
+
+        # Test different parameters miss the cache
+        with mock.patch('sys.stdout', _string_stream()):
+            test_mod.generate_files(*args[:2] + (200,) + args[3:])
+        self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+    def test_report_outputs(self):
+        outputs = {'/a/ceph-hosts': True, '/a/host_vars/1.1.1.1': False,
+                   '/a/host_vars/1.1.1.2': True}
+        with mock.patch('sys.stdout', new_callable=_string_stream) as out:
+            test_mod._report_outputs(outputs)
+        self.assertEqual(out.getvalue(),
+                         '2 generated files changed, 1 unchanged.\n')
+        with mock.patch('sys.stdout', new_callable=_string_stream) as out:
+            test_mod._report_outputs(outputs, verbose=True)
+        self.assertEqual(out.getvalue().splitlines()[1:],
+                         ['  updated: /a/ceph-hosts',
+                          '  updated: /a/host_vars/1.1.1.2'])
+
+    def test_profiler(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        root_dir = os.path.join(tmp_dir, 'root')
+        os.makedirs(os.path.join(root_dir, 'group_vars'))
+        inventory_file = os.path.join(tmp_dir, 'inventory.yml')
+        osd_tmpl = {'domain-settings': {test_mod.OSD_DEVICE_KEY: ['a']}}
+        inventory = {'node-templates': {'ceph-osd': osd_tmpl},
+                     'networks': {'openstack-stg': {'addr': '1.1.1.0/24'}},
+                     'nodes': {'ceph-osd': [{'openstack-stg-addr':
+                                             '1.1.1.1'}]}}
+        test_mod._write_yml(inventory_file, inventory)
+        profiler = test_mod.Profiler()
+        with mock.patch('sys.stdout', _string_stream()):
+            test_mod.generate_files(root_dir, inventory_file, 100, 25, 15,
+                                    60, False, use_cache=True,
+                                    profiler=profiler)
+        self.assertEqual([phase['name'] for phase in profiler.phases],
+                         ['cache_lookup', 'load', 'all_vars', 'osds_vars',
+                          'osd_host_vars', 'inventory', 'cache_store'])
+        for phase in profiler.phases:
+            self.assertGreaterEqual(phase['peak_rss_growth_kb'], 0)
+            self.assertNotIn('peak_rss_kb', phase)
+
+        # A cache hit only has the cache lookup phase
+        profiler = test_mod.Profiler()
+        with mock.patch('sys.stdout', _string_stream()):
+            test_mod.generate_files(root_dir, inventory_file, 100, 25, 15,
+                                    60, False, use_cache=True,
+                                    profiler=profiler)
+        self.assertEqual([phase['name'] for phase in profiler.phases],
+                         ['cache_lookup'])
+
+        profile_file = os.path.join(tmp_dir, 'profile.json')
+        profiler.write(profile_file)
+        with open(profile_file, 'r') as stream:
+            report = json.load(stream)
+        self.assertEqual(report['phases'], profiler.phases)
+        self.assertGreater(report['peak_rss_kb'], 0)
+        self.assertGreaterEqual(report['total_seconds'],
+                                report['phases'][0]['seconds'])
+
+    def test_evict_cache(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        for age, name in enumerate(['c', 'b', 'a']):
+            file_name = os.path.join(tmp_dir, name + '.json')
+            test_mod._write_string(file_name, '0123456789')
+            os.utime(file_name, (age, age))
+        test_mod._evict_cache(tmp_dir, 25)
+        self.assertItemsEqual(os.listdir(tmp_dir), ['a.json', 'b.json'])
+        test_mod._evict_cache(tmp_dir, 5)
+        self.assertEqual(os.listdir(tmp_dir), ['a.json'])
 
     def test_get_node_template_names_for_role(self):
         # Test backward compatibility
@@ -583,37 +1414,41 @@ class TestGenerateCephAnsibleInput(unittest.TestCase):
                                                          'ceph-osd')
         self.assertItemsEqual(ret, ['osdType1', 'osdType2'])
 
-    @mock.patch(TEST_MODULE_STRING + '._get_node_template_names_for_role')
-    def test_get_nodes_for_role(self, templs_for_roles):
-
-        nodes = {'noise': '',
-                 'noise2': '',
-                 'target1': ['n1', 'n2', 'n3'],
-                 'target2': ['n4'],
-                 'noise3': '',
-                 'target3': ['n5', 'n6']}
-
-        inventory = {'nodes': nodes}
-        # Test that if templates is passed it's used and
-        # _get_node_template_names_for_role is not called
-        ret = test_mod._get_nodes_for_role(inventory, 'junk', ['target1',
-                                                               'target2',
-                                                               'target3'])
-
-        self.assertEqual(templs_for_roles.call_count, 0)
-        self.assertItemsEqual(['n1', 'n2', 'n3', 'n4', 'n5', 'n6'], ret)
-        # Test getting only 2 targets
-        templs_for_roles.return_value = ['target2', 'target3']
-        ret = test_mod._get_nodes_for_role(inventory, 'junk')
-        templs_for_roles.assert_called_with(inventory, 'junk')
-        self.assertItemsEqual(['n4', 'n5', 'n6'], ret)
-
-        # Test getting single target
-        templs_for_roles.reset_mock()
-        templs_for_roles.return_value = ['target1']
-        ret = test_mod._get_nodes_for_role(inventory, 'junk')
-        templs_for_roles.assert_called_with(inventory, 'junk')
-        self.assertItemsEqual(['n1', 'n2', 'n3'], ret)
+    def test_inventory_index(self):
+        templates = {'noise': {},
+                     'target1': {test_mod.TEMPLATE_ROLES_KEY: ['junk']},
+                     'target2': {test_mod.TEMPLATE_ROLES_KEY: ['junk',
+                                                               'other']},
+                     'controllers': {}}
+        nodes = {'noise': [{'openstack-stg-addr': '1.1.1.1'}],
+                 'target1': [{'openstack-stg-addr': '1.1.1.2'},
+                             {'openstack-stg-addr': '1.1.1.3'}],
+                 'target2': [{'openstack-stg-addr': '1.1.1.4'}],
+                 'controllers': [{'openstack-stg-addr': '1.1.1.5'}]}
+        inventory = {'node-templates': templates, 'nodes': nodes}
+        index = test_mod.InventoryIndex(inventory)
+        self.assertEqual(index.storage_network, 'openstack-stg')
+        self.assertEqual(index.storage_addr_key, 'openstack-stg-addr')
+        self.assertItemsEqual(index.get_templates_for_role('junk'),
+                              ['target1', 'target2'])
+        self.assertEqual(index.get_templates_for_role('other'), ['target2'])
+        self.assertEqual(index.get_templates_for_role('missing'), [])
+        self.assertItemsEqual(index.get_templates_for_role('ceph-monitor'),
+                              ['controllers'])
+        self.assertItemsEqual(index.get_nodes_for_role('junk'),
+                              nodes['target1'] + nodes['target2'])
+        self.assertItemsEqual(index.get_storage_addrs_for_role('junk'),
+                              ['1.1.1.2', '1.1.1.3', '1.1.1.4'])
+        self.assertEqual(index.get_storage_addrs_for_role('ceph-monitor'),
+                         ['1.1.1.5'])
+
+        # Test the lookups are only computed once
+        templates['noise'][test_mod.TEMPLATE_ROLES_KEY] = ['junk']
+        nodes['target2'].append({'openstack-stg-addr': '1.1.1.6'})
+        self.assertItemsEqual(index.get_templates_for_role('junk'),
+                              ['target1', 'target2'])
+        self.assertEqual(len(index.get_storage_addrs_for_role('junk')), 3)
+
 
 if __name__ == "__main__":
     # import sys;sys.argv = ['', 'Test.testName']
@@ -0,0 +1,186 @@
+# Copyright 2017 IBM US, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import mock
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+TOP_DIR = os.path.join(os.getcwd(), os.path.dirname(__file__), '../..')
+TOOLS_DIR = 'tools'
+sys.path.append(os.path.join(TOP_DIR, TOOLS_DIR))
+
+import mkdiffs as test_mod
+
+
+class TestMkDiffs(unittest.TestCase):
+
+    def setUp(self):
+        super(TestMkDiffs, self).setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def _write(self, name, contents):
+        file_name = os.path.join(self.tmp_dir, name)
+        if not os.path.isdir(os.path.dirname(file_name)):
+            os.makedirs(os.path.dirname(file_name))
+        with open(file_name, 'w') as stream:
+            stream.write(contents)
+        return file_name
+
+    def test_make_patch(self):
+        orig = self._write('orig/site.yml', 'a\nb\nc\n')
+        new = self._write('new/site.yml', 'a\nB\nc\n')
+        patch = test_mod.make_patch('/opt/ceph-ansible', orig, new)
+        lines = patch.splitlines()
+        self.assertEqual(lines[0], 'diff -Naur a/opt/ceph-ansible/site.yml '
+                                   'b/opt/ceph-ansible/site.yml')
+        self.assertTrue(lines[1].startswith(
+            '--- a/opt/ceph-ansible/site.yml\t'))
+        self.assertTrue(lines[2].startswith(
+            '+++ b/opt/ceph-ansible/site.yml\t'))
+        self.assertEqual(lines[3:], ['@@ -1,3 +1,3 @@', ' a', '-b', '+B',
+                                     ' c'])
+
+        # Test unchanged files
+        self.assertIsNone(test_mod.make_patch('/opt', orig, orig))
+
+        # Test a new file without a newline at the end
+        new = self._write('new/new.yml', 'a\nb')
+        patch = test_mod.make_patch('/opt', None, new)
+        lines = patch.splitlines()
+        self.assertEqual(lines[1], '--- a/opt/new.yml\t' +
+                         test_mod._diff_timestamp(None))
+        self.assertEqual(lines[3:], ['@@ -0,0 +1,2 @@', '+a', '+b',
+                                     '\\ No newline at end of file'])
+
+    def test_mirror_name(self):
+        for url in ['https://github.com/ceph/ceph-ansible',
+                    'https://github.com/ceph/ceph-ansible.git',
+                    'https://github.com/ceph/ceph-ansible/']:
+            self.assertEqual(test_mod._mirror_name(url),
+                             'github.com-ceph-ceph-ansible.git')
+        self.assertEqual(test_mod._mirror_name('git@github.com:ceph/x.git'),
+                         'git-github.com-ceph-x.git')
+
+    def test_git_clone(self):
+        src = os.path.join(self.tmp_dir, 'src')
+        repo = test_mod.git.Repo.init(src)
+        repo.git.config('user.email', 'test@example.com')
+        repo.git.config('user.name', 'test')
+        repo.git.commit('--allow-empty', '-m', 'one')
+        repo.git.tag('v1')
+        url = 'file://' + src
+        mirror_dir = os.path.join(self.tmp_dir, 'mirrors')
+        tgt = os.path.join(self.tmp_dir, 'tgt')
+
+        test_mod.git_clone(url, 'v1', tgt, mirror_dir)
+        mirror = os.path.join(mirror_dir, test_mod._mirror_name(url))
+        self.assertTrue(test_mod.git.Repo(mirror).bare)
+        clone = test_mod.git.Repo(tgt)
+        self.assertEqual(clone.git.describe('--tags'), 'v1')
+        self.assertEqual(clone.git.remote('get-url', 'origin'), url)
+
+        # Test a new tag is fetched into the existing mirror
+        repo.git.commit('--allow-empty', '-m', 'two')
+        repo.git.tag('v2')
+        test_mod.git_clone(url, 'v2', tgt, mirror_dir)
+        self.assertEqual(test_mod.git.Repo(tgt).git.describe('--tags'), 'v2')
+
+        # Test the mirror is used when the project can not be reached
+        shutil.rmtree(src)
+        with mock.patch('sys.stdout'):
+            test_mod.git_clone(url, 'v1', tgt, mirror_dir)
+        self.assertEqual(test_mod.git.Repo(tgt).git.describe('--tags'), 'v1')
+
+    def test_diff_timestamp(self):
+        file_name = self._write('a', 'a')
+        os.utime(file_name, (0, 86400.5))
+        with mock.patch('time.localtime', time.gmtime):
+            self.assertEqual(test_mod._diff_timestamp(file_name),
+                             '1970-01-02 00:00:00.500000000 +0000')
+
+    def test_create_file_diffs(self):
+        src = os.path.join(self.tmp_dir, 'src')
+        changes = os.path.join(self.tmp_dir, 'changes')
+        diffs = os.path.join(self.tmp_dir, 'diffs')
+        os.mkdir(diffs)
+        self._write('src/ceph-ansible/roles/a.yml', 'a\n')
+        self._write('src/ceph-ansible/b.yml', 'b\n')
+        self._write('changes/ceph-ansible/roles/a.yml', 'A\n')
+        self._write('changes/ceph-ansible/b.yml', 'b\n')
+        self._write('changes/ceph-ansible/c.yml', 'c\n')
+        conf = {'gitsrc_loc': src, 'temp_diff_loc': diffs,
+                'changes_loc': changes,
+                'projects': [{'src_location': 'ceph-ansible',
+                              'target_location': '/opt/ceph-ansible'}]}
+        crt_diffs = test_mod.CreateDiffs(conf, jobs=2)
+        with mock.patch('sys.stdout'):
+            crt_diffs.create_file_diffs()
+        # The unchanged b.yml has no patch
+        self.assertItemsEqual(
+            os.listdir(diffs),
+            [test_mod.MANIFEST_FILE, 'opt-ceph-ansible-roles-a.yml.patch',
+             'opt-ceph-ansible-c.yml.patch'])
+        with open(os.path.join(diffs,
+                               'opt-ceph-ansible-c.yml.patch')) as stream:
+            self.assertEqual(stream.readline(),
+                             'diff -Naur a/opt/ceph-ansible/c.yml '
+                             'b/opt/ceph-ansible/c.yml\n')
+
+        def run(force=False):
+            crt_diffs = test_mod.CreateDiffs(conf, force=force)
+            crt_diffs.create_dir()
+            with mock.patch('sys.stdout'):
+                return crt_diffs.create_file_diffs()
+
+        # Test nothing is generated again when no input changed
+        self.assertEqual(run(), 0)
+        self.assertEqual(run(force=True), 3)
+
+        # Test only the changed inputs are generated again
+        self._write('changes/ceph-ansible/b.yml', 'B\n')
+        self._write('src/ceph-ansible/roles/a.yml', 'A\n')
+        self.assertEqual(run(), 2)
+        self.assertItemsEqual(
+            os.listdir(diffs),
+            [test_mod.MANIFEST_FILE, 'opt-ceph-ansible-b.yml.patch',
+             'opt-ceph-ansible-c.yml.patch'])
+
+        # Test the patch of a removed change is removed
+        os.remove(os.path.join(changes, 'ceph-ansible', 'c.yml'))
+        self.assertEqual(run(), 0)
+        self.assertItemsEqual(
+            os.listdir(diffs),
+            [test_mod.MANIFEST_FILE, 'opt-ceph-ansible-b.yml.patch'])
+
+    def test_find_project(self):
+        conf = {'gitsrc_loc': '/src', 'temp_diff_loc': '/diffs',
+                'changes_loc': '/changes',
+                'projects': [{'src_location': 'ceph-ansible'},
+                             {'src_location': 'other'}],
+                'files': [{'target': '/etc/a.yml', 'source': '/src/a.yml'}]}
+        crt_diffs = test_mod.CreateDiffs(conf)
+        self.assertEqual(crt_diffs.find_project('/changes',
+                                                '/changes/other/roles'),
+                         {'src_location': 'other'})
+        self.assertIsNone(crt_diffs.find_project('/changes',
+                                                 '/changes/files/etc'))
+        self.assertEqual(crt_diffs.find_file('/etc/a.yml')['source'],
+                         '/src/a.yml')
+        self.assertIsNone(crt_diffs.find_file('/etc/b.yml'))
@@ -0,0 +1,135 @@
+# Copyright 2017 IBM US, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import mock
+import os
+import os.path
+import sys
+import unittest
+
+TOP_DIR = os.path.join(os.getcwd(), os.path.dirname(__file__), '../..')
+SCRIPT_DIR = 'scripts/ulysses_ceph'
+sys.path.append(os.path.join(TOP_DIR, SCRIPT_DIR))
+
+try:
+    import numpy
+    import pg_simulator as test_mod
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class TestPgSimulator(unittest.TestCase):
+
+    def test_place(self):
+        osd_counts = [2, 3, 4, 4]
+        first_osd = [0, 2, 5, 9]
+        placement = test_mod.Placement(osd_counts)
+        self.assertEqual(placement.size, 3)
+        self.assertEqual(placement.osd_count, 13)
+        result = placement.place(0, 1000)
+        self.assertEqual(result.shape, (1000, 3))
+        host_of_osd = numpy.repeat(numpy.arange(4), osd_counts)
+        for row in result:
+            # Every replica is on a different host
+            self.assertEqual(len(set(host_of_osd[row])), 3)
+        # Every OSD gets PGs
+        self.assertTrue((numpy.bincount(result.ravel()) > 0).all())
+        self.assertEqual(list(placement.first_osd), first_osd)
+
+        # Test the placement is deterministic and depends on the pool
+        self.assertTrue((placement.place(0, 1000) == result).all())
+        self.assertFalse((placement.place(1, 1000) == result).all())
+
+        # Test a pool size of its own, capped at the host count
+        self.assertEqual(placement.place(0, 10, 2).shape, (10, 2))
+        self.assertEqual(placement.place(0, 10, 6).shape, (10, 4))
+
+        # Test batching does not change the placement
+        test_mod.MAX_BATCH_DRAWS, saved = 10, test_mod.MAX_BATCH_DRAWS
+        try:
+            batched = placement.place(0, 1000)
+        finally:
+            test_mod.MAX_BATCH_DRAWS = saved
+        self.assertTrue((batched == result).all())
+
+    def test_place_fewer_hosts_than_size(self):
+        placement = test_mod.Placement([4, 4])
+        self.assertEqual(placement.size, 2)
+        result = placement.place(0, 100)
+        self.assertEqual(result.shape, (100, 2))
+        self.assertTrue(((result[:, 0] < 4) != (result[:, 1] < 4)).all())
+
+    def test_score(self):
+        hosts = ['h1', 'h2', 'h3', 'h4']
+        pools = [('vms', 128, .25, 3), ('images', 64, .15, 3),
+                 ('volumes', 256, .60, 2)]
+        report = test_mod.score(hosts, [4, 4, 4, 4], pools)
+        self.assertEqual(report['osd_count'], 16)
+        self.assertEqual(report['host_count'], 4)
+        self.assertEqual(report['pools'], {'vms': 128, 'images': 64,
+                                           'volumes': 256})
+        self.assertEqual(report['sizes'], {'vms': 3, 'images': 3,
+                                           'volumes': 2})
+        self.assertEqual(sum(report['osd_pgs']), (128 + 64) * 3 + 256 * 2)
+        self.assertEqual(report['pgs_per_osd']['mean'], 68.0)
+        self.assertEqual(report['pgs_per_osd']['max'],
+                         max(report['osd_pgs']))
+        fullest = report['fullest_osd']
+        self.assertEqual(fullest['host'], hosts[fullest['osd'] // 4])
+        self.assertGreaterEqual(fullest['data_vs_mean'], 1.0)
+
+    def test_simulate_inventory(self):
+        osd_tmpl = {'roles': ['ceph-osd'],
+                    'domain-settings': {'osd-devices': ['/dev/sdb',
+                                                        '/dev/sdc']}}
+        big_tmpl = {'roles': ['ceph-osd'],
+                    'domain-settings': {'osd-devices': ['/dev/sdb',
+                                                        '/dev/sdc',
+                                                        '/dev/sdd']}}
+        inventory = {'node-templates': {'osd1': osd_tmpl,
+                                        'osd2': big_tmpl},
+                     'nodes': {'osd1': [{'hostname': 'a',
+                                         'openstack-stg-addr': '1.1.1.1'},
+                                        {'hostname': 'b',
+                                         'openstack-stg-addr': '1.1.1.2'}],
+                               'osd2': [{'openstack-stg-addr': '1.1.1.3'}]}}
+        index = test_mod.generator.InventoryIndex(inventory)
+        hosts, osd_counts = test_mod.get_osd_layout(index)
+        self.assertEqual(sorted(zip(hosts, osd_counts)),
+                         [('1.1.1.3', 3), ('a', 2), ('b', 2)])
+
+        report = test_mod.simulate_inventory(inventory, 100, 25, 15, 60)
+        self.assertEqual(report['osd_count'], 7)
+        pg_total = sum(report['pools'].values())
+        self.assertEqual(sum(report['osd_pgs']), pg_total * 3)
+
+        # Test the pool sizes and the pools of the ceph-pools section
+        inventory['ceph-pools'] = {'volumes': {'size': 2},
+                                   'objects': {'percent-data': 20,
+                                               'erasure-code': {'k': 2,
+                                                                'm': 1}}}
+        report = test_mod.simulate_inventory(inventory, 100, 25, 15, 40)
+        self.assertEqual(report['sizes'], {'vms': 3, 'images': 3,
+                                           'volumes': 2, 'objects': 3})
+        pools = report['pools']
+        self.assertEqual(sum(report['osd_pgs']),
+                         (pools['vms'] + pools['images'] +
+                          pools['objects']) * 3 + pools['volumes'] * 2)
+
+        # Test an inventory without OSD nodes
+        inventory['nodes'] = {'osd1': [], 'osd2': []}
+        with mock.patch('sys.stdout'):
+            self.assertRaises(SystemExit, test_mod.simulate_inventory,
+                              inventory, 100, 25, 15, 60)
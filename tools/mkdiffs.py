@@ -15,13 +15,22 @@
 # limitations under the License.
 
 import argparse
+import calendar
+import difflib
 import git
+import hashlib
+import json
+import multiprocessing
 import os
+import re
 import sys
+import time
 import yaml
 
 
 CONF_FILE = 'mkdiffs.yml'
+# Content hashes of the inputs of every generated patch, in the diffs dir
+MANIFEST_FILE = '.manifest.json'
 EXEC_DIR, SCRIPT_NAME = os.path.split(sys.argv[0])
 
 
@@ -43,22 +52,133 @@ def rm_dir(directory):
         exit(1)
 
 
-def git_clone(url, branch, tgt_dir):
-    # Remove the target directory before cloning
+def _mirror_name(url):
+    # Must match the mirror names used by git-clone in process-args.sh,
+    # https://github.com/ceph/ceph-ansible is github.com-ceph-ceph-ansible.git
+    name = url.split('://', 1)[-1].rstrip('/')
+    if name.endswith('.git'):
+        name = name[:-len('.git')]
+    return re.sub('[/:@]', '-', name) + '.git'
+
+
+def git_mirror(url, mirror_dir):
+    """Create or update the bare mirror of url and return its path.
+
+    When the mirror cannot be updated, for example without network
+    access, the existing mirror is used as is.
+    """
+    mirror = os.path.join(mirror_dir, _mirror_name(url))
+    if os.path.isdir(mirror):
+        try:
+            git.Repo(mirror).git.fetch('--prune', 'origin')
+        except git.GitCommandError as ex:
+            print ('  Could not update the mirror %s, using it as is: %s' %
+                   (mirror, ex))
+    else:
+        git.Repo.clone_from(url, mirror, mirror=True)
+    return mirror
+
+
+def git_clone(url, branch, tgt_dir, mirror_dir):
+    mirror = git_mirror(url, mirror_dir)
+    # Remove the target directory before cloning.  The clone from the local
+    # mirror hard links the objects instead of downloading them.
     rm_dir(tgt_dir)
-    git.Repo.clone_from(url, tgt_dir, branch=branch)
+    repo = git.Repo.clone_from(mirror, tgt_dir, branch=branch)
+    repo.git.remote('set-url', 'origin', url)
+
+
+def _diff_timestamp(file_name):
+    # The timestamp format of the diff -u file headers, in local time:
+    # 2017-01-23 18:20:57.679994077 +0000
+    if file_name is None:
+        mtime, nanoseconds = 0, 0
+    else:
+        stat = os.stat(file_name)
+        mtime = int(stat.st_mtime)
+        nanoseconds = getattr(stat, 'st_mtime_ns',
+                              int(stat.st_mtime % 1 * 1e9)) % 1000000000
+    local = time.localtime(mtime)
+    offset = (calendar.timegm(local) - mtime) // 60
+    sign = '-' if offset < 0 else '+'
+    return '%s.%09d %s%02d%02d' % (time.strftime('%Y-%m-%d %H:%M:%S', local),
+                                   nanoseconds, sign, abs(offset) // 60,
+                                   abs(offset) % 60)
+
+
+def _read_lines(file_name):
+    if file_name is None:
+        return []
+    with open(file_name, 'r') as stream:
+        return stream.readlines()
+
+
+def make_patch(rel_path, orig_file, new_file):
+    """Return the patch of orig_file to new_file as made by diff -Naur.
+
+    The patch paths are rel_path/<new file name> under a/ and b/.  A
+    missing original file (None) is a new file.  Returns None when the
+    files do not differ.
+    """
+    path = os.path.join(rel_path, os.path.basename(new_file)).lstrip(os.sep)
+    orig_lines = _read_lines(orig_file)
+    new_lines = _read_lines(new_file)
+    if orig_lines == new_lines:
+        return None
+    patch = ['diff -Naur a/%s b/%s\n' % (path, path)]
+    for line in difflib.unified_diff(
+            orig_lines, new_lines,
+            fromfile='a/' + path, tofile='b/' + path,
+            fromfiledate=_diff_timestamp(orig_file),
+            tofiledate=_diff_timestamp(new_file)):
+        if not line.endswith('\n'):
+            line += '\n\\ No newline at end of file\n'
+        patch.append(line)
+    return ''.join(patch)
+
+
+def write_patch(job):
+    # Process pool worker, job is a (rel_path, orig_file, new_file,
+    # patch_file) tuple.  Returns the patch file, or None when the files
+    # do not differ.
+    rel_path, orig_file, new_file, patch_file = job
+    patch = make_patch(rel_path, orig_file, new_file)
+    if patch is None:
+        if os.path.isfile(patch_file):
+            os.remove(patch_file)
+        return None
+    with open(patch_file, 'w') as stream:
+        stream.write(patch)
+    return patch_file
+
+
+def _file_hash(file_name):
+    if file_name is None:
+        return None
+    with open(file_name, 'rb') as stream:
+        return hashlib.sha256(stream.read()).hexdigest()
 
 
 class CreateDiffs(object):
 
-    def __init__(self, conf):
+    def __init__(self, conf, jobs=1, force=False):
         super(CreateDiffs, self).__init__()
         self.conf = conf
+        self.jobs = jobs
+        self.force = force
+        self.projects = dict((project['src_location'], project)
+                             for project in self.conf['projects'])
+        self.files = dict((file['target'], file)
+                          for file in self.conf.get('files') or [])
         self.git_dir = os.path.normpath(
             os.path.join(EXEC_DIR, self.conf['gitsrc_loc']))
         self.diffs_dir = os.path.normpath(
             os.path.join(EXEC_DIR, self.conf['temp_diff_loc']))
         self.changes_loc = os.path.join(EXEC_DIR, self.conf['changes_loc'])
+        self.mirror_dir = os.path.join(
+            EXEC_DIR, os.path.expanduser(
+                os.environ.get('GIT_MIRROR_DIR',
+                               self.conf.get('gitmirror_loc', '.gitmirror'))))
 
     def confirm_clones(self):
         for project in self.conf['projects']:
@@ -72,33 +192,40 @@ class CreateDiffs(object):
         for project in self.conf['projects']:
             print ('  ' + project['git'])
             git_clone(project['git'], project['branch'],
-                      self.git_dir + '/' + project['src_location'])
+                      self.git_dir + '/' + project['src_location'],
+                      self.mirror_dir)
 
     def create_dir(self):
-        rm_dir(self.diffs_dir)
-        os.mkdir(self.diffs_dir, 0755)
+        # Previously generated patches are kept, see create_file_diffs
+        if not os.path.isdir(self.diffs_dir):
+            os.mkdir(self.diffs_dir, 0755)
 
     def find_project(self, chgs_loc, chg_path):
         # Remove the changes location and pull out the first directory
         project_name = chg_path.split(chgs_loc)[1].split(os.sep)[1]
-
-        # Now find the project in the conf
-        for project in self.conf['projects']:
-            if project['src_location'] == project_name:
-                return project
-
-        return None
+        return self.projects.get(project_name)
 
     def find_file(self, tgt_file):
-        # Now find the file in the conf
-        for file in self.conf['files']:
-            if file['target'] == tgt_file:
-                return file
+        return self.files.get(tgt_file)
 
-        return None
+    def _load_manifest(self):
+        try:
+            with open(os.path.join(self.diffs_dir, MANIFEST_FILE)) as stream:
+                return json.load(stream)
+        except (IOError, ValueError):
+            return {}
+
+    def _save_manifest(self, manifest):
+        with open(os.path.join(self.diffs_dir, MANIFEST_FILE), 'w') as stream:
+            json.dump(manifest, stream, indent=2, sort_keys=True)
 
     def create_file_diffs(self):
+        # Only the patches whose inputs changed since the last run are
+        # generated again.  Returns the number of patches generated.
         norm_chg_loc = os.path.normpath(self.changes_loc)
+        manifest = self._load_manifest()
+        inputs = {}
+        jobs = []
         for directory, sub_dir, file_names in (os.walk(self.changes_loc)):
             norm_dir = os.path.normpath(directory)
             for file_name in file_names:
@@ -144,22 +271,59 @@ class CreateDiffs(object):
                 # Ensure the original file exists.
                 if not os.path.isfile(orig_file_path):
                     print ('  Original file not found: ' + orig_file_path)
-                    orig_file_path = "None"
+                    orig_file_path = None
 
                 diff_file_name = diff_file_name.replace(os.sep, '-')
                 diff_output_file = (self.diffs_dir + os.sep +
                                     diff_file_name.lstrip('-') + '.patch')
 
-                call_str = ' '.join([os.path.join(EXEC_DIR, 'mkpatch.sh'),
-                                    diff_path, orig_file_path,
-                                    changed_file, diff_output_file])
-                os.system(call_str)
-
-
-def process_files(skip_git_cloning):
+                job = (diff_path, orig_file_path, changed_file,
+                       diff_output_file)
+                key = os.path.basename(diff_output_file)
+                inputs[key] = {'rel_path': diff_path,
+                               'orig': _file_hash(orig_file_path),
+                               'new': _file_hash(changed_file)}
+                entry = manifest.get(key)
+                if (not self.force and entry and
+                        entry['inputs'] == inputs[key] and
+                        (os.path.isfile(diff_output_file) or
+                         not entry['patch'])):
+                    print ('  Unchanged: ' + diff_output_file)
+                else:
+                    jobs.append(job)
+
+        # Remove the patches of the changed files which no longer exist
+        for key in set(manifest) - set(inputs):
+            patch_file = os.path.join(self.diffs_dir, key)
+            if os.path.isfile(patch_file):
+                print ('\nRemoving: ' + patch_file)
+                os.remove(patch_file)
+            del manifest[key]
+
+        if self.jobs > 1 and len(jobs) > 1:
+            pool = multiprocessing.Pool(min(self.jobs, len(jobs)))
+            try:
+                patch_files = pool.map(write_patch, jobs)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            patch_files = map(write_patch, jobs)
+
+        for job, patch_file in zip(jobs, patch_files):
+            if patch_file is None:
+                print ('No changes in: ' + job[2])
+            key = os.path.basename(job[3])
+            manifest[key] = {'inputs': inputs[key],
+                             'patch': patch_file is not None}
+        self._save_manifest(manifest)
+        return len(jobs)
+
+
+def process_files(skip_git_cloning, jobs, force):
     conf = _load_config()
 
-    crt_diffs = CreateDiffs(conf)
+    crt_diffs = CreateDiffs(conf, jobs, force)
     if not skip_git_cloning:
         crt_diffs.clone_all()
     else:
@@ -182,6 +346,12 @@ def parse_command():
                      "<git top-level directory>/.diffs/."))
     parser.add_argument('-s', '--skip-git-cloning', action='store_true',
                         help='Skip the git cloning.')
+    parser.add_argument('-f', '--force', action='store_true',
+                        help='Generate all patch files, even unchanged ones.')
+    parser.add_argument('-j', '--jobs', type=int,
+                        default=multiprocessing.cpu_count(),
+                        help=('The number of patch files generated in '
+                              'parallel. Default: the number of CPUs.'))
     parser.set_defaults(func=process_files)
     return parser
 
@@ -189,7 +359,7 @@ def parse_command():
 def main():
     parser = parse_command()
     args = parser.parse_args()
-    process_files(args.skip_git_cloning)
+    process_files(args.skip_git_cloning, args.jobs, args.force)
 
     print('Done.')
 